@@ -7,47 +7,104 @@ import shlex
 import json
 import signal
 import sys
-from collections import deque
 import datetime
+import tempfile
 from bee_health_db import BeeHealthDatabase
+from telemetry import TelemetryDecoder, read_records, stream_env, TELEMETRY_FD_ENV, TEXT_OUTPUT_ENV
+from shared_buffers import (
+    StatsRing,
+    ControlBlock,
+    FrameSlot,
+    STATS_SHM_ENV,
+    CONTROL_SHM_ENV,
+    PREVIEW_SHM_ENV,
+    VISUALIZATION_MODES,
+)
+from live_stream import (
+    PreviewStream,
+    EventBroadcaster,
+    make_encoder,
+    preview_available,
+    format_sse,
+    PREVIEW_MIME_TYPES,
+)
+from time_series import format_timestamp
+from detection_sources import DetectionSource, aggregate_stats
+from process_supervisor import DetectorSupervisor
+from detection_log import DETECTION_LOG_DB_ENV, DETECTION_LOG_SESSION_ENV
 
 app = Flask(__name__)
 
 # Configuration
-DETECTION_COMMAND = "python /home/ergi/hailo-rpi5-examples/detection.py -i /dev/video0   --hef /home/ergi/hailo-rpi5-examples/first_15k.hef --labels-json /home/ergi/hailo-rpi5-examples/labels.json"
+DETECTION_COMMAND = "python /home/ergi/hailo-rpi5-examples/detection.py -i /dev/video0   --hef /home/ergi/hailo-rpi5-examples/first_15k.hef --labels-json /home/ergi/hailo-rpi5-examples/labels.json --use-frame"
 DEBUG = True  # Enable debugging for troubleshooting
-MAX_DATA_POINTS = 100  # For time-series data
+DETECTION_TEXT_OUTPUT = False  # Let detection.py print per-frame text to the console (debug only)
+MAX_DATA_POINTS = 100  # Time series points sent to a client without a cursor
+TIME_SERIES_CAPACITY = 10000  # Time series points kept in memory
+EMAIL_DIGEST_INTERVAL = 0  # Seconds to group closed sessions into one summary email (0 = one email per session)
+MAX_HISTORY_POINTS = 500  # Upper bound on points returned by /api/metrics for a time range
+DETECTION_LOG = False  # Store every detection (track id, class, confidence, box) in detection_blocks
+METRICS_SAVE_INTERVAL = 10  # Frames between stored metric snapshots
+STATS_POLL_INTERVAL = 0.05  # Seconds between reads of the shared-memory stats ring
+
+# Live preview stream (/video_feed)
+PREVIEW_WIDTH = 640
+PREVIEW_HEIGHT = 360
+PREVIEW_FPS = 5
+PREVIEW_FORMAT = "jpeg"  # "jpeg" or "webp"
+PREVIEW_QUALITY = 70
+
+# Server-Sent Events (/stream)
+STREAM_STATS_INTERVAL = 0.25  # Minimum seconds between pushed stats updates
+
+# Detectors to run, one process per camera: source id -> detection command.
+# The first source backs the single-camera routes (/get_stats, /stream, /video_feed, ...)
+DETECTION_SOURCES = {
+    "video0": DETECTION_COMMAND,
+}
+# Working directory of the detection processes
+DETECTOR_WORKDIR = "/home/ergi/hailo-rpi5-examples"
+# Pidfiles of running detectors; one left after a crash triggers a cleanup scan
+DETECTOR_PID_DIR = os.path.join(tempfile.gettempdir(), "bee_monitor")
+# Run all sources through one detector process (detection.py --extra-input) sharing a
+# single Hailo inference stage, instead of one process and model load per camera
+MULTIPLEX_SOURCES = False
 
 # Initialize database connection
 db = BeeHealthDatabase(os.path.join(os.path.dirname(__file__), "bee_health.db"))
+db.email_worker.digest_interval = EMAIL_DIGEST_INTERVAL
+
+# Starts detectors in their own process group and stops them without fixed sleeps
+supervisor = DetectorSupervisor(DETECTOR_PID_DIR)
 
-# Global variables
-detection_active = False
-detection_thread = None
-detection_process = None
-
-# Time series data for charting
-time_series_data = {
-    "timestamps": deque(maxlen=MAX_DATA_POINTS),
-    "bee_counts": deque(maxlen=MAX_DATA_POINTS),
-    "varroa_counts": deque(maxlen=MAX_DATA_POINTS),
-    "infestation_ratio": deque(maxlen=MAX_DATA_POINTS),
+# Annotated frame rendering: "headless", "preview" (every Nth frame) or "full"
+visualization_settings = {
+    "mode": "headless",
+    "preview_interval": 10,
 }
 
-# Current statistics
-detection_stats = {
-    "total_frames": 0,
-    "total_bees": 0,
-    "total_varroa": 0,
-    "unique_bees": 0,
-    "unique_varroa": 0,
-    "current_bees": 0,
-    "current_varroa": 0,
-    "fps": 0,
-    "infestation_ratio": 0,
-    "infestation_risk_level": "Unknown",
-    "last_update": time.time()
+def new_preview_stream():
+    """Preview encoder for one source's /video_feed"""
+    return PreviewStream(
+        fps=PREVIEW_FPS,
+        encoder=make_encoder(PREVIEW_FORMAT, PREVIEW_QUALITY) if preview_available() else None
+    )
+
+# Every source has its own statistics, time series, event stream and detector
+detection_sources = {
+    source_id: DetectionSource(source_id, command, TIME_SERIES_CAPACITY, new_preview_stream())
+    for source_id, command in DETECTION_SOURCES.items()
 }
+default_source = next(iter(detection_sources.values()))
+
+# The first source's state under the names used by the single-camera routes
+detection_stats = default_source.stats
+time_series_data = default_source.time_series
+event_broadcaster = default_source.events
+preview_stream = default_source.preview_stream
+
+# Internal bookkeeping fields that are never sent to clients over /stream
+STREAM_EXCLUDED_FIELDS = ("last_update", "last_frame")
 
 # Risk level thresholds (varroa:bee ratio)
 RISK_THRESHOLDS = {
@@ -57,209 +114,120 @@ RISK_THRESHOLDS = {
     "critical": 0.20   # >15% - immediate action required
 }
 
-def update_time_series():
+def update_time_series(source=None):
     """Update time series data for charts and save to database"""
-    global time_series_data, detection_stats
+    source = source or default_source
+    stats = source.stats
     
-    current_time = datetime.datetime.now().strftime("%H:%M:%S")
-    time_series_data["timestamps"].append(current_time)
-    time_series_data["bee_counts"].append(detection_stats["current_bees"])
-    time_series_data["varroa_counts"].append(detection_stats["current_varroa"])
+    now = time.time()
     
-    # Calculate infestation ratio based on unique objects (avoid division by zero)
-    if detection_stats["unique_bees"] > 0:
-        ratio = detection_stats["unique_varroa"] / detection_stats["unique_bees"]
-    else:
-        ratio = 0
+    # Calculate infestation ratio based on unique objects
+    ratio = infestation_ratio(stats["unique_varroa"], stats["unique_bees"])
+    
+    # Store the point in time series and the ratio in detection stats
+    seq = source.time_series.append(now, stats["current_bees"], stats["current_varroa"], ratio)
+    stats["infestation_ratio"] = ratio
     
-    # Store ratio in time series and detection stats
-    time_series_data["infestation_ratio"].append(ratio)
-    detection_stats["infestation_ratio"] = ratio
+    # Push only the new point to connected dashboards
+    source.events.publish("time_series", {
+        "seq": seq,
+        "timestamp": format_timestamp(now),
+        "bee_count": stats["current_bees"],
+        "varroa_count": stats["current_varroa"],
+        "infestation_ratio": ratio,
+    })
     
     # Update Colony Health Status based on unique object ratio
     if ratio < RISK_THRESHOLDS["low"]:
-        detection_stats["infestation_risk_level"] = "Low"
+        stats["infestation_risk_level"] = "Low"
     elif ratio < RISK_THRESHOLDS["moderate"]:
-        detection_stats["infestation_risk_level"] = "Moderate"
+        stats["infestation_risk_level"] = "Moderate"
     elif ratio < RISK_THRESHOLDS["high"]:
-        detection_stats["infestation_risk_level"] = "High"
+        stats["infestation_risk_level"] = "High"
     else:
-        detection_stats["infestation_risk_level"] = "Critical"
-    
-    # Save metrics to database (every 100 frames to avoid excessive database writes)
-    if detection_stats["total_frames"] % 100 == 0:
-        db.save_metrics(
-            unique_bee_count=detection_stats["unique_bees"],
-            unique_varroa_count=detection_stats["unique_varroa"],
-            frame_count=detection_stats["total_frames"],
-            fps=detection_stats["fps"]
+        stats["infestation_risk_level"] = "Critical"
+    
+    # Queue metrics for the database; the background writer batches them into transactions
+    if stats["total_frames"] % METRICS_SAVE_INTERVAL == 0 and source.session_id is not None:
+        db.queue_metrics(
+            unique_bee_count=stats["unique_bees"],
+            unique_varroa_count=stats["unique_varroa"],
+            frame_count=stats["total_frames"],
+            fps=stats["fps"],
+            session_id=source.session_id
         )
 
-def parse_detection_output(line):
-    """Parse detection output lines for bee and varroa counts"""
-    global detection_stats
+def public_stats(source=None):
+    """Detection statistics as sent to clients"""
+    source = source or default_source
+    return {key: value for key, value in source.stats.items() if key not in STREAM_EXCLUDED_FIELDS}
+
+def publish_stats_delta(force=False, source=None):
+    """Push the stats fields that changed since the last push to /stream clients"""
+    source = source or default_source
     
-    if DEBUG:
-        print(f"Parsing line: {line}")
+    now = time.time()
+    if not force and now - source.last_stats_publish_time < STREAM_STATS_INTERVAL:
+        return
     
-    # Parse unique bee and varroa counts for Cumulative Statistics, 
-    # Infestation Ratio, and Colony Health Status
-    if "Unique bees:" in line:
-        try:
-            unique_bee_count = int(line.split("Unique bees:")[1].strip())
-            detection_stats["unique_bees"] = unique_bee_count
-            
-            # Use unique bees for Total Bees in Cumulative Statistics
-            detection_stats["total_bees"] = unique_bee_count
-            
-        except (ValueError, IndexError) as e:
-            if DEBUG:
-                print(f"Error parsing unique bee count: {e}")
+    stats = public_stats(source)
+    delta = {key: value for key, value in stats.items() if source.last_published_stats.get(key) != value}
+    if delta:
+        source.events.publish("stats", delta)
+        source.last_published_stats = stats
+        source.last_stats_publish_time = now
+
+def infestation_ratio(varroa_count, bee_count):
+    """Varroa:bee ratio, avoiding division by zero"""
+    return varroa_count / bee_count if bee_count > 0 else 0
+
+def frame_record_counts(record):
+    """Map the counters of a telemetry frame record onto detection_stats fields"""
+    return {
+        # Unique bee and varroa counts drive Cumulative Statistics,
+        # Infestation Ratio, and Colony Health Status
+        "unique_bees": record.unique_bees,
+        "unique_varroa": record.unique_varroa,
+        # Use unique objects for Total Bees/Varroa in Cumulative Statistics
+        "total_bees": record.unique_bees,
+        "total_varroa": record.unique_varroa,
+        # Current frame counts for Real-time Detection Trends and Key Detection Metrics
+        "current_bees": record.current_bees,
+        "current_varroa": record.current_varroa,
+        "total_frames": record.frame,
+        # Rolling windows based on when unique objects were first seen
+        "bees_last_minute": record.bees_last_minute,
+        "varroa_last_minute": record.varroa_last_minute,
+        "bees_last_hour": record.bees_last_hour,
+        "varroa_last_hour": record.varroa_last_hour,
+        "infestation_ratio_last_minute": infestation_ratio(record.varroa_last_minute, record.bees_last_minute),
+        "infestation_ratio_last_hour": infestation_ratio(record.varroa_last_hour, record.bees_last_hour),
+        # Per-bee infestation from varroa boxes associated with bee tracks
+        "infested_bees": record.infested_bees,
+        "infested_bee_ratio": infestation_ratio(record.infested_bees, record.unique_bees),
+    }
+
+def apply_frame_record(record, source=None):
+    """Update detection statistics from a decoded telemetry frame record"""
+    source = source or default_source
+    stats = source.stats
     
-    if "Unique varroa:" in line:
-        try:
-            unique_varroa_count = int(line.split("Unique varroa:")[1].strip())
-            detection_stats["unique_varroa"] = unique_varroa_count
-            
-            # Use unique varroa for Total Varroa in Cumulative Statistics
-            detection_stats["total_varroa"] = unique_varroa_count
-            
-        except (ValueError, IndexError) as e:
-            if DEBUG:
-                print(f"Error parsing unique varroa count: {e}")
+    stats.update(frame_record_counts(record))
+    frame_count = record.frame
     
-    # Parse current frame bee and varroa counts for Real-time Detection Trends
-    # and Key Detection Metrics
-    if "Current frame bees:" in line:
-        try:
-            current_bee_count = int(line.split("Current frame bees:")[1].strip())
-            detection_stats["current_bees"] = current_bee_count
-        except (ValueError, IndexError) as e:
-            if DEBUG:
-                print(f"Error parsing current frame bee count: {e}")
+    # Calculate FPS
+    current_time = time.time()
+    time_diff = current_time - stats["last_update"]
+    if time_diff > 0:
+        frame_diff = frame_count - stats.get("last_frame", 0)
+        if frame_diff > 0 and time_diff > 0.5:  # Update FPS every half second
+            stats["fps"] = frame_diff / time_diff
+            stats["last_frame"] = frame_count
+            stats["last_update"] = current_time
     
-    if "Current frame varroa:" in line:
-        try:
-            current_varroa_count = int(line.split("Current frame varroa:")[1].strip())
-            detection_stats["current_varroa"] = current_varroa_count
-        except (ValueError, IndexError) as e:
-            if DEBUG:
-                print(f"Error parsing current frame varroa count: {e}")
-    
-    # Use individual detections to update current bee/varroa counts
-    if "Label: bee" in line:
-        # Optional: Process individual bee detections if needed
-        pass
-    
-    if "Label: varroa" in line:
-        # Optional: Process individual varroa detections if needed
-        pass
-    
-    # Frame count
-    if "Frame count:" in line:
-        try:
-            frame_count = int(line.split("Frame count:")[1].strip())
-            detection_stats["total_frames"] = frame_count
-            
-            # Calculate FPS
-            current_time = time.time()
-            time_diff = current_time - detection_stats["last_update"]
-            if time_diff > 0:
-                frame_diff = frame_count - detection_stats.get("last_frame", 0)
-                if frame_diff > 0 and time_diff > 0.5:  # Update FPS every half second
-                    detection_stats["fps"] = frame_diff / time_diff
-                    detection_stats["last_frame"] = frame_count
-                    detection_stats["last_update"] = current_time
-            
-            # Update time series data every 10 frames
-            if frame_count % 10 == 0:
-                update_time_series()
-                
-        except (ValueError, IndexError) as e:
-            if DEBUG:
-                print(f"Error parsing frame count: {e}")
-
-def find_and_kill_processes_by_name(process_name):
-    """Find and kill all processes matching the given name"""
-    try:
-        # Get the list of all running processes
-        output = subprocess.check_output(["ps", "-ef"]).decode()
-        
-        # Find PIDs of processes matching the name
-        pids = []
-        for line in output.split('\n'):
-            if process_name in line and 'grep' not in line:
-                # Extract PID (second column in ps output)
-                parts = line.split()
-                if len(parts) > 1:
-                    try:
-                        pid = int(parts[1])
-                        pids.append(pid)
-                    except ValueError:
-                        pass
-        
-        # Kill each process
-        for pid in pids:
-            try:
-                print(f"Killing process with PID {pid}")
-                os.kill(pid, signal.SIGTERM)
-                # Wait a bit to see if it terminates
-                time.sleep(0.5)
-                # Check if the process is still running
-                try:
-                    os.kill(pid, 0)  # Signal 0 is used to check if a process exists
-                    # Process still exists, try SIGKILL
-                    print(f"Process {pid} didn't terminate with SIGTERM, using SIGKILL")
-                    os.kill(pid, signal.SIGKILL)
-                except OSError:
-                    # Process no longer exists
-                    pass
-            except OSError as e:
-                print(f"Error killing process {pid}: {e}")
-                
-        return len(pids)
-    except Exception as e:
-        print(f"Error finding and killing processes: {e}")
-        return 0
-
-def find_and_kill_processes_by_partial_command(partial_command):
-    """Find and kill processes by partial command string"""
-    try:
-        # Get the list of all running processes with full command
-        output = subprocess.check_output(["ps", "-eo", "pid,cmd"]).decode()
-        
-        # Find PIDs of processes matching the partial command
-        pids = []
-        for line in output.split('\n'):
-            if partial_command in line and 'grep' not in line:
-                # Extract PID (first column in ps output)
-                parts = line.strip().split()
-                if parts:
-                    try:
-                        pid = int(parts[0])
-                        pids.append(pid)
-                    except ValueError:
-                        pass
-        
-        # Kill each process
-        for pid in pids:
-            try:
-                print(f"Killing process with PID {pid} (matches '{partial_command}')")
-                os.kill(pid, signal.SIGTERM)
-                time.sleep(0.5)
-                try:
-                    os.kill(pid, 0)
-                    os.kill(pid, signal.SIGKILL)
-                except OSError:
-                    pass
-            except OSError as e:
-                if e.errno != 3:  # Ignore "no such process" errors
-                    print(f"Error killing process {pid}: {e}")
-                
-        return len(pids)
-    except Exception as e:
-        print(f"Error finding and killing processes: {e}")
-        return 0
+    # Update time series data every 10 frames
+    if frame_count % 10 == 0:
+        update_time_series(source)
 
 def clean_gstreamer_resources():
     """Clean up orphaned GStreamer resources"""
@@ -273,161 +241,330 @@ def clean_gstreamer_resources():
     except Exception as e:
         print(f"Error cleaning GStreamer resources: {e}")
 
-def terminate_detection():
-    """Terminate the detection process and ensure all related processes are stopped"""
-    global detection_process
+def terminate_source_process(source):
+    """Terminate one source's detection process and everything it started"""
+    process = source.process
+    if not process:
+        return
     
+    try:
+        print(f"Terminating {source.source_id} detection process (PID: {process.pid})")
+        
+        # SIGINT first to allow graceful GStreamer pipeline shutdown, escalating
+        # to SIGTERM and SIGKILL only if the process group does not exit in time
+        stopped_by = supervisor.stop(process)
+        if stopped_by == signal.SIGKILL:
+            print(f"Process {process.pid} ignored SIGINT and SIGTERM, killed it")
+            # A killed pipeline cannot release its IPC resources itself
+            if not other_sources_active(source):
+                clean_gstreamer_resources()
+    except Exception as e:
+        print(f"Error terminating process: {e}")
+        
+    source.process = None
+
+def other_sources_active(source):
+    """Whether any detector other than `source`'s is running"""
+    return any(other.active for other in detection_sources.values() if other is not source)
+
+def terminate_detection(source=None):
+    """Terminate one source's detection process, or every source's when none is given"""
     print("Terminating detection processes...")
+    for each in [source] if source is not None else detection_sources.values():
+        terminate_source_process(each)
+
+def recover_stale_detectors():
+    """
+    Kill detectors and GStreamer processes left behind by a run that was not
+    stopped cleanly. Only a stale pidfile triggers the scan for them.
+    """
+    killed = supervisor.recover()
+    if killed is not None:
+        print(f"Found stale detector pidfiles, killed {killed} leftover processes")
+        clean_gstreamer_resources()
+
+def detector_environment():
+    """Environment of a detection process"""
+    env = os.environ.copy()
+    env["DISPLAY"] = ":0"  # Use the main display
+    if DETECTION_TEXT_OUTPUT:
+        env[TEXT_OUTPUT_ENV] = "1"
+    return env
+
+def open_source_channels(source, env, stream_index=None):
+    """
+    Start the database session of a source and create the shared memory its
+    detector writes into, naming everything in the detector's environment
+    (suffixed with the stream index for a multiplexed detector). Returns the
+    telemetry pipe (read_fd, write_fd) when falling back to it, else (None, None).
+    """
+    # Start a new database session for this camera
+    source.session_id = db.start_new_session(source=source.input, notes="Automatic detection")
     
-    # First attempt to terminate our subprocess if it exists
-    if detection_process:
-        try:
-            pid = detection_process.pid
-            print(f"Terminating main detection process (PID: {pid})")
-            
-            # Send SIGINT to allow graceful GStreamer pipeline shutdown
-            # This is important! SIGINT allows GStreamer to clean up properly
-            try:
-                os.kill(pid, signal.SIGINT)
-            
-                # Give more time for GStreamer pipeline to clean up
-                time.sleep(2)
-                
-                # Check if process is still running
-                try:
-                    os.kill(pid, 0)  # Signal 0 is used to check if a process exists
-                    print(f"Process {pid} still exists, using SIGTERM")
-                    os.kill(pid, signal.SIGTERM)
-                    time.sleep(1)
-                    
-                    # Check again and use SIGKILL as last resort
-                    try:
-                        os.kill(pid, 0)
-                        print(f"Process {pid} still exists, using SIGKILL")
-                        os.kill(pid, signal.SIGKILL)
-                    except OSError:
-                        pass
-                except OSError:
-                    # Process no longer exists
-                    pass
-            except OSError:
-                # Process may already be gone
-                pass
-                
-        except Exception as e:
-            print(f"Error terminating process: {e}")
-            
-        detection_process = None
+    # Let the detector log raw detections into this session
+    if DETECTION_LOG:
+        env[DETECTION_LOG_DB_ENV] = db.db_path
+        env[stream_env(DETECTION_LOG_SESSION_ENV, stream_index)] = str(source.session_id)
+    
+    # The detector publishes frame records into a shared-memory ring;
+    # fall back to the telemetry pipe if shared memory is unavailable
+    read_fd = write_fd = None
+    try:
+        source.stats_ring = StatsRing.create()
+        env[stream_env(STATS_SHM_ENV, stream_index)] = source.stats_ring.name
+    except OSError as e:
+        print(f"Could not create stats ring, using telemetry pipe: {e}")
+        read_fd, write_fd = os.pipe()
+        env[stream_env(TELEMETRY_FD_ENV, stream_index)] = str(write_fd)
     
-    # Kill all related processes
-    process_names = ["detection.py", "GStreamerDetectionApp", "Hailo Detection App"]
-    for name in process_names:
-        find_and_kill_processes_by_name(name)
+    # Runtime settings the dashboard can change while the detector runs
+    try:
+        source.control = ControlBlock.create(
+            VISUALIZATION_MODES[visualization_settings["mode"]],
+            visualization_settings["preview_interval"]
+        )
+        env[stream_env(CONTROL_SHM_ENV, stream_index)] = source.control.name
+    except OSError as e:
+        print(f"Could not create detector control block: {e}")
     
-    # Kill any GStreamer processes that might be related
-    killed_count = find_and_kill_processes_by_name("gst-launch")
-    if killed_count > 0:
-        print(f"Killed {killed_count} GStreamer processes")
-        
-    # Also kill any orphaned GStreamer elements by partial command
-    for gst_element in ["hailonet", "hailotracker", "hailofilter", "hailooverlay", "autovideosink"]:
-        find_and_kill_processes_by_partial_command(gst_element)
-        
-    # Give some time for processes to clean up
-    time.sleep(0.1)
+    # Annotated frames for the /video_feed preview, encoded once in this process
+    if preview_available():
+        try:
+            source.preview_slot = FrameSlot.create(PREVIEW_WIDTH, PREVIEW_HEIGHT)
+            env[stream_env(PREVIEW_SHM_ENV, stream_index)] = source.preview_slot.name
+            source.preview_stream.start(source.preview_slot)
+        except OSError as e:
+            print(f"Could not create preview frame slot: {e}")
+    
+    return read_fd, write_fd
 
-def detection_loop():
-    """Thread function for the detection process"""
-    global detection_active, detection_stats, detection_process
+def launch_detector(command, env, write_fds):
+    """Launch a detection command as a subprocess that inherits the telemetry pipes"""
+    if DEBUG:
+        print(f"Starting detection process with command: {command}")
     
+    # The detector gets its own process group, so stopping it reaches all of its children
     try:
-        # Reset statistics
-        detection_stats["total_frames"] = 0
-        detection_stats["total_bees"] = 0
-        detection_stats["total_varroa"] = 0
-        detection_stats["unique_bees"] = 0
-        detection_stats["unique_varroa"] = 0
-        detection_stats["current_bees"] = 0
-        detection_stats["current_varroa"] = 0
-        detection_stats["fps"] = 0
-        detection_stats["infestation_ratio"] = 0
-        detection_stats["infestation_risk_level"] = "Unknown"
-        detection_stats["last_update"] = time.time()
-        detection_stats["last_frame"] = 0
-        
-        # Start a new database session
-        source_file = DETECTION_COMMAND.split(" ")[3]  # Extract video file name
-        db.start_new_session(source=source_file, notes="Automatic detection")
-        
-        # Clear time series data
-        time_series_data["timestamps"].clear()
-        time_series_data["bee_counts"].clear()
-        time_series_data["varroa_counts"].clear()
-        time_series_data["infestation_ratio"].clear()
-        
-        # Set environment variables for display
-        env = os.environ.copy()
-        env["DISPLAY"] = ":0"  # Use the main display
-        
-        # Ensure any leftover detection processes are terminated
-        terminate_detection()
-        clean_gstreamer_resources()
-        
-        # Small delay to ensure cleanup is complete
-        time.sleep(0.1)
-        
-        # Launch the detection command as a subprocess
-        if DEBUG:
-            print(f"Starting detection process with command: {DETECTION_COMMAND}")
-        
-        # Use shell=True for more reliable execution
-        detection_process = subprocess.Popen(
-            DETECTION_COMMAND,
-            shell=True,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True,
-            bufsize=1,  # Line buffered
-            universal_newlines=True,
+        process = supervisor.launch(
+            command,
+            # Text output goes straight to the console, it is never parsed
+            stdout=None if DETECTION_TEXT_OUTPUT else subprocess.DEVNULL,
             env=env,  # Pass the environment with DISPLAY set
-            cwd="/home/ergi/hailo-rpi5-examples"  # Set working directory
+            cwd=DETECTOR_WORKDIR,
+            pass_fds=tuple(write_fds)
         )
-        
-        print(f"Started detection process with PID: {detection_process.pid}")
-        
-        # Process stdout in real-time
-        while detection_active and detection_process and detection_process.poll() is None:
-            # Read a line from stdout with timeout
-            line = detection_process.stdout.readline()
-            if not line:
-                # No more output but process is still running
+    finally:
+        # Only the detector keeps the write ends open
+        for write_fd in write_fds:
+            os.close(write_fd)
+    
+    print(f"Started detection process with PID: {process.pid}")
+    return process
+
+def consume_frame_records(source, read_fd):
+    """Apply a source's frame records in real-time until it is stopped or its detector exits"""
+    decoder = TelemetryDecoder()
+    channel_open = True
+    cursor = 0
+    while source.active and source.process and source.process.poll() is None:
+        if source.stats_ring is not None:
+            records, cursor, missed = source.stats_ring.read_since(cursor)
+            if missed and DEBUG:
+                print(f"Stats ring of {source.source_id} overrun, skipped {missed} frame records")
+            if not records:
+                time.sleep(STATS_POLL_INTERVAL)
+                continue
+        else:
+            if not channel_open:
+                # Detector closed the channel but is still shutting down
                 time.sleep(0.1)
                 continue
-                
-            line = line.strip()
-            if line:
-                print(f"Detection output: {line}")
-                parse_detection_output(line)
-                
-    except Exception as e:
-        print(f"Error in detection loop: {e}")
-    finally:
-        # End the database session
-        db.end_session()
+            
+            records = read_records(read_fd, decoder, timeout=0.1)
+            if records is None:
+                channel_open = False
+                continue
         
-        # Make sure to terminate the detection process and any child processes
-        terminate_detection()
-        clean_gstreamer_resources()
+        for record in records:
+            apply_frame_record(record, source)
+        publish_stats_delta(source=source)
+
+def close_source_channels(source, read_fd):
+    """End the session of a source, stop its detector and release its shared memory"""
+    # End the database session
+    session_id, source.session_id = source.session_id, None
+    if session_id is not None:
+        db.end_session(session_id)
+    
+    # Make sure to terminate the detection process and any child processes
+    terminate_detection(source)
+    
+    if read_fd is not None:
+        os.close(read_fd)
+    if source.stats_ring is not None:
+        ring, source.stats_ring = source.stats_ring, None
+        ring.close()
+    if source.control is not None:
+        control, source.control = source.control, None
+        control.close()
+    if source.preview_slot is not None:
+        source.preview_stream.stop()
+        slot, source.preview_slot = source.preview_slot, None
+        slot.close()
+    
+    source.active = False
+
+def detection_loop(source):
+    """Thread function running one source's detection process"""
+    read_fd = None
+    try:
+        env = detector_environment()
         
-        detection_active = False
-        print("Detection thread exiting")
+        # Ensure a leftover detection process of this source is terminated
+        terminate_source_process(source)
+        
+        read_fd, write_fd = open_source_channels(source, env)
+        source.process = launch_detector(source.command, env, [write_fd] if write_fd is not None else [])
+        consume_frame_records(source, read_fd)
+    except Exception as e:
+        print(f"Error in {source.source_id} detection loop: {e}")
+    finally:
+        close_source_channels(source, read_fd)
+        print(f"Detection thread of {source.source_id} exiting")
+
+def multiplexed_command(sources):
+    """Detection command running every source through one pipeline; the first source's command is extended"""
+    return sources[0].command + "".join(f" --extra-input {shlex.quote(source.input)}" for source in sources[1:])
+
+def multiplexed_detection_loop(sources):
+    """Thread function running all sources in one multiplexed detection process"""
+    read_fds = [None] * len(sources)
+    try:
+        env = detector_environment()
+        write_fds = []
+        for index, source in enumerate(sources):
+            read_fds[index], write_fd = open_source_channels(source, env, stream_index=index)
+            if write_fd is not None:
+                write_fds.append(write_fd)
+        
+        process = launch_detector(multiplexed_command(sources), env, write_fds)
+        for source in sources:
+            source.process = process
+        
+        # Every source is still read on its own thread
+        readers = [
+            threading.Thread(target=consume_frame_records, args=(source, read_fd),
+                             name=f"detection-{source.source_id}", daemon=True)
+            for source, read_fd in zip(sources[1:], read_fds[1:])
+        ]
+        for reader in readers:
+            reader.start()
+        consume_frame_records(sources[0], read_fds[0])
+        for reader in readers:
+            reader.join()
+    except Exception as e:
+        print(f"Error in multiplexed detection loop: {e}")
+    finally:
+        # The detector is shared, so it goes away with the first source
+        for source in sources:
+            source.active = False
+        terminate_source_process(sources[0])
+        for source in sources:
+            source.process = None
+        for source, read_fd in zip(sources, read_fds):
+            close_source_channels(source, read_fd)
+        print("Multiplexed detection thread exiting")
+
+def clean_up_before_start():
+    """Make sure nothing from an earlier, crashed run is left before the first detector starts"""
+    if any(source.active for source in detection_sources.values()):
+        # The pidfiles of running detectors are not stale
+        return
+    recover_stale_detectors()
+
+def reset_source(source):
+    """Reset statistics and tell dashboards to drop their charts"""
+    source.reset_stats()
+    source.last_published_stats = {}
+    source.time_series.clear()
+    source.events.publish("time_series_reset", {"seq": source.time_series.last_seq})
+
+def start_source(source):
+    """Start the detector of one source; returns False if it is already running"""
+    if source.active:
+        return False
+    
+    clean_up_before_start()
+    reset_source(source)
+    
+    # Every source is read on its own thread, so a slow detector only delays itself
+    source.active = True
+    source.thread = threading.Thread(target=detection_loop, args=(source,), name=f"detection-{source.source_id}")
+    source.thread.daemon = True
+    source.thread.start()
+    return True
+
+def start_multiplexed(sources):
+    """Start one detector for all sources; returns False if any of them is already running"""
+    if any(source.active for source in sources):
+        return False
+    
+    clean_up_before_start()
+    for source in sources:
+        reset_source(source)
+        source.active = True
+    
+    thread = threading.Thread(target=multiplexed_detection_loop, args=(sources,), name="detection-multiplexed")
+    thread.daemon = True
+    for source in sources:
+        source.thread = thread
+    thread.start()
+    return True
+
+def multiplexed():
+    """Whether the sources share one multiplexed detector"""
+    return MULTIPLEX_SOURCES and len(detection_sources) > 1
+
+def stop_source(source):
+    """Stop the detector of one source; returns False if it was not running"""
+    if not source.active:
+        return False
+    
+    print(f"Stopping {source.source_id} detection...")
+    
+    # Set flag to stop the thread
+    source.active = False
+    
+    # Terminate the detection process
+    terminate_detection(source)
+    
+    # The thread exits as soon as it notices the detector is gone
+    if source.thread:
+        source.thread.join(timeout=5.0)
+    
+    print(f"{source.source_id} detection stopped")
+    return True
+
+def get_source(source_id):
+    """Source by id, or the default source when no id is given; None if unknown"""
+    if source_id is None:
+        return default_source
+    return detection_sources.get(source_id)
+
+def unknown_source(source_id):
+    return jsonify({"status": "error", "message": f"Unknown source: {source_id}"}), 404
 
 def signal_handler(sig, frame):
     """Handle termination signals"""
     print(f"Received signal {sig}, cleaning up and exiting...")
-    db.end_session()  # Make sure to end any active database session
+    # Make sure to end every active database session
+    for source in detection_sources.values():
+        source.active = False
+        session_id, source.session_id = source.session_id, None
+        if session_id is not None:
+            db.end_session(session_id)
     terminate_detection()
-    clean_gstreamer_resources()
+    db.close()  # Checkpoints the write-ahead log into the database file
     sys.exit(0)
 
 @app.route('/')
@@ -437,73 +574,205 @@ def index():
 
 @app.route('/start_detection', methods=['POST'])
 def start_detection():
-    """Start the detection process"""
-    global detection_active, detection_thread
+    """Start the detection process of every source"""
+    if all(source.active for source in detection_sources.values()):
+        return jsonify({"status": "already_running"})
     
-    if not detection_active:
-        # First, make sure any existing processes are terminated
-        terminate_detection()
-        clean_gstreamer_resources()
-        
-        # Small delay to ensure cleanup is complete
-        time.sleep(0.1)
-        
-        # Now start a new detection process
-        detection_active = True
-        detection_thread = threading.Thread(target=detection_loop)
-        detection_thread.daemon = True
-        detection_thread.start()
-        
-        # Give it a moment to start up
-        time.sleep(1)
-        
-        return jsonify({"status": "started"})
+    if multiplexed():
+        start_multiplexed(list(detection_sources.values()))
+    else:
+        # Start a new detection process per camera
+        for source in detection_sources.values():
+            start_source(source)
     
-    return jsonify({"status": "already_running"})
+    return jsonify({"status": "started"})
 
 @app.route('/stop_detection', methods=['POST'])
 def stop_detection():
-    """Stop the detection process"""
-    global detection_active
-    
-    if detection_active:
-        print("Stopping detection...")
-        
-        # Set flag to stop the thread
-        detection_active = False
-        
-        # Terminate all detection processes
-        terminate_detection()
-        
-        # Clean up GStreamer resources
-        clean_gstreamer_resources()
-        
-        # Wait for thread to finish - give it more time
-        if detection_thread:
-            detection_thread.join(timeout=5.0)
-            
+    """Stop the detection process of every source"""
+    stopped = [stop_source(source) for source in detection_sources.values()]
+    if any(stopped):
         print("Detection stopped")
         return jsonify({"status": "stopped"})
     
     return jsonify({"status": "already_stopped"})
 
+def current_stats(source):
+    """Detection statistics of a source, with the newest counters from its ring"""
+    stats = source.stats
+    
+    # Overlay the newest counters straight from the detector's ring (O(1) read)
+    ring = source.stats_ring
+    if ring is not None:
+        try:
+            record = ring.latest()
+        except (ValueError, TypeError):
+            # Ring was released by the detection thread while reading
+            record = None
+        if record is not None and record.frame > stats["total_frames"]:
+            stats = dict(stats)
+            stats.update(frame_record_counts(record))
+    return stats
+
 @app.route('/get_stats')
 def get_stats():
     """Return the current detection statistics"""
+    stats = current_stats(default_source)
     if DEBUG:
-        print(f"Sending stats to client: {detection_stats}")
-    return jsonify(detection_stats)
+        print(f"Sending stats to client: {stats}")
+    return jsonify(stats)
+
+def time_series_payload(since=None, source=None):
+    """
+    Time series points after sequence number `since`, or the most recent
+    MAX_DATA_POINTS when no cursor is given. `seq` in the result is the cursor
+    for the next request.
+    """
+    time_series = (source or default_source).time_series
+    if since is None:
+        return time_series.since(limit=MAX_DATA_POINTS)
+    return time_series.since(since)
+
+def time_series_response(source):
+    since = request.args.get("since", type=int)
+    if since is not None and since < 0:
+        return jsonify({"status": "error", "message": "since must be a non-negative sequence number"}), 400
+    return jsonify(time_series_payload(since, source))
 
 @app.route('/get_time_series')
 def get_time_series():
-    """Return time series data for charts"""
-    result = {
-        "timestamps": list(time_series_data["timestamps"]),
-        "bee_counts": list(time_series_data["bee_counts"]),
-        "varroa_counts": list(time_series_data["varroa_counts"]),
-        "infestation_ratio": list(time_series_data["infestation_ratio"]),
-    }
-    return jsonify(result)
+    """Return time series data for charts, optionally only points newer than ?since=<seq>"""
+    return time_series_response(default_source)
+
+@app.route('/stream')
+def stream():
+    """
+    Server-Sent Events: a full snapshot on connect, then stats and time series
+    deltas of the first source, or of the one given as ?source=<id>
+    """
+    source_id = request.args.get("source")
+    source = get_source(source_id)
+    if source is None:
+        return unknown_source(source_id)
+    
+    last_event_id = request.headers.get("Last-Event-ID", type=int)
+    # Subscribe before building the snapshot so no update falls in between
+    events = source.events.subscribe(last_event_id)
+    
+    def generate():
+        if last_event_id is None:
+            snapshot = {"stats": public_stats(source), "time_series": time_series_payload(source=source)}
+            yield format_sse("snapshot", json.dumps(snapshot, separators=(",", ":")))
+        yield from events
+    
+    response = Response(generate(), mimetype="text/event-stream")
+    response.headers["Cache-Control"] = "no-cache"
+    response.headers["X-Accel-Buffering"] = "no"  # Disable proxy buffering
+    return response
+
+@app.route('/api/visualization', methods=['GET', 'POST'])
+def visualization():
+    """Get or change how the detectors render annotated frames"""
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        mode = data.get("mode", visualization_settings["mode"])
+        preview_interval = data.get("preview_interval", visualization_settings["preview_interval"])
+        
+        if mode not in VISUALIZATION_MODES:
+            return jsonify({"status": "error", "message": f"Unknown visualization mode: {mode}"}), 400
+        if not isinstance(preview_interval, int) or preview_interval < 1:
+            return jsonify({"status": "error", "message": "preview_interval must be a positive integer"}), 400
+        
+        visualization_settings["mode"] = mode
+        visualization_settings["preview_interval"] = preview_interval
+        
+        # Apply immediately to every running detector
+        for source in detection_sources.values():
+            control = source.control
+            if control is None:
+                continue
+            try:
+                control.set_visualization(VISUALIZATION_MODES[mode], preview_interval)
+            except (ValueError, TypeError):
+                # Detector stopped meanwhile; the setting applies to the next run
+                pass
+    
+    return jsonify(visualization_settings)
+
+@app.route('/video_feed')
+def video_feed():
+    """Stream annotated frames of the first source (or ?source=<id>) as multipart MJPEG/WebP"""
+    if not preview_available():
+        return jsonify({"status": "error", "message": "Live preview requires OpenCV"}), 503
+    
+    source_id = request.args.get("source")
+    source = get_source(source_id)
+    if source is None:
+        return unknown_source(source_id)
+    
+    mime_type = PREVIEW_MIME_TYPES[PREVIEW_FORMAT]
+    
+    def generate():
+        # Every client receives the same encoded buffer
+        for frame in source.preview_stream.frames():
+            yield (b"--frame\r\nContent-Type: " + mime_type.encode() + b"\r\n\r\n" + frame + b"\r\n")
+    
+    return Response(generate(), mimetype="multipart/x-mixed-replace; boundary=frame")
+
+# Per-source routes
+@app.route('/api/sources')
+def list_sources():
+    """Configured cameras and the state of their detectors"""
+    return jsonify([source.status() for source in detection_sources.values()])
+
+@app.route('/api/sources/aggregate')
+def get_aggregate_stats():
+    """Statistics combined across all sources, with each source's own statistics"""
+    per_source = {source_id: current_stats(source) for source_id, source in detection_sources.items()}
+    return jsonify({
+        "aggregate": aggregate_stats(list(per_source.values())),
+        "sources": per_source,
+    })
+
+@app.route('/api/sources/<source_id>/stats')
+def get_source_stats(source_id):
+    """Current detection statistics of one source"""
+    source = detection_sources.get(source_id)
+    if source is None:
+        return unknown_source(source_id)
+    return jsonify(current_stats(source))
+
+@app.route('/api/sources/<source_id>/time_series')
+def get_source_time_series(source_id):
+    """Chart time series of one source, optionally only points newer than ?since=<seq>"""
+    source = detection_sources.get(source_id)
+    if source is None:
+        return unknown_source(source_id)
+    return time_series_response(source)
+
+@app.route('/api/sources/<source_id>/start', methods=['POST'])
+def start_source_detection(source_id):
+    """Start the detector of one source"""
+    source = detection_sources.get(source_id)
+    if source is None:
+        return unknown_source(source_id)
+    if multiplexed():
+        return jsonify({"status": "error", "message": "Sources share one multiplexed detector; use /start_detection"}), 409
+    if not start_source(source):
+        return jsonify({"status": "already_running"})
+    return jsonify({"status": "started"})
+
+@app.route('/api/sources/<source_id>/stop', methods=['POST'])
+def stop_source_detection(source_id):
+    """Stop the detector of one source; the others keep running"""
+    source = detection_sources.get(source_id)
+    if source is None:
+        return unknown_source(source_id)
+    if multiplexed():
+        return jsonify({"status": "error", "message": "Sources share one multiplexed detector; use /stop_detection"}), 409
+    if not stop_source(source):
+        return jsonify({"status": "already_stopped"})
+    return jsonify({"status": "stopped"})
 
 # Database access routes
 @app.route('/api/sessions')
@@ -513,13 +782,46 @@ def get_sessions():
     sessions = db.get_sessions(limit=limit)
     return jsonify(sessions)
 
+@app.route('/api/sessions/<int:session_id>/summary')
+def get_session_summary(session_id):
+    """Aggregated statistics of one session, as used in the summary email"""
+    summary = db.get_session_summary(session_id)
+    if summary is None:
+        return jsonify({"status": "error", "message": f"Session {session_id} not found"}), 404
+    return jsonify(summary)
+
 @app.route('/api/metrics')
 def get_metrics():
-    """Get stored metrics"""
+    """
+    Get stored metrics. Without a time range, the latest `limit` rows. With
+    `start` and/or `end` (ISO 8601 local time), at most about `max_points`
+    points downsampled on the server.
+    """
     limit = request.args.get('limit', 100, type=int)
     session_id = request.args.get('session_id', None, type=int)
-    metrics = db.get_latest_metrics(limit=limit, session_id=session_id)
-    return jsonify(metrics)
+    start = request.args.get('start')
+    end = request.args.get('end')
+    
+    if start is None and end is None:
+        metrics = db.get_latest_metrics(limit=limit, session_id=session_id)
+        return jsonify(metrics)
+    
+    try:
+        end = datetime.datetime.fromisoformat(end) if end else datetime.datetime.now()
+        start = datetime.datetime.fromisoformat(start) if start else end - datetime.timedelta(days=1)
+    except ValueError:
+        return jsonify({"status": "error", "message": "start and end must be ISO 8601 timestamps"}), 400
+    if start >= end:
+        return jsonify({"status": "error", "message": "start must be before end"}), 400
+    
+    max_points = request.args.get('max_points', MAX_HISTORY_POINTS, type=int)
+    if max_points < 1:
+        return jsonify({"status": "error", "message": "max_points must be a positive integer"}), 400
+    
+    history = db.get_metric_history(start, end, max_points=min(max_points, MAX_HISTORY_POINTS), session_id=session_id)
+    history["start"] = start
+    history["end"] = end
+    return jsonify(history)
 
 # Email testing endpoint - kept for functionality
 @app.route('/test-email')
@@ -564,7 +866,7 @@ def test_email():
         
         def send_email_with_timeout():
             try:
-                success = email_service.send_session_summary(session_id, db.db_path)
+                success = email_service.send_session_summary(session_id, db.get_session_summary(session_id))
                 q.put(("success" if success else "error", 
                       f"Email {'sent successfully' if success else 'failed to send'} for session {session_id}"))
             except Exception as e:
@@ -597,12 +899,11 @@ if __name__ == '__main__':
     signal.signal(signal.SIGINT, signal_handler)
     signal.signal(signal.SIGTERM, signal_handler)
     
-    # Ensure no detection processes are running when we start
-    terminate_detection()
-    clean_gstreamer_resources()
+    # Deliver summary emails still queued from before a restart
+    db.email_worker.start()
     
-    # Small delay to ensure cleanup is complete
-    time.sleep(0.1)
+    # Ensure no detection processes are left over from a crashed run
+    recover_stale_detectors()
     
     # Start the Flask app
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -2,24 +2,474 @@ import sqlite3
 import datetime
 import os
 import time
+import threading
+import calendar
+from collections import deque
 from email_service import EmailService
 
 # Register datetime adapter/converter to avoid deprecation warnings in Python 3.12+
 sqlite3.register_adapter(datetime.datetime, lambda val: val.isoformat())
 sqlite3.register_converter("timestamp", lambda val: datetime.datetime.fromisoformat(val.decode("utf-8")))
 
+# Pragmas applied to every connection. WAL lets dashboard reads run alongside
+# metric writes, and synchronous=NORMAL only fsyncs at checkpoints, so a write
+# is an append to the log instead of a journal file round trip.
+CONNECTION_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA cache_size=-8000",       # 8 MB page cache
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA busy_timeout=5000",      # Wait up to 5 s for another writer
+)
+
+# Prepared statements are cached per connection by the sqlite3 module, keyed by SQL text
+STATEMENT_CACHE_SIZE = 64
+
+INSERT_SESSION_SQL = 'INSERT INTO sessions (start_time, source, notes) VALUES (?, ?, ?)'
+END_SESSION_SQL = 'UPDATE sessions SET end_time = ? WHERE session_id = ?'
+MARK_EMAIL_SENT_SQL = 'UPDATE sessions SET email_sent = 1 WHERE session_id = ?'
+INSERT_METRICS_SQL = 'INSERT INTO bee_metrics (session_id, timestamp, unique_bee_count, unique_varroa_count, infestation_ratio, frame_count, fps) VALUES (?, ?, ?, ?, ?, ?, ?)'
+SESSION_METRICS_SQL = 'SELECT * FROM bee_metrics WHERE session_id = ? ORDER BY timestamp DESC LIMIT ?'
+LATEST_METRICS_SQL = 'SELECT * FROM bee_metrics ORDER BY timestamp DESC LIMIT ?'
+SESSIONS_SQL = 'SELECT * FROM sessions ORDER BY start_time DESC LIMIT ?'
+RANGE_METRICS_SQL = 'SELECT * FROM bee_metrics WHERE timestamp >= :start AND timestamp < :end ORDER BY timestamp'
+SESSION_RANGE_METRICS_SQL = 'SELECT * FROM bee_metrics WHERE session_id = :session_id AND timestamp >= :start AND timestamp < :end ORDER BY timestamp'
+SESSION_SQL = 'SELECT * FROM sessions WHERE session_id = ?'
+SESSION_AGGREGATES_SQL = '''
+SELECT COUNT(*) AS metrics_count,
+    MIN(unique_bee_count) AS bee_min, MAX(unique_bee_count) AS bee_max, AVG(unique_bee_count) AS bee_avg,
+    MIN(unique_varroa_count) AS varroa_min, MAX(unique_varroa_count) AS varroa_max, AVG(unique_varroa_count) AS varroa_avg,
+    MIN(infestation_ratio) AS ratio_min, MAX(infestation_ratio) AS ratio_max, AVG(infestation_ratio) AS ratio_avg
+FROM bee_metrics WHERE session_id = ?
+'''
+QUEUE_EMAIL_SQL = "INSERT INTO email_outbox (session_id, created_at, next_attempt_at) VALUES (?, ?, ?)"
+DUE_EMAILS_SQL = "SELECT * FROM email_outbox WHERE status = 'pending' AND next_attempt_at <= ? ORDER BY next_attempt_at LIMIT ?"
+PENDING_EMAILS_SQL = "SELECT * FROM email_outbox WHERE status = 'pending' ORDER BY outbox_id LIMIT ?"
+NEXT_EMAIL_DUE_SQL = "SELECT MIN(next_attempt_at) FROM email_outbox WHERE status = 'pending'"
+EMAIL_SENT_SQL = "UPDATE email_outbox SET status = 'sent', attempts = attempts + 1, sent_at = ?, last_error = NULL WHERE outbox_id = ?"
+EMAIL_RETRY_SQL = "UPDATE email_outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? WHERE outbox_id = ?"
+OUTBOX_SQL = 'SELECT * FROM email_outbox ORDER BY outbox_id DESC LIMIT ?'
+DETECTION_BLOCKS_SQL = 'SELECT * FROM detection_blocks WHERE session_id = ? AND last_frame >= ? AND first_frame <= ? ORDER BY first_frame'
+
+# Rollup resolutions in seconds, finest first. Buckets are aligned to local
+# wall-clock time, the same clock as the stored timestamps, so day buckets start at midnight.
+ROLLUP_RESOLUTIONS = {
+    "minute": 60,
+    "hour": 3600,
+    "day": 86400,
+}
+
+# Adds one bee_metrics row to its rollup bucket
+UPSERT_ROLLUP_SQL = '''
+INSERT INTO metric_rollups (resolution, bucket_start, session_id, sample_count,
+    bee_sum, bee_min, bee_max, varroa_sum, varroa_min, varroa_max,
+    ratio_sum, ratio_min, ratio_max, max_frame_count, fps_sum, fps_count)
+VALUES (?, ?, ?, 1, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (resolution, bucket_start, session_id) DO UPDATE SET
+    sample_count = sample_count + 1,
+    bee_sum = bee_sum + excluded.bee_sum,
+    bee_min = MIN(bee_min, excluded.bee_min),
+    bee_max = MAX(bee_max, excluded.bee_max),
+    varroa_sum = varroa_sum + excluded.varroa_sum,
+    varroa_min = MIN(varroa_min, excluded.varroa_min),
+    varroa_max = MAX(varroa_max, excluded.varroa_max),
+    ratio_sum = ratio_sum + excluded.ratio_sum,
+    ratio_min = MIN(ratio_min, excluded.ratio_min),
+    ratio_max = MAX(ratio_max, excluded.ratio_max),
+    max_frame_count = MAX(max_frame_count, excluded.max_frame_count),
+    fps_sum = fps_sum + excluded.fps_sum,
+    fps_count = fps_count + excluded.fps_count
+'''
+
+# Rebuilds the rollups of one resolution (in seconds) from bee_metrics
+REBUILD_ROLLUP_SQL = '''
+INSERT INTO metric_rollups (resolution, bucket_start, session_id, sample_count,
+    bee_sum, bee_min, bee_max, varroa_sum, varroa_min, varroa_max,
+    ratio_sum, ratio_min, ratio_max, max_frame_count, fps_sum, fps_count)
+SELECT :resolution, CAST(strftime('%s', timestamp) AS INTEGER) / :resolution * :resolution, session_id, COUNT(*),
+    SUM(unique_bee_count), MIN(unique_bee_count), MAX(unique_bee_count),
+    SUM(unique_varroa_count), MIN(unique_varroa_count), MAX(unique_varroa_count),
+    SUM(infestation_ratio), MIN(infestation_ratio), MAX(infestation_ratio),
+    MAX(frame_count), COALESCE(SUM(fps), 0), COUNT(fps)
+FROM bee_metrics
+GROUP BY 2, session_id
+'''
+
+# Rollup buckets merged into buckets of :width seconds (a multiple of the resolution)
+ROLLUP_POINT_COLUMNS = '''
+    bucket_start / :width * :width AS bucket, SUM(sample_count) AS samples,
+    SUM(bee_sum) * 1.0 / SUM(sample_count) AS bee_avg, MIN(bee_min) AS bee_min, MAX(bee_max) AS bee_max,
+    SUM(varroa_sum) * 1.0 / SUM(sample_count) AS varroa_avg, MIN(varroa_min) AS varroa_min, MAX(varroa_max) AS varroa_max,
+    SUM(ratio_sum) / SUM(sample_count) AS ratio_avg, MIN(ratio_min) AS ratio_min, MAX(ratio_max) AS ratio_max,
+    MAX(max_frame_count) AS frame_count,
+    CASE WHEN SUM(fps_count) > 0 THEN SUM(fps_sum) / SUM(fps_count) END AS fps
+'''
+ROLLUP_RANGE_SQL = 'SELECT' + ROLLUP_POINT_COLUMNS + '''FROM metric_rollups
+WHERE resolution = :resolution AND bucket_start >= :first AND bucket_start < :last
+GROUP BY bucket ORDER BY bucket'''
+ROLLUP_SESSION_RANGE_SQL = 'SELECT' + ROLLUP_POINT_COLUMNS + '''FROM metric_rollups
+WHERE resolution = :resolution AND session_id = :session_id AND bucket_start >= :first AND bucket_start < :last
+GROUP BY bucket ORDER BY bucket'''
+
+# Raw bee_metrics in a time range, aggregated into buckets of :width seconds.
+# Range filters compare ISO timestamps and use the (session_id, timestamp) or timestamp index.
+RAW_POINT_COLUMNS = '''
+    CAST(strftime('%s', timestamp) AS INTEGER) / :width * :width AS bucket, COUNT(*) AS samples,
+    AVG(unique_bee_count) AS bee_avg, MIN(unique_bee_count) AS bee_min, MAX(unique_bee_count) AS bee_max,
+    AVG(unique_varroa_count) AS varroa_avg, MIN(unique_varroa_count) AS varroa_min, MAX(unique_varroa_count) AS varroa_max,
+    AVG(infestation_ratio) AS ratio_avg, MIN(infestation_ratio) AS ratio_min, MAX(infestation_ratio) AS ratio_max,
+    MAX(frame_count) AS frame_count, AVG(fps) AS fps
+'''
+RAW_RANGE_SQL = 'SELECT' + RAW_POINT_COLUMNS + '''FROM bee_metrics
+WHERE timestamp >= :start AND timestamp < :end
+GROUP BY bucket ORDER BY bucket'''
+RAW_SESSION_RANGE_SQL = 'SELECT' + RAW_POINT_COLUMNS + '''FROM bee_metrics
+WHERE session_id = :session_id AND timestamp >= :start AND timestamp < :end
+GROUP BY bucket ORDER BY bucket'''
+RAW_COUNT_SQL = 'SELECT COUNT(*) FROM bee_metrics WHERE timestamp >= :start AND timestamp < :end'
+RAW_SESSION_COUNT_SQL = 'SELECT COUNT(*) FROM bee_metrics WHERE session_id = :session_id AND timestamp >= :start AND timestamp < :end'
+
+def wall_clock_seconds(timestamp):
+    """Seconds since the epoch of a naive local datetime, read as if it were UTC"""
+    return calendar.timegm(timestamp.timetuple())
+
+def wall_clock_datetime(seconds):
+    """Inverse of wall_clock_seconds"""
+    return datetime.datetime(1970, 1, 1) + datetime.timedelta(seconds=seconds)
+
+def raw_point(row):
+    """A bee_metrics row in the point layout of get_metric_history"""
+    return {
+        "timestamp": row["timestamp"],
+        "samples": 1,
+        "bee_avg": row["unique_bee_count"],
+        "bee_min": row["unique_bee_count"],
+        "bee_max": row["unique_bee_count"],
+        "varroa_avg": row["unique_varroa_count"],
+        "varroa_min": row["unique_varroa_count"],
+        "varroa_max": row["unique_varroa_count"],
+        "ratio_avg": row["infestation_ratio"],
+        "ratio_min": row["infestation_ratio"],
+        "ratio_max": row["infestation_ratio"],
+        "frame_count": row["frame_count"],
+        "fps": row["fps"],
+    }
+
+def rollup_rows(metric_rows):
+    """Rollup upsert parameters for bee_metrics rows (as passed to INSERT_METRICS_SQL)"""
+    rows = []
+    for session_id, timestamp, bees, varroa, ratio, frame_count, fps in metric_rows:
+        seconds = wall_clock_seconds(timestamp)
+        for resolution in ROLLUP_RESOLUTIONS.values():
+            rows.append((
+                resolution, seconds // resolution * resolution, session_id,
+                bees, bees, bees, varroa, varroa, varroa, ratio, ratio, ratio,
+                frame_count, fps or 0, 0 if fps is None else 1,
+            ))
+    return rows
+
+# Summaries of closed sessions kept in memory
+SUMMARY_CACHE_SIZE = 64
+
+# Email outbox delivery: retry after 30 s, doubling up to an hour, for about two days
+EMAIL_RETRY_BASE = 30.0
+EMAIL_RETRY_MAX = 3600.0
+EMAIL_MAX_ATTEMPTS = 60
+EMAIL_BATCH_SIZE = 10          # Emails sent per pass over the outbox
+EMAIL_DIGEST_MAX_SESSIONS = 50 # Sessions summarized in one digest email
+
+# Background metric writer
+METRIC_QUEUE_SIZE = 1000       # Rows waiting to be written before overload handling kicks in
+METRIC_BATCH_SIZE = 100        # Rows per transaction
+METRIC_FLUSH_INTERVAL = 2.0    # Seconds a row may wait for a batch to fill up
+
+class MetricWriter:
+    """
+    Writes queued bee_metrics rows from a single background thread, batching
+    them into one executemany transaction per METRIC_BATCH_SIZE rows or
+    METRIC_FLUSH_INTERVAL seconds, whichever comes first.
+
+    Metric rows are cumulative snapshots, so under overload the newest row of
+    a session replaces the previous pending one instead of growing the queue.
+    """
+
+    def __init__(self, db, max_queue=METRIC_QUEUE_SIZE, batch_size=METRIC_BATCH_SIZE,
+                 flush_interval=METRIC_FLUSH_INTERVAL):
+        self.db = db
+        self.max_queue = max_queue
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.pending = deque()
+        self.condition = threading.Condition()
+        self.writing = 0            # Rows taken off the queue but not yet committed
+        self.flush_requested = False
+        self.running = False
+        self.thread = None
+        # Overload and error counters
+        self.coalesced = 0
+        self.dropped = 0
+        self.failed = 0
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name="metric-writer", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        """Write everything still queued and stop the thread"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+            self.thread = None
+
+    def submit(self, row):
+        """Queue a row without blocking"""
+        with self.condition:
+            if len(self.pending) >= self.max_queue:
+                last = self.pending[-1]
+                if last[0] == row[0]:
+                    # Same session: the newer cumulative snapshot supersedes the queued one
+                    self.pending[-1] = row
+                    self.coalesced += 1
+                    return
+                self.pending.popleft()
+                self.dropped += 1
+            self.pending.append(row)
+            if len(self.pending) >= self.batch_size:
+                self.condition.notify_all()
+
+    def flush(self, timeout=10.0):
+        """Block until every row queued so far is committed; returns False on timeout"""
+        deadline = time.time() + timeout
+        with self.condition:
+            if not self.running and self.pending:
+                # No writer thread to hand the rows to
+                self._write_locked()
+            self.flush_requested = True
+            self.condition.notify_all()
+            while self.pending or self.writing:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self.condition.wait(timeout=remaining)
+        return True
+
+    def _write_locked(self):
+        rows = list(self.pending)
+        self.pending.clear()
+        self._write(rows)
+
+    def _write(self, rows):
+        try:
+            conn = self.db._connect()
+            with conn:
+                conn.executemany(INSERT_METRICS_SQL, rows)
+                conn.executemany(UPSERT_ROLLUP_SQL, rollup_rows(rows))
+        except sqlite3.Error as e:
+            self.failed += len(rows)
+            print(f"Error writing {len(rows)} metric rows: {e}")
+
+    def _run(self):
+        while True:
+            with self.condition:
+                deadline = time.time() + self.flush_interval
+                while (self.running and not self.flush_requested
+                       and len(self.pending) < self.batch_size):
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(timeout=remaining)
+                if not self.pending and not self.running:
+                    self.condition.notify_all()
+                    return
+                self.flush_requested = False
+                rows = [self.pending.popleft() for _ in range(min(len(self.pending), self.batch_size))]
+                self.writing = len(rows)
+            # Write outside the lock so producers never wait on the disk
+            if rows:
+                self._write(rows)
+            with self.condition:
+                self.writing = 0
+                if self.pending:
+                    # Keep draining a backlog or a requested flush without waiting
+                    self.flush_requested = True
+                self.condition.notify_all()
+
+class EmailDeliveryWorker:
+    """
+    Sends the session summaries queued in the email_outbox table from a
+    background thread. Failed sends are retried with exponential backoff, so
+    summaries go out once the apiary is back online, even after a restart.
+    """
+
+    def __init__(self, db, retry_base=EMAIL_RETRY_BASE, retry_max=EMAIL_RETRY_MAX,
+                 max_attempts=EMAIL_MAX_ATTEMPTS, digest_interval=0):
+        self.db = db
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.max_attempts = max_attempts
+        # Seconds to collect closed sessions into one digest email; 0 sends one email per session
+        self.digest_interval = digest_interval
+        self.condition = threading.Condition()
+        self.wake_requested = False
+        self.running = False
+        self.thread = None
+
+    def start(self):
+        with self.condition:
+            if self.running:
+                return
+            self.running = True
+        self.thread = threading.Thread(target=self._run, name="email-delivery", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout=5.0):
+        """Stop after the send in progress, if any; queued emails stay in the outbox"""
+        with self.condition:
+            self.running = False
+            self.condition.notify_all()
+        if self.thread is not None:
+            self.thread.join(timeout=timeout)
+            self.thread = None
+        self.db.email_service.close()
+
+    def next_attempt_time(self):
+        """When a newly queued email should be sent"""
+        return time.time() + self.digest_interval
+
+    def wake(self):
+        """Check the outbox now, e.g. after queueing an email"""
+        with self.condition:
+            self.wake_requested = True
+            self.condition.notify_all()
+
+    def retry_delay(self, attempts):
+        """Seconds to wait after `attempts` failed sends"""
+        return min(self.retry_max, self.retry_base * 2 ** (attempts - 1))
+
+    def deliver_due(self, now=None):
+        """Try every email that is due; returns the number of sessions whose summary was sent"""
+        now = time.time() if now is None else now
+        conn = self.db._connect()
+        due = conn.execute(DUE_EMAILS_SQL, (now, EMAIL_BATCH_SIZE)).fetchall()
+        if not due:
+            return 0
+        if self.digest_interval > 0:
+            # Sessions closed after the first one join its digest even if not due yet
+            rows = conn.execute(PENDING_EMAILS_SQL, (EMAIL_DIGEST_MAX_SESSIONS,)).fetchall()
+            return self._deliver(conn, rows)
+        # Consecutive sends reuse the same SMTP login
+        return sum(self._deliver(conn, [row]) for row in due)
+
+    def _deliver(self, conn, rows):
+        """Send one email covering the sessions of the given outbox rows and record the outcome"""
+        session_ids = [row["session_id"] for row in rows]
+        email_service = self.db.email_service
+        try:
+            summaries = [self.db.get_session_summary(session_id) for session_id in session_ids]
+            if len(rows) == 1:
+                ok = email_service.send_session_summary(session_ids[0], summaries[0])
+            else:
+                ok = email_service.send_digest(summaries)
+            error = email_service.last_error
+        except Exception as e:
+            ok, error = False, str(e)
+
+        with conn:
+            for row in rows:
+                if ok:
+                    conn.execute(EMAIL_SENT_SQL, (datetime.datetime.now(), row["outbox_id"]))
+                    conn.execute(MARK_EMAIL_SENT_SQL, (row["session_id"],))
+                else:
+                    attempts = row["attempts"] + 1
+                    status = "failed" if attempts >= self.max_attempts else "pending"
+                    conn.execute(EMAIL_RETRY_SQL, (status, attempts, time.time() + self.retry_delay(attempts),
+                                                   error or "Send failed", row["outbox_id"]))
+        if not ok:
+            print(f"Email for sessions {session_ids} not sent, will retry: {error}")
+            return 0
+        for session_id in session_ids:
+            self.db._forget_summary(session_id)
+        print(f"Email sent for sessions {session_ids}")
+        return len(rows)
+
+    def _run(self):
+        while True:
+            with self.condition:
+                if not self.running:
+                    return
+                self.wake_requested = False
+            smtp = self.db.email_service.smtp
+            try:
+                self.deliver_due()
+                next_due = self.db._connect().execute(NEXT_EMAIL_DUE_SQL).fetchone()[0]
+            except sqlite3.Error as e:
+                print(f"Error reading email outbox: {e}")
+                next_due = time.time() + self.retry_base
+            # Also wake up to log out of an SMTP connection that went idle
+            idle_deadline = smtp.idle_deadline()
+            if idle_deadline is not None:
+                next_due = idle_deadline if next_due is None else min(next_due, idle_deadline)
+            with self.condition:
+                while self.running and not self.wake_requested:
+                    timeout = None if next_due is None else next_due - time.time()
+                    if timeout is not None and timeout <= 0:
+                        break
+                    self.condition.wait(timeout=timeout)
+            smtp.close_if_idle()
+
 class BeeHealthDatabase:
     def __init__(self, db_path="bee_health.db"):
         self.db_path = db_path
+        # One long-lived connection per thread (detection loop, Flask request threads)
+        self._local = threading.local()
+        self._connections = []
+        self._connections_lock = threading.Lock()
         self.create_tables_if_not_exist()
         self.current_session_id = None
         self.email_service = EmailService()
+        self.metric_writer = MetricWriter(self)
+        # Closed sessions never change, so their summaries are computed once
+        self._summary_cache = {}
+        self._summary_cache_lock = threading.Lock()
+        self.email_worker = EmailDeliveryWorker(self)
 
     def _connect(self):
-        return sqlite3.connect(
-            self.db_path,
-            detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES
-        )
+        """Return this thread's connection, opening it on first use"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path,
+                detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES,
+                cached_statements=STATEMENT_CACHE_SIZE,
+                # Only used by its own thread, but close() may run elsewhere
+                check_same_thread=False
+            )
+            conn.row_factory = sqlite3.Row
+            for pragma in CONNECTION_PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        """Write queued metrics, stop email delivery and close the connections of all threads"""
+        self.metric_writer.stop()
+        self.email_worker.stop()
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            try:
+                conn.close()
+            except sqlite3.ProgrammingError:
+                pass
+        self._local = threading.local()
 
     def create_tables_if_not_exist(self):
         conn = self._connect()
@@ -52,20 +502,93 @@ class BeeHealthDatabase:
 
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_bee_metrics_session_id ON bee_metrics(session_id)')
         cursor.execute('CREATE INDEX IF NOT EXISTS idx_bee_metrics_timestamp ON bee_metrics(timestamp)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_bee_metrics_session_timestamp ON bee_metrics(session_id, timestamp)')
+
+        # Per-bucket aggregates of bee_metrics, updated on every metrics write
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS metric_rollups (
+            resolution INTEGER NOT NULL,
+            bucket_start INTEGER NOT NULL,
+            session_id INTEGER NOT NULL,
+            sample_count INTEGER NOT NULL,
+            bee_sum INTEGER NOT NULL,
+            bee_min INTEGER NOT NULL,
+            bee_max INTEGER NOT NULL,
+            varroa_sum INTEGER NOT NULL,
+            varroa_min INTEGER NOT NULL,
+            varroa_max INTEGER NOT NULL,
+            ratio_sum REAL NOT NULL,
+            ratio_min REAL NOT NULL,
+            ratio_max REAL NOT NULL,
+            max_frame_count INTEGER NOT NULL,
+            fps_sum REAL NOT NULL,
+            fps_count INTEGER NOT NULL,
+            PRIMARY KEY (resolution, bucket_start, session_id)
+        ) WITHOUT ROWID
+        ''')
+
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_metric_rollups_session ON metric_rollups(resolution, session_id, bucket_start)')
+
+        # Databases created before rollups existed are backfilled once
+        has_metrics = cursor.execute('SELECT 1 FROM bee_metrics LIMIT 1').fetchone()
+        has_rollups = cursor.execute('SELECT 1 FROM metric_rollups LIMIT 1').fetchone()
+        if has_metrics and not has_rollups:
+            self._rebuild_rollups(cursor)
+
+        # Session summary emails waiting to be sent by the EmailDeliveryWorker
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS email_outbox (
+            outbox_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL,
+            created_at TIMESTAMP NOT NULL,
+            status VARCHAR(16) NOT NULL DEFAULT 'pending',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            next_attempt_at REAL NOT NULL,
+            last_error TEXT,
+            sent_at TIMESTAMP,
+            FOREIGN KEY (session_id) REFERENCES sessions(session_id)
+        )
+        ''')
+
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_email_outbox_due ON email_outbox(status, next_attempt_at)')
+
+        # Optional per-detection log, packed into compressed blocks of frames (see detection_log.py)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS detection_blocks (
+            block_id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id INTEGER NOT NULL,
+            first_frame INTEGER NOT NULL,
+            last_frame INTEGER NOT NULL,
+            start_time REAL NOT NULL,
+            end_time REAL NOT NULL,
+            detection_count INTEGER NOT NULL,
+            format_version INTEGER NOT NULL,
+            data BLOB NOT NULL,
+            FOREIGN KEY (session_id) REFERENCES sessions(session_id)
+        )
+        ''')
+
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_detection_blocks_session_frame ON detection_blocks(session_id, first_frame)')
 
         conn.commit()
-        conn.close()
+
+    def _rebuild_rollups(self, cursor):
+        cursor.execute('DELETE FROM metric_rollups')
+        for resolution in ROLLUP_RESOLUTIONS.values():
+            cursor.execute(REBUILD_ROLLUP_SQL, {"resolution": resolution})
+
+    def rebuild_rollups(self):
+        """Recompute all rollups from bee_metrics, e.g. after editing or deleting metrics"""
+        self.metric_writer.flush()
+        conn = self._connect()
+        with conn:
+            self._rebuild_rollups(conn.cursor())
 
     def start_new_session(self, source="default", notes=""):
         conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute(
-            'INSERT INTO sessions (start_time, source, notes) VALUES (?, ?, ?)',
-            (datetime.datetime.now(), source, notes)
-        )
+        with conn:
+            cursor = conn.execute(INSERT_SESSION_SQL, (datetime.datetime.now(), source, notes))
         self.current_session_id = cursor.lastrowid
-        conn.commit()
-        conn.close()
         return self.current_session_id
 
     def end_session(self, session_id=None):
@@ -74,31 +597,85 @@ class BeeHealthDatabase:
         if session_id is None:
             return False
 
+        # Metrics queued for the session must be stored before it is summarized
+        self.metric_writer.flush()
+
+        # Close the session and queue its summary email in one transaction;
+        # the delivery worker sends it without holding up the caller
         conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute(
-            'UPDATE sessions SET end_time = ? WHERE session_id = ?',
-            (datetime.datetime.now(), session_id)
-        )
-        conn.commit()
-        try:
-            email_sent = self.email_service.send_session_summary(session_id, self.db_path)
-            if email_sent:
-                cursor.execute(
-                    'UPDATE sessions SET email_sent = 1 WHERE session_id = ?',
-                    (session_id,)
-                )
-                conn.commit()
-                print(f"Email sent for session {session_id}")
-            else:
-                print(f"Email not sent for session {session_id}")
-        except Exception as e:
-            print(f"Error sending email: {e}")
-        conn.close()
+        with conn:
+            conn.execute(END_SESSION_SQL, (datetime.datetime.now(), session_id))
+            conn.execute(QUEUE_EMAIL_SQL, (session_id, datetime.datetime.now(), self.email_worker.next_attempt_time()))
+        print(f"Summary email queued for session {session_id}")
+        self.email_worker.start()
+        self.email_worker.wake()
         if session_id == self.current_session_id:
             self.current_session_id = None
         return True
 
+    def get_session_summary(self, session_id):
+        """
+        Session row, min/max/avg of the stored metrics, overall totals and the
+        10 most recent metrics, or None if the session does not exist.
+        Aggregates are computed in SQL; summaries of ended sessions are cached.
+        """
+        with self._summary_cache_lock:
+            summary = self._summary_cache.get(session_id)
+        if summary is not None:
+            return summary
+
+        conn = self._connect()
+        session = conn.execute(SESSION_SQL, (session_id,)).fetchone()
+        if session is None:
+            return None
+        stats = conn.execute(SESSION_AGGREGATES_SQL, (session_id,)).fetchone()
+        latest = conn.execute(SESSION_METRICS_SQL, (session_id, 10)).fetchall()
+
+        # Unique counts are cumulative, so the session totals are the maxima
+        total_unique_bees = stats["bee_max"] or 0
+        total_unique_varroa = stats["varroa_max"] or 0
+        summary = {
+            'session': dict(session),
+            'metrics_count': stats["metrics_count"],
+            'bee_stats': {
+                'max': stats["bee_max"] or 0,
+                'min': stats["bee_min"] or 0,
+                'avg': stats["bee_avg"] or 0
+            },
+            'varroa_stats': {
+                'max': stats["varroa_max"] or 0,
+                'min': stats["varroa_min"] or 0,
+                'avg': stats["varroa_avg"] or 0
+            },
+            'ratio_stats': {
+                'max': stats["ratio_max"] or 0,
+                'min': stats["ratio_min"] or 0,
+                'avg': stats["ratio_avg"] or 0
+            },
+            'total_unique_bees': total_unique_bees,
+            'total_unique_varroa': total_unique_varroa,
+            'overall_ratio': total_unique_varroa / total_unique_bees if total_unique_bees > 0 else 0,
+            'latest_metrics': [dict(row) for row in latest]
+        }
+
+        if session["end_time"] is not None:
+            with self._summary_cache_lock:
+                if len(self._summary_cache) >= SUMMARY_CACHE_SIZE:
+                    # Drop the oldest entry
+                    self._summary_cache.pop(next(iter(self._summary_cache)))
+                self._summary_cache[session_id] = summary
+        return summary
+
+    def _forget_summary(self, session_id):
+        with self._summary_cache_lock:
+            self._summary_cache.pop(session_id, None)
+
+    def get_email_outbox(self, limit=20):
+        """Most recent queued, sent and failed summary emails"""
+        conn = self._connect()
+        cursor = conn.execute(OUTBOX_SQL, (limit,))
+        return [dict(row) for row in cursor.fetchall()]
+
     def save_metrics(self, unique_bee_count, unique_varroa_count, frame_count, fps=None, session_id=None):
         if session_id is None:
             session_id = self.current_session_id
@@ -109,42 +686,127 @@ class BeeHealthDatabase:
             unique_varroa_count / unique_bee_count if unique_bee_count > 0 else 0
         )
 
+        row = (session_id, datetime.datetime.now(), unique_bee_count, unique_varroa_count, infestation_ratio, frame_count, fps)
         conn = self._connect()
-        cursor = conn.cursor()
-        cursor.execute(
-            'INSERT INTO bee_metrics (session_id, timestamp, unique_bee_count, unique_varroa_count, infestation_ratio, frame_count, fps) VALUES (?, ?, ?, ?, ?, ?, ?)',
+        with conn:
+            cursor = conn.execute(INSERT_METRICS_SQL, row)
+            conn.executemany(UPSERT_ROLLUP_SQL, rollup_rows([row]))
+        return cursor.lastrowid
+
+    def queue_metrics(self, unique_bee_count, unique_varroa_count, frame_count, fps=None, session_id=None):
+        """Like save_metrics, but hands the row to the background writer instead of waiting for the disk"""
+        if session_id is None:
+            session_id = self.current_session_id
+        if session_id is None:
+            session_id = self.start_new_session()
+
+        infestation_ratio = (
+            unique_varroa_count / unique_bee_count if unique_bee_count > 0 else 0
+        )
+
+        self.metric_writer.start()
+        self.metric_writer.submit(
             (session_id, datetime.datetime.now(), unique_bee_count, unique_varroa_count, infestation_ratio, frame_count, fps)
         )
-        conn.commit()
-        conn.close()
-        return cursor.lastrowid
 
     def get_latest_metrics(self, limit=10, session_id=None):
         conn = self._connect()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
         if session_id:
-            cursor.execute(
-                'SELECT * FROM bee_metrics WHERE session_id = ? ORDER BY timestamp DESC LIMIT ?',
-                (session_id, limit)
-            )
+            cursor = conn.execute(SESSION_METRICS_SQL, (session_id, limit))
         else:
-            cursor.execute(
-                'SELECT * FROM bee_metrics ORDER BY timestamp DESC LIMIT ?',
-                (limit,)
-            )
-        results = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return results
+            cursor = conn.execute(LATEST_METRICS_SQL, (limit,))
+        return [dict(row) for row in cursor.fetchall()]
+
+    def choose_rollup_resolution(self, start, end, max_points):
+        """
+        Name of the finest rollup resolution that covers start..end in at most
+        `max_points` buckets, or the coarsest one if none does.
+        """
+        span = wall_clock_seconds(end) - wall_clock_seconds(start)
+        for name, resolution in ROLLUP_RESOLUTIONS.items():
+            if span / resolution <= max_points:
+                return name
+        return name
+
+    def get_rollups(self, start, end, resolution=None, max_points=500, session_id=None):
+        """
+        Aggregated metrics between two naive local datetimes, one point per
+        bucket. The resolution ("minute", "hour" or "day") is chosen from the
+        range and point budget unless given. Returns (resolution, points).
+        """
+        if resolution is None:
+            resolution = self.choose_rollup_resolution(start, end, max_points)
+        seconds = ROLLUP_RESOLUTIONS[resolution]
+        return resolution, self._rollup_points(start, end, seconds, seconds, session_id)
+
+    def _rollup_points(self, start, end, resolution, width, session_id=None):
+        # Include the bucket containing `start`
+        params = {
+            "resolution": resolution,
+            "width": width,
+            "first": wall_clock_seconds(start) // width * width,
+            "last": wall_clock_seconds(end),
+            "session_id": session_id,
+        }
+        conn = self._connect()
+        sql = ROLLUP_SESSION_RANGE_SQL if session_id else ROLLUP_RANGE_SQL
+        return self._points(conn.execute(sql, params))
+
+    def _points(self, cursor):
+        points = []
+        for row in cursor.fetchall():
+            point = dict(row)
+            point["timestamp"] = wall_clock_datetime(point.pop("bucket"))
+            points.append(point)
+        return points
+
+    def get_metric_history(self, start, end, max_points=500, session_id=None):
+        """
+        Metrics between two naive local datetimes, downsampled to at most about
+        `max_points` points. Ranges with few rows are returned as raw rows;
+        otherwise rows are averaged into equal-width buckets, read from the
+        coarsest rollup table that is still finer than the bucket width so long
+        ranges never scan bee_metrics.
+
+        Returns a dict with the resolution used ("raw", "minute", "hour" or
+        "day"), the bucket width in seconds and the points (samples, avg/min/max
+        of bees, varroa and ratio, frame count and fps per bucket).
+        """
+        max_points = max(1, max_points)
+        span = max(1, wall_clock_seconds(end) - wall_clock_seconds(start))
+        width = -(-span // max_points)  # Ceiling division
+
+        # Buckets narrower than a minute can only be computed from bee_metrics
+        usable = [(name, seconds) for name, seconds in ROLLUP_RESOLUTIONS.items() if seconds <= width]
+        if not usable:
+            params = {"start": start, "end": end, "session_id": session_id, "width": width}
+            conn = self._connect()
+            count_sql = RAW_SESSION_COUNT_SQL if session_id else RAW_COUNT_SQL
+            if conn.execute(count_sql, params).fetchone()[0] <= max_points:
+                sql = SESSION_RANGE_METRICS_SQL if session_id else RANGE_METRICS_SQL
+                rows = conn.execute(sql, params).fetchall()
+                return {"resolution": "raw", "bucket_seconds": 0, "points": [raw_point(row) for row in rows]}
+            sql = RAW_SESSION_RANGE_SQL if session_id else RAW_RANGE_SQL
+            return {"resolution": "raw", "bucket_seconds": width, "points": self._points(conn.execute(sql, params))}
+
+        name, seconds = usable[-1]
+        # Whole rollup buckets only, so no bucket is split between two points
+        width = -(-width // seconds) * seconds
+        return {
+            "resolution": name,
+            "bucket_seconds": width,
+            "points": self._rollup_points(start, end, seconds, width, session_id),
+        }
 
     def get_sessions(self, limit=10):
         conn = self._connect()
-        conn.row_factory = sqlite3.Row
-        cursor = conn.cursor()
-        cursor.execute(
-            'SELECT * FROM sessions ORDER BY start_time DESC LIMIT ?',
-            (limit,)
-        )
-        results = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return results
+        cursor = conn.execute(SESSIONS_SQL, (limit,))
+        return [dict(row) for row in cursor.fetchall()]
+
+    def get_detection_blocks(self, session_id, first_frame=0, last_frame=None):
+        """Detection log blocks of a session overlapping a frame range; decode with detection_log.decode_blocks"""
+        if last_frame is None:
+            last_frame = 2**63 - 1
+        conn = self._connect()
+        cursor = conn.execute(DETECTION_BLOCKS_SQL, (session_id, first_frame, last_frame))
+        return [dict(row) for row in cursor.fetchall()]
@@ -6,12 +6,35 @@ import numpy as np
 import cv2
 import hailo
 import time
+import atexit
 from hailo_apps_infra.hailo_rpi_common import (
     get_caps_from_pad,
     get_numpy_from_buffer,
+    get_default_parser,
     app_callback_class,
 )
+from hailo_apps_infra.gstreamer_helper_pipelines import (
+    SOURCE_PIPELINE,
+    INFERENCE_PIPELINE,
+    INFERENCE_PIPELINE_WRAPPER,
+    TRACKER_PIPELINE,
+    USER_CALLBACK_PIPELINE,
+    DISPLAY_PIPELINE,
+)
 from hailo_apps_infra.detection_pipeline import GStreamerDetectionApp
+from telemetry import FrameRecord, TelemetryWriter, TEXT_OUTPUT_ENV
+from shared_buffers import StatsRing, ControlBlock, FrameSlot, VISUALIZATION_PREVIEW, VISUALIZATION_FULL
+from track_registry import TrackRegistry
+from detection_log import DetectionLogWriter
+from multiplexed_pipeline import callback_name, multiplexed_pipeline_string
+from frame_detections import (
+    DetectionBatch,
+    BEE_CLASS,
+    VARROA_CLASS,
+    OTHER_CLASS,
+    CLASS_NAMES,
+    LABEL_TO_CLASS,
+)
 
 # -----------------------------------------------------------------------------------------------
 # CONFIGURABLE PARAMETERS - Adjust these to optimize tracking
@@ -33,24 +56,77 @@ KEEP_LOST_FRAMES = 5             # Frames to keep lost objects (5-30)
 # Detection confidence threshold
 MIN_CONFIDENCE = 0.3              # Minimum confidence to count detections (0.1-0.9)
 
+# Varroa-to-bee association
+VARROA_CONTAINMENT_THR = 0.5      # Fraction of a varroa box inside a bee box to mark that bee infested (0.3-1.0)
+
+# Overlay colours per class id
+CLASS_COLORS = {
+    BEE_CLASS: (0, 255, 0),       # Green for bees
+    VARROA_CLASS: (0, 0, 255),    # Red for varroa
+    OTHER_CLASS: (255, 255, 0),   # Yellow for other
+}
+
 # -----------------------------------------------------------------------------------------------
 # User-defined class to be used in the callback function
 # -----------------------------------------------------------------------------------------------
 # Inheritance from the app_callback_class
 class user_app_callback_class(app_callback_class):
-    def __init__(self):
+    def __init__(self, stream_index=None):
         super().__init__()
+        # Input of a multiplexed pipeline this instance counts for (None for a single input)
+        self.stream_index = stream_index
         # Add counters for bees and varroa
         self.bee_count = 0
         self.varroa_count = 0
-        # Simple unique ID tracking
-        self.unique_bee_ids = set()
-        self.unique_varroa_ids = set()
+        # Unique ID tracking with constant memory and time-windowed counts
+        self.unique_bee_tracks = TrackRegistry()
+        self.unique_varroa_tracks = TrackRegistry()
+        # Bee tracks that were seen carrying a varroa mite at least once
+        self.infested_bee_tracks = TrackRegistry()
         # Count per frame
         self.current_frame_bees = 0
         self.current_frame_varroa = 0
         # Start time for FPS calculation
         self.start_time = time.time()
+        # Preallocated arrays refilled with each frame's detections
+        self.detection_batch = DetectionBatch()
+        # Shared-memory stats ring read by app.py, with the telemetry pipe as
+        # a fallback (both are None when run standalone)
+        self.stats_ring = StatsRing.from_env(stream_index)
+        self.telemetry = TelemetryWriter.from_env(stream_index) if self.stats_ring is None else None
+        # Text output is only used for debugging or when there is no telemetry channel
+        has_channel = self.stats_ring is not None or self.telemetry is not None
+        self.text_output = not has_channel or os.environ.get(TEXT_OUTPUT_ENV, "0") == "1"
+        # Runtime settings from the dashboard (None when run standalone)
+        self.control = ControlBlock.from_env(stream_index)
+        # Shared-memory slot for the dashboard's live preview (None when run standalone)
+        self.preview_slot = FrameSlot.from_env(stream_index)
+        # Raw per-detection log, when enabled in app.py
+        self.detection_log = DetectionLogWriter.from_env(stream_index)
+        if self.detection_log is not None:
+            atexit.register(self.detection_log.close)
+        
+    def should_render_frame(self):
+        """Whether this frame should be mapped out of the buffer and annotated"""
+        if not self.use_frame:
+            return False
+        if self.control is None:
+            # Standalone runs keep the full overlay
+            return True
+        mode, preview_interval = self.control.visualization()
+        if mode == VISUALIZATION_FULL:
+            return True
+        if mode == VISUALIZATION_PREVIEW:
+            return self.get_count() % preview_interval == 0
+        # Headless
+        return False
+        
+    def publish(self, record):
+        """Hand a frame record to app.py without blocking the pipeline"""
+        if self.stats_ring is not None:
+            self.stats_ring.publish(record)
+        elif self.telemetry is not None:
+            self.telemetry.write(record)
         
     def increment_bee(self):
         self.bee_count += 1
@@ -65,21 +141,84 @@ class user_app_callback_class(app_callback_class):
         return self.varroa_count
         
     def get_unique_bee_count(self):
-        return len(self.unique_bee_ids)
+        return self.unique_bee_tracks.total
         
     def get_unique_varroa_count(self):
-        return len(self.unique_varroa_ids)
+        return self.unique_varroa_tracks.total
+        
+    def get_infested_bee_count(self):
+        return self.infested_bee_tracks.total
+        
+    def get_recent_unique_counts(self, seconds, now=None):
+        """Unique bees and varroa first seen within the last `seconds`"""
+        return (self.unique_bee_tracks.count_since(seconds, now),
+                self.unique_varroa_tracks.count_since(seconds, now))
     
     def reset_frame_counts(self):
         self.current_frame_bees = 0
         self.current_frame_varroa = 0
         
+    def add_frame_counts(self, bees, varroa):
+        self.current_frame_bees = bees
+        self.current_frame_varroa = varroa
+        self.bee_count += bees
+        self.varroa_count += varroa
+        
     def set_start_time(self, start_time):
         self.start_time = start_time
         
     def get_start_time(self):
         return self.start_time
 
+# -----------------------------------------------------------------------------------------------
+# Detection extraction and overlay helpers
+# -----------------------------------------------------------------------------------------------
+def extract_detections(detections, batch):
+    """Copy every Hailo detection into the batch arrays in a single pass"""
+    batch.reset()
+    for detection in detections:
+        bbox = detection.get_bbox()
+        # Get track ID (if available)
+        track = detection.get_objects_typed(hailo.HAILO_UNIQUE_ID)
+        track_id = track[0].get_id() if len(track) == 1 else 0
+        batch.append(
+            LABEL_TO_CLASS.get(detection.get_label(), OTHER_CLASS),
+            detection.get_confidence(),
+            bbox.xmin(), bbox.ymin(), bbox.xmax(), bbox.ymax(),
+            track_id,
+        )
+
+def draw_overlay(frame, user_data, detections, width, height):
+    """Draw the counters and bounding boxes onto the frame"""
+    # Note: using imshow will not work here, as the callback function is not running in the main thread
+    # Let's print the detection counts to the frame
+    cv2.putText(frame, f"Bees: {user_data.get_bee_count()}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    cv2.putText(frame, f"Varroa: {user_data.get_varroa_count()}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+    cv2.putText(frame, f"Unique Bees: {user_data.get_unique_bee_count()}", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
+    cv2.putText(frame, f"Unique Varroa: {user_data.get_unique_varroa_count()}", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
+    
+    # Calculate FPS
+    elapsed_time = time.time() - user_data.get_start_time()
+    if elapsed_time > 0:
+        fps = user_data.get_count() / elapsed_time
+        cv2.putText(frame, f"FPS: {fps:.1f}", (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
+    
+    # Draw bounding boxes, reusing the filtered arrays from counting
+    boxes = detections.pixel_boxes(width, height).tolist()
+    for (x1, y1, x2, y2), class_id, track_id, confidence in zip(
+            boxes, detections.class_ids.tolist(), detections.track_ids.tolist(), detections.confidences.tolist()):
+        # Different colors for different classes
+        color = CLASS_COLORS[class_id]
+        cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+        
+        # Add label text
+        label = CLASS_NAMES[class_id]
+        if track_id > 0:
+            label_text = f"{label} #{track_id}: {confidence:.2f}"
+        else:
+            label_text = f"{label}: {confidence:.2f}"
+        cv2.putText(frame, label_text, (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+
 # -----------------------------------------------------------------------------------------------
 # User-defined callback function
 # -----------------------------------------------------------------------------------------------
@@ -92,126 +231,172 @@ def app_callback(pad, info, user_data):
         return Gst.PadProbeReturn.OK
     # Using the user_data to count the number of frames
     user_data.increment()
-    string_to_print = f"Frame count: {user_data.get_count()}\n"
+    text_output = user_data.text_output
     # Get the caps from the pad
     format, width, height = get_caps_from_pad(pad)
-    # If the user_data.use_frame is set to True, we can get the video frame from the buffer
+    # Only map the video frame out of the buffer when the visualization mode asks for it
     frame = None
-    if user_data.use_frame and format is not None and width is not None and height is not None:
+    if user_data.should_render_frame() and format is not None and width is not None and height is not None:
         # Get video frame
         frame = get_numpy_from_buffer(buffer, format, width, height)
     # Get the detections from the buffer
     roi = hailo.get_roi_from_buffer(buffer)
-    detections = roi.get_objects_typed(hailo.HAILO_DETECTION)
+    extract_detections(roi.get_objects_typed(hailo.HAILO_DETECTION), user_data.detection_batch)
     
-    # Reset frame counts
-    user_data.reset_frame_counts()
+    # Skip low confidence detections; the filtered arrays are shared by counting and drawing
+    detections = user_data.detection_batch.filter(MIN_CONFIDENCE)
+    counts = detections.class_counts()
+    user_data.add_frame_counts(int(counts[BEE_CLASS]), int(counts[VARROA_CLASS]))
     
-    # Parse the detections
-    for detection in detections:
-        label = detection.get_label()
-        bbox = detection.get_bbox()
-        confidence = detection.get_confidence()
-        
-        # Skip low confidence detections
-        if confidence < MIN_CONFIDENCE:
-            continue
-        
-        # Get track ID (if available)
-        track_id = 0
-        track = detection.get_objects_typed(hailo.HAILO_UNIQUE_ID)
-        if len(track) == 1:
-            track_id = track[0].get_id()
-        
-        # Check for bee detections
-        if label == "bee":
-            user_data.increment_bee()
-            user_data.current_frame_bees += 1
-            if track_id > 0:  # Only add valid track IDs
-                user_data.unique_bee_ids.add(track_id)
-            string_to_print += (f"Label: {label} Track ID: {track_id} Confidence: {confidence:.2f}\n")
-            
-        # Check for varroa detections
-        elif label == "varroa":
-            user_data.increment_varroa()
-            user_data.current_frame_varroa += 1
-            if track_id > 0:  # Only add valid track IDs
-                user_data.unique_varroa_ids.add(track_id)
-            string_to_print += (f"Label: {label} Track ID: {track_id} Confidence: {confidence:.2f}\n")
+    # Only valid track IDs are added to the unique track registries
+    now = time.time()
+    user_data.unique_bee_tracks.add(detections.track_ids_of(BEE_CLASS), now)
+    user_data.unique_varroa_tracks.add(detections.track_ids_of(VARROA_CLASS), now)
+    # Flag bee tracks whose box contains a varroa box in this frame
+    user_data.infested_bee_tracks.add(detections.infested_bee_track_ids(VARROA_CONTAINMENT_THR), now)
+    bees_last_minute, varroa_last_minute = user_data.get_recent_unique_counts(60, now)
+    bees_last_hour, varroa_last_hour = user_data.get_recent_unique_counts(3600, now)
     
-    # Add total counts to the output
-    string_to_print += f"Current frame bees: {user_data.current_frame_bees}\n"
-    string_to_print += f"Current frame varroa: {user_data.current_frame_varroa}\n"
-    string_to_print += f"Total bees: {user_data.get_bee_count()}\n"
-    string_to_print += f"Total varroa: {user_data.get_varroa_count()}\n"
-    string_to_print += f"Unique bees: {user_data.get_unique_bee_count()}\n"
-    string_to_print += f"Unique varroa: {user_data.get_unique_varroa_count()}\n"
-            
-    if user_data.use_frame:
-        # Note: using imshow will not work here, as the callback function is not running in the main thread
-        # Let's print the detection counts to the frame
-        cv2.putText(frame, f"Bees: {user_data.get_bee_count()}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        cv2.putText(frame, f"Varroa: {user_data.get_varroa_count()}", (10, 60), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        cv2.putText(frame, f"Unique Bees: {user_data.get_unique_bee_count()}", (10, 90), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 255, 0), 2)
-        cv2.putText(frame, f"Unique Varroa: {user_data.get_unique_varroa_count()}", (10, 120), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 255), 2)
-        
-        # Calculate FPS
-        elapsed_time = time.time() - user_data.get_start_time()
-        if elapsed_time > 0:
-            fps = user_data.get_count() / elapsed_time
-            cv2.putText(frame, f"FPS: {fps:.1f}", (10, 150), cv2.FONT_HERSHEY_SIMPLEX, 1, (255, 255, 0), 2)
-        
-        # Draw bounding boxes
-        for detection in detections:
-            label = detection.get_label()
-            bbox = detection.get_bbox()
-            confidence = detection.get_confidence()
-            
-            # Skip low confidence detections for visualization
-            if confidence < MIN_CONFIDENCE:
-                continue
-            
-            x1, y1, x2, y2 = int(bbox.xmin() * width), int(bbox.ymin() * height), int(bbox.xmax() * width), int(bbox.ymax() * height)
-            
-            # Different colors for different classes
-            if label == "bee":
-                color = (0, 255, 0)  # Green for bees
-            elif label == "varroa":
-                color = (0, 0, 255)  # Red for varroa
-            else:
-                color = (255, 255, 0)  # Yellow for other
-                
-            # Draw rectangle
-            cv2.rectangle(frame, (x1, y1), (x2, y2), color, 2)
+    # Publish the per-frame record to app.py
+    user_data.publish(FrameRecord(
+        frame=user_data.get_count(),
+        timestamp=now,
+        current_bees=user_data.current_frame_bees,
+        current_varroa=user_data.current_frame_varroa,
+        total_bees=user_data.get_bee_count(),
+        total_varroa=user_data.get_varroa_count(),
+        unique_bees=user_data.get_unique_bee_count(),
+        unique_varroa=user_data.get_unique_varroa_count(),
+        bees_last_minute=bees_last_minute,
+        varroa_last_minute=varroa_last_minute,
+        bees_last_hour=bees_last_hour,
+        varroa_last_hour=varroa_last_hour,
+        infested_bees=user_data.get_infested_bee_count(),
+    ))
+    
+    if user_data.detection_log is not None:
+        user_data.detection_log.add_frame(user_data.get_count(), now, detections)
+    
+    if text_output:
+        string_to_print = f"Frame count: {user_data.get_count()}\n"
+        if user_data.stream_index is not None:
+            string_to_print = f"Stream {user_data.stream_index} " + string_to_print
+        for class_id, track_id, confidence in zip(
+                detections.class_ids.tolist(), detections.track_ids.tolist(), detections.confidences.tolist()):
+            if class_id != OTHER_CLASS:
+                string_to_print += f"Label: {CLASS_NAMES[class_id]} Track ID: {track_id} Confidence: {confidence:.2f}\n"
+        string_to_print += f"Current frame bees: {user_data.current_frame_bees}\n"
+        string_to_print += f"Current frame varroa: {user_data.current_frame_varroa}\n"
+        string_to_print += f"Total bees: {user_data.get_bee_count()}\n"
+        string_to_print += f"Total varroa: {user_data.get_varroa_count()}\n"
+        string_to_print += f"Unique bees: {user_data.get_unique_bee_count()}\n"
+        string_to_print += f"Unique varroa: {user_data.get_unique_varroa_count()}\n"
+        string_to_print += f"Infested bees: {user_data.get_infested_bee_count()}\n"
+        print(string_to_print)
             
-            # Add label text
-            track_id = 0
-            track = detection.get_objects_typed(hailo.HAILO_UNIQUE_ID)
-            if len(track) == 1:
-                track_id = track[0].get_id()
-                
-            if track_id > 0:
-                label_text = f"{label} #{track_id}: {confidence:.2f}"
-            else:
-                label_text = f"{label}: {confidence:.2f}"
-                
-            cv2.putText(frame, label_text, (x1, y1-10), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 2)
+    if frame is not None:
+        draw_overlay(frame, user_data, detections, width, height)
         
         # Convert the frame to BGR
         frame = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
         user_data.set_frame(frame)
         
-    print(string_to_print)
+        # Hand a reduced-resolution copy to the dashboard preview; encoding happens in app.py
+        slot = user_data.preview_slot
+        if slot is not None:
+            slot.write(cv2.resize(frame, (slot.width, slot.height), interpolation=cv2.INTER_AREA))
+        
     return Gst.PadProbeReturn.OK
 
+# -----------------------------------------------------------------------------------------------
+# Several inputs sharing one inference stage
+# -----------------------------------------------------------------------------------------------
+class MultiplexedDetectionApp(GStreamerDetectionApp):
+    """Runs every input through one hailonet and hailotracker, counting each input separately"""
+    
+    def __init__(self, app_callback, stream_data, parser):
+        # Needed by get_pipeline_string, which the base class calls while constructing
+        self.stream_data = stream_data
+        super().__init__(app_callback, stream_data[0], parser)
+        for data in stream_data[1:]:
+            data.use_frame = stream_data[0].use_frame
+    
+    def video_sources(self):
+        return [self.video_source] + self.options_menu.extra_input
+    
+    def get_pipeline_string(self):
+        sources = self.video_sources()
+        benchmark = self.options_menu.benchmark
+        source_pipelines = [
+            SOURCE_PIPELINE(source, self.video_width, self.video_height, name=f"source_{i}")
+            for i, source in enumerate(sources)
+        ]
+        detection_pipeline = INFERENCE_PIPELINE(
+            hef_path=self.hef_path,
+            post_process_so=self.post_process_so,
+            post_function_name=self.post_function_name,
+            # Every batch carries one frame per input
+            batch_size=len(sources),
+            config_json=self.labels_json,
+            additional_params=self.thresholds_str)
+        branch_pipelines = [
+            f"{USER_CALLBACK_PIPELINE(name=callback_name(i))} ! " +
+            DISPLAY_PIPELINE(video_sink="fakesink" if benchmark else self.video_sink,
+                             sync="false" if benchmark else self.sync,
+                             show_fps=self.show_fps, name=f"hailo_display_{i}")
+            for i in range(len(sources))
+        ]
+        return multiplexed_pipeline_string(
+            source_pipelines,
+            INFERENCE_PIPELINE_WRAPPER(detection_pipeline),
+            TRACKER_PIPELINE(class_id=1),
+            branch_pipelines)
+    
+    def run(self):
+        # GStreamerApp attaches the callback of stream 0; every other branch gets its own counters
+        if not self.options_menu.disable_callback:
+            for index, data in enumerate(self.stream_data[1:], start=1):
+                identity = self.pipeline.get_by_name(callback_name(index))
+                identity.get_static_pad("src").add_probe(Gst.PadProbeType.BUFFER, self.app_callback, data)
+        super().run()
+
+def print_throughput(stream_data, sources):
+    """Frames and FPS of every input and of the whole pipeline"""
+    total_frames = 0
+    total_fps = 0
+    for data, source in zip(stream_data, sources):
+        elapsed = time.time() - data.get_start_time()
+        fps = data.get_count() / elapsed if elapsed > 0 else 0
+        total_frames += data.get_count()
+        total_fps += fps
+        print(f"Stream {data.stream_index} ({source}): {data.get_count()} frames, {fps:.1f} FPS")
+    print(f"All streams: {total_frames} frames, {total_fps:.1f} FPS")
+
 if __name__ == "__main__":
-    # Create an instance of the user app callback class
-    user_data = user_app_callback_class()
-    # Store start time for FPS calculation
-    user_data.set_start_time(time.time())
+    parser = get_default_parser()
+    parser.add_argument("--extra-input", action="append", default=[],
+                        help="Another camera or video file run through the same inference stage (repeatable)")
+    parser.add_argument("--benchmark", action="store_true",
+                        help="Discard output frames, ignore the clock and print per-input FPS at exit; "
+                             "with video files this measures throughput without cameras")
+    args, _ = parser.parse_known_args()
     
-    # Create the app
-    app = GStreamerDetectionApp(app_callback, user_data)
+    if args.extra_input or args.benchmark:
+        # One set of counters per input, each publishing to its own channels
+        stream_data = [user_app_callback_class(stream_index=i) for i in range(1 + len(args.extra_input))]
+        for data in stream_data:
+            data.set_start_time(time.time())
+        app = MultiplexedDetectionApp(app_callback, stream_data, parser)
+        if args.benchmark:
+            atexit.register(print_throughput, stream_data, app.video_sources())
+    else:
+        # Create an instance of the user app callback class
+        user_data = user_app_callback_class()
+        # Store start time for FPS calculation
+        user_data.set_start_time(time.time())
+        
+        # Create the app
+        app = GStreamerDetectionApp(app_callback, user_data, parser)
     
     # Configure the tracker to track based on settings
     hailotracker = app.pipeline.get_by_name("hailo_tracker")
@@ -0,0 +1,218 @@
+"""
+Optional per-detection log written by the detection process.
+
+Every confidence-filtered detection of a frame (frame number, track id,
+class, confidence, box) is appended to column arrays. Every FRAMES_PER_BLOCK
+frames the columns are packed into one zlib-compressed blob and stored as a
+single row of the detection_blocks table, keyed by the session id app.py
+started for the run.
+
+Packed columns take 16 bytes per detection before compression:
+frame offset (uint16), track id (uint32), class id (uint8), confidence
+(uint8, 1/255 steps) and box (4 x uint16, 1/65535 steps). With ten
+detections per frame at 30 FPS a day of capture is about 400 MB raw and
+typically well under half of that compressed.
+"""
+import os
+import queue
+import sqlite3
+import threading
+import zlib
+import numpy as np
+from telemetry import stream_env
+
+# Environment variables naming the database and session to log into
+DETECTION_LOG_DB_ENV = "BEE_DETECTION_LOG_DB"
+DETECTION_LOG_SESSION_ENV = "BEE_DETECTION_LOG_SESSION"
+
+# Frames per stored block (10 seconds at 30 FPS); offsets are stored as uint16
+FRAMES_PER_BLOCK = 300
+# Blocks waiting for the writer thread before new ones are dropped
+MAX_PENDING_BLOCKS = 8
+# zlib level; 1 is several times faster than the default at a similar ratio for this data
+COMPRESSION_LEVEL = 1
+
+BLOCK_FORMAT_VERSION = 1
+
+# Column layout of a packed block, in storage order
+_COLUMNS = (
+    ("frame_offsets", np.dtype("<u2"), 1),
+    ("track_ids", np.dtype("<u4"), 1),
+    ("class_ids", np.dtype("u1"), 1),
+    ("confidences", np.dtype("u1"), 1),
+    ("boxes", np.dtype("<u2"), 4),
+)
+
+INSERT_BLOCK_SQL = 'INSERT INTO detection_blocks (session_id, first_frame, last_frame, start_time, end_time, detection_count, format_version, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?)'
+
+def encode_block(frame_offsets, track_ids, class_ids, confidences, boxes):
+    """Pack detection columns into a compressed blob"""
+    columns = (
+        np.asarray(frame_offsets, dtype="<u2"),
+        np.asarray(track_ids, dtype="<u4"),
+        np.asarray(class_ids, dtype="u1"),
+        np.round(np.asarray(confidences) * 255).astype("u1"),
+        np.round(np.clip(boxes, 0.0, 1.0) * 65535).astype("<u2"),
+    )
+    return zlib.compress(b"".join(column.tobytes() for column in columns), COMPRESSION_LEVEL)
+
+def decode_block(data, count, first_frame=0):
+    """
+    Unpack a blob of `count` detections into a dict of arrays: frames,
+    track_ids, class_ids, confidences (float32) and boxes (float32 (n, 4)).
+    """
+    raw = zlib.decompress(data)
+    columns = {}
+    offset = 0
+    for name, dtype, width in _COLUMNS:
+        size = count * width * dtype.itemsize
+        column = np.frombuffer(raw, dtype=dtype, count=count * width, offset=offset)
+        columns[name] = column.reshape(count, width) if width > 1 else column
+        offset += size
+    return {
+        "frames": columns["frame_offsets"].astype(np.int64) + first_frame,
+        "track_ids": columns["track_ids"].astype(np.int64),
+        "class_ids": columns["class_ids"].astype(np.int8),
+        "confidences": columns["confidences"].astype(np.float32) / 255,
+        "boxes": columns["boxes"].astype(np.float32) / 65535,
+    }
+
+def decode_blocks(rows):
+    """Concatenate decoded detection_blocks rows (as returned by BeeHealthDatabase.get_detection_blocks)"""
+    blocks = [decode_block(row["data"], row["detection_count"], row["first_frame"]) for row in rows]
+    if not blocks:
+        return {
+            "frames": np.empty(0, dtype=np.int64),
+            "track_ids": np.empty(0, dtype=np.int64),
+            "class_ids": np.empty(0, dtype=np.int8),
+            "confidences": np.empty(0, dtype=np.float32),
+            "boxes": np.empty((0, 4), dtype=np.float32),
+        }
+    return {key: np.concatenate([block[key] for block in blocks]) for key in blocks[0]}
+
+class DetectionLogBuffer:
+    """Column arrays collecting the detections of the current block"""
+
+    def __init__(self, capacity=FRAMES_PER_BLOCK * 16):
+        self._allocate(capacity)
+        self.reset()
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.frame_offsets = np.empty(capacity, dtype="<u2")
+        self.track_ids = np.empty(capacity, dtype="<u4")
+        self.class_ids = np.empty(capacity, dtype="u1")
+        self.confidences = np.empty(capacity, dtype=np.float32)
+        self.boxes = np.empty((capacity, 4), dtype=np.float32)
+
+    def reset(self):
+        self.count = 0
+        self.frames = 0
+        self.first_frame = None
+        self.last_frame = None
+        self.start_time = None
+        self.end_time = None
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        old = (self.frame_offsets, self.track_ids, self.class_ids, self.confidences, self.boxes)
+        self._allocate(capacity)
+        for new, previous in zip((self.frame_offsets, self.track_ids, self.class_ids, self.confidences, self.boxes), old):
+            new[:self.count] = previous[:self.count]
+
+    def add_frame(self, frame, timestamp, detections):
+        """Append the detections of one frame (a FrameDetections)"""
+        if self.first_frame is None:
+            self.first_frame = frame
+            self.start_time = timestamp
+        self.last_frame = frame
+        self.end_time = timestamp
+        self.frames += 1
+
+        n = len(detections)
+        end = self.count + n
+        if end > self.capacity:
+            self._grow(end)
+        self.frame_offsets[self.count:end] = frame - self.first_frame
+        self.track_ids[self.count:end] = detections.track_ids
+        self.class_ids[self.count:end] = detections.class_ids
+        self.confidences[self.count:end] = detections.confidences
+        self.boxes[self.count:end] = detections.boxes
+        self.count = end
+
+    def take_block(self, session_id):
+        """Encode the collected detections as a detection_blocks row and start a new block"""
+        n = self.count
+        row = (
+            session_id, self.first_frame, self.last_frame, self.start_time, self.end_time, n,
+            BLOCK_FORMAT_VERSION,
+            encode_block(self.frame_offsets[:n], self.track_ids[:n], self.class_ids[:n],
+                         self.confidences[:n], self.boxes[:n]),
+        )
+        self.reset()
+        return row
+
+class DetectionLogWriter:
+    """Collects detections in the callback and stores full blocks from a background thread"""
+
+    def __init__(self, db_path, session_id, frames_per_block=FRAMES_PER_BLOCK):
+        self.db_path = db_path
+        self.session_id = session_id
+        self.frames_per_block = frames_per_block
+        self.buffer = DetectionLogBuffer()
+        self.blocks = queue.Queue(maxsize=MAX_PENDING_BLOCKS)
+        self.dropped_blocks = 0
+        self.thread = threading.Thread(target=self._run, name="detection-log", daemon=True)
+        self.thread.start()
+
+    @classmethod
+    def from_env(cls, stream_index=None):
+        """Create a writer if app.py enabled the detection log, otherwise None"""
+        db_path = os.environ.get(DETECTION_LOG_DB_ENV)
+        # Every input of a multiplexed detector logs into its own session
+        session_id = os.environ.get(stream_env(DETECTION_LOG_SESSION_ENV, stream_index))
+        if not db_path or not session_id:
+            return None
+        return cls(db_path, int(session_id))
+
+    def add_frame(self, frame, timestamp, detections):
+        """Record one frame; hands the block to the writer thread once it is full"""
+        self.buffer.add_frame(frame, timestamp, detections)
+        if self.buffer.frames >= self.frames_per_block:
+            self._submit()
+
+    def _submit(self):
+        # Compress here; SQLite I/O happens on the writer thread
+        row = self.buffer.take_block(self.session_id)
+        try:
+            self.blocks.put_nowait(row)
+        except queue.Full:
+            # The disk cannot keep up; never stall the pipeline for the log
+            self.dropped_blocks += 1
+
+    def close(self, timeout=5.0):
+        """Store the partial block and wait for the writer thread to finish"""
+        if self.buffer.frames:
+            self._submit()
+        self.blocks.put(None)
+        self.thread.join(timeout=timeout)
+
+    def _run(self):
+        conn = sqlite3.connect(self.db_path)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=5000")
+        try:
+            while True:
+                row = self.blocks.get()
+                if row is None:
+                    return
+                try:
+                    with conn:
+                        conn.execute(INSERT_BLOCK_SQL, row)
+                except sqlite3.Error as e:
+                    print(f"Error writing detection log block: {e}")
+        finally:
+            conn.close()
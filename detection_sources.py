@@ -0,0 +1,132 @@
+"""
+Detection sources: one detector process per camera or hive.
+
+A source owns everything its detector feeds: statistics, the chart time
+series, its own Server-Sent Events broadcaster and preview stream, and the
+process and shared-memory segments of the running detector. app.py reads
+every source on its own thread, so a detector that stalls or floods its
+ring only delays its own counters, never those of the other cameras.
+"""
+import shlex
+import time
+from live_stream import EventBroadcaster
+from time_series import TimeSeriesBuffer
+
+# Counters that add up across sources
+SUMMED_FIELDS = (
+    "total_frames",
+    "total_bees",
+    "total_varroa",
+    "unique_bees",
+    "unique_varroa",
+    "current_bees",
+    "current_varroa",
+    "fps",
+    "bees_last_minute",
+    "varroa_last_minute",
+    "bees_last_hour",
+    "varroa_last_hour",
+    "infested_bees",
+)
+
+# Ratios recomputed from the summed counters: field -> (numerator, denominator)
+RATIO_FIELDS = {
+    "infestation_ratio": ("unique_varroa", "unique_bees"),
+    "infestation_ratio_last_minute": ("varroa_last_minute", "bees_last_minute"),
+    "infestation_ratio_last_hour": ("varroa_last_hour", "bees_last_hour"),
+    "infested_bee_ratio": ("infested_bees", "unique_bees"),
+}
+
+# Colony health levels from best to worst
+RISK_ORDER = ("Unknown", "Low", "Moderate", "High", "Critical")
+
+def new_detection_stats():
+    """Statistics of a source before its detector has reported anything"""
+    return {
+        "total_frames": 0,
+        "total_bees": 0,
+        "total_varroa": 0,
+        "unique_bees": 0,
+        "unique_varroa": 0,
+        "current_bees": 0,
+        "current_varroa": 0,
+        "fps": 0,
+        "infestation_ratio": 0,
+        "infestation_risk_level": "Unknown",
+        # Unique objects first seen in the recent past, for rolling infestation ratios
+        "bees_last_minute": 0,
+        "varroa_last_minute": 0,
+        "bees_last_hour": 0,
+        "varroa_last_hour": 0,
+        "infestation_ratio_last_minute": 0,
+        "infestation_ratio_last_hour": 0,
+        # Unique bees seen carrying a mite, and their share of all unique bees
+        "infested_bees": 0,
+        "infested_bee_ratio": 0,
+        "last_update": time.time()
+    }
+
+def input_argument(command):
+    """Input (camera device or video file) of a detection command, recorded as the session source"""
+    args = shlex.split(command)
+    for option, value in zip(args, args[1:]):
+        if option in ("-i", "--input"):
+            return value
+    return command
+
+def aggregate_stats(stats_list):
+    """
+    Combine the statistics of several sources into one apiary-wide view.
+    Counters and FPS are summed, ratios are recomputed from the summed
+    counters, and the risk level is the worst of any single source so one
+    infested hive is not hidden by healthy ones.
+    """
+    combined = {field: sum(stats.get(field, 0) for stats in stats_list) for field in SUMMED_FIELDS}
+    for field, (numerator, denominator) in RATIO_FIELDS.items():
+        count = combined[denominator]
+        combined[field] = combined[numerator] / count if count > 0 else 0
+    levels = [stats.get("infestation_risk_level", "Unknown") for stats in stats_list]
+    combined["infestation_risk_level"] = max(levels, key=RISK_ORDER.index, default="Unknown")
+    return combined
+
+class DetectionSource:
+    """One camera, its detector process and everything derived from its output"""
+
+    def __init__(self, source_id, command, time_series_capacity, preview_stream=None):
+        self.source_id = source_id
+        self.command = command
+        self.input = input_argument(command)
+        self.stats = new_detection_stats()
+        self.time_series = TimeSeriesBuffer(time_series_capacity)
+        self.events = EventBroadcaster()
+        self.preview_stream = preview_stream
+        self.last_published_stats = {}
+        self.last_stats_publish_time = 0
+
+        # Set while the detector runs
+        self.active = False
+        self.thread = None
+        self.process = None
+        self.session_id = None
+        self.stats_ring = None  # Shared-memory ring the detector publishes frame records into
+        self.control = None  # Shared-memory block with runtime settings for the detector
+        self.preview_slot = None  # Shared-memory slot the detector writes preview frames into
+
+    def reset_stats(self):
+        """Zero the statistics for a new session; the stats dict itself is kept"""
+        self.stats.update(new_detection_stats())
+        self.stats["last_frame"] = 0
+
+    def status(self):
+        """Summary of the source for listings"""
+        process = self.process
+        return {
+            "id": self.source_id,
+            "input": self.input,
+            "active": self.active,
+            "session_id": self.session_id,
+            "pid": process.pid if process is not None else None,
+            "total_frames": self.stats["total_frames"],
+            "fps": self.stats["fps"],
+            "infestation_risk_level": self.stats["infestation_risk_level"],
+        }
@@ -3,8 +3,161 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 import datetime
 import os
-import sqlite3
 import socket  # For timeout handling
+import threading
+import time
+import functools
+import jinja2
+import markupsafe
+
+# Seconds an idle SMTP connection is kept open for further messages
+SMTP_IDLE_TIMEOUT = 60
+
+# Email templates, relative to this file
+EMAIL_TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates", "email")
+
+# Risk levels by overall infestation ratio: (upper bound, level, colour)
+RISK_LEVELS = (
+    (0.05, "Low", "#28a745"),       # green
+    (0.10, "Moderate", "#ffc107"),  # yellow
+    (0.15, "High", "#fd7e14"),      # orange
+)
+CRITICAL_RISK = ("Critical", "#dc3545")  # red
+
+@functools.lru_cache(maxsize=None)
+def _templates():
+    """Email templates, compiled once"""
+    env = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(EMAIL_TEMPLATE_DIR),
+        autoescape=jinja2.select_autoescape(["html"]),
+        trim_blocks=True,
+        lstrip_blocks=True,
+    )
+    return {
+        "head": env.get_template("_head.html"),
+        "html": env.get_template("summary.html"),
+        "text": env.get_template("summary.txt"),
+    }
+
+@functools.lru_cache(maxsize=None)
+def _static_head():
+    """The page head with its CSS never changes, so it is rendered a single time"""
+    return markupsafe.Markup(_templates()["head"].render())
+
+def risk_level(overall_ratio):
+    """Return (level, colour) for an overall infestation ratio"""
+    for upper_bound, level, color in RISK_LEVELS:
+        if overall_ratio < upper_bound:
+            return level, color
+    return CRITICAL_RISK
+
+def format_duration(session):
+    """Session duration without microseconds, or why it is unavailable"""
+    if not (session['end_time'] and session['start_time']):
+        return "Session not completed"
+    try:
+        duration = _as_datetime(session['end_time']) - _as_datetime(session['start_time'])
+    except ValueError:
+        return "Unknown"
+    return str(duration).split('.')[0]  # Remove microseconds
+
+def session_report(data):
+    """Values shared by the HTML and plain text renderings of a session summary"""
+    level, color = risk_level(data['overall_ratio'])
+    return {
+        "data": data,
+        "risk_level": level,
+        "risk_color": color,
+        "duration": format_duration(data['session']),
+    }
+
+def _as_datetime(value):
+    """Session times are datetimes when read with the database converters, ISO strings otherwise"""
+    if isinstance(value, datetime.datetime):
+        return value
+    return datetime.datetime.fromisoformat(value)
+
+class SMTPSession:
+    """
+    Keeps one logged-in SMTP connection open between messages, so several
+    queued emails cost a single TLS handshake and login. The connection is
+    closed once it has been idle for `idle_timeout` seconds.
+    """
+    
+    def __init__(self, service, idle_timeout=SMTP_IDLE_TIMEOUT):
+        self.service = service
+        self.idle_timeout = idle_timeout
+        self.server = None
+        self.last_used = 0.0
+        self.connections = 0  # Logins performed, for diagnostics
+        self.lock = threading.Lock()
+    
+    def _connect(self):
+        service = self.service
+        print(f"Connecting to SMTP server {service.smtp_server}:{service.smtp_port}...")
+        server = smtplib.SMTP(service.smtp_server, service.smtp_port, timeout=service.connect_timeout)
+        try:
+            # Per-connection timeout, so other sockets in the process are unaffected
+            server.sock.settimeout(service.socket_timeout)
+            if service.smtp_debug:
+                server.set_debuglevel(1)
+            
+            if service.use_tls:
+                print("Starting TLS...")
+                server.starttls()
+            
+            print("Logging in...")
+            server.login(service.username, service.password)
+        except Exception:
+            server.close()
+            raise
+        self.connections += 1
+        return server
+    
+    def send(self, msg):
+        """Send a message, reconnecting once if a kept-alive connection was dropped by the server"""
+        with self.lock:
+            self._close_if_idle_locked(time.time())
+            reused = self.server is not None
+            if not reused:
+                self.server = self._connect()
+            try:
+                self.server.sendmail(self.service.username, self.service.recipient, msg.as_string())
+            except (smtplib.SMTPServerDisconnected, ConnectionError):
+                self._close_locked()
+                if not reused:
+                    raise
+                self.server = self._connect()
+                self.server.sendmail(self.service.username, self.service.recipient, msg.as_string())
+            self.last_used = time.time()
+    
+    def close_if_idle(self, now=None):
+        """Close the connection if it was not used for `idle_timeout` seconds"""
+        with self.lock:
+            self._close_if_idle_locked(time.time() if now is None else now)
+    
+    def idle_deadline(self):
+        """When the open connection will be closed, or None if there is none"""
+        with self.lock:
+            return None if self.server is None else self.last_used + self.idle_timeout
+    
+    def close(self):
+        with self.lock:
+            self._close_locked()
+    
+    def _close_if_idle_locked(self, now):
+        if self.server is not None and now - self.last_used >= self.idle_timeout:
+            self._close_locked()
+    
+    def _close_locked(self):
+        if self.server is None:
+            return
+        server, self.server = self.server, None
+        try:
+            print("Quitting SMTP server...")
+            server.quit()
+        except (smtplib.SMTPException, OSError):
+            server.close()
 
 class EmailService:
     def __init__(self):
@@ -27,33 +180,66 @@ class EmailService:
         self.connect_timeout = 10  # seconds
         self.socket_timeout = 15  # seconds
         
-    def send_session_summary(self, session_id, db_path):
-        """Send a summary email for a specific session"""
-        # Skip if credentials missing
-        if not self.username or not self.password:
-            print("Email not sent: Missing email credentials")
-            print(f"Username available: {'Yes' if self.username else 'No'}, "
-                  f"Password available: {'Yes' if self.password else 'No'}")
-            return False
+        # STARTTLS is required by the default server; plain connections are only for local test servers
+        self.use_tls = True
+        # Print the SMTP conversation (debug only)
+        self.smtp_debug = False
+        
+        # Error of the last failed send, recorded in the email outbox
+        self.last_error = None
+        
+        # Logged-in connection reused by consecutive sends
+        self.smtp = SMTPSession(self)
         
-        # Print recipient for debugging
-        print(f"Attempting to send email to: {self.recipient}")
+    def send_session_summary(self, session_id, session_data):
+        """Send a summary email for a session, given BeeHealthDatabase.get_session_summary(session_id)"""
+        self.last_error = None
+        if not self._has_credentials():
+            return False
         
-        # Get session data
-        session_data = self._get_session_data(session_id, db_path)
         if not session_data:
+            self.last_error = f"Session {session_id} not found"
             print(f"Email not sent: Could not retrieve data for session {session_id}")
             return False
         
-        # Format email content
         subject = f"Bee Colony Health Monitor - Session Summary #{session_id}"
         html_content = self._format_email_content(session_data)
         text_content = self._format_plain_text_content(session_data)
+        return self._send(subject, text_content, html_content)
+    
+    def send_digest(self, summaries):
+        """Send one email summarizing several sessions (a list of get_session_summary results)"""
+        self.last_error = None
+        if not self._has_credentials():
+            return False
+        summaries = [data for data in summaries if data]
+        if not summaries:
+            self.last_error = "No sessions to summarize"
+            return False
         
-        # Send email
+        session_ids = ", ".join(f"#{data['session']['session_id']}" for data in summaries)
+        subject = f"Bee Colony Health Monitor - Digest of {len(summaries)} sessions ({session_ids})"
+        html_content = self._format_email_content(*summaries)
+        text_content = "\n\n".join(self._format_plain_text_content(data) for data in summaries)
+        return self._send(subject, text_content, html_content)
+    
+    def close(self):
+        """Close the kept-alive SMTP connection, if any"""
+        self.smtp.close()
+    
+    def _has_credentials(self):
+        # Skip if credentials missing
+        if not self.username or not self.password:
+            self.last_error = "Missing email credentials"
+            print("Email not sent: Missing email credentials")
+            print(f"Username available: {'Yes' if self.username else 'No'}, "
+                  f"Password available: {'Yes' if self.password else 'No'}")
+            return False
+        return True
+    
+    def _send(self, subject, text_content, html_content):
+        """Send a message over the shared SMTP session; returns False on failure"""
         try:
-            print(f"Creating email message for session {session_id}...")
-            
             # Create message
             msg = MIMEMultipart('alternative')
             msg['Subject'] = subject
@@ -66,31 +252,14 @@ class EmailService:
             msg.attach(part1)
             msg.attach(part2)
             
-            print(f"Connecting to SMTP server {self.smtp_server}:{self.smtp_port}...")
-            
-            # Set socket timeout
-            socket.setdefaulttimeout(self.socket_timeout)
-            
-            # Connect to server and send
-            server = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.connect_timeout)
-            server.set_debuglevel(1)  # Enable SMTP debugging
-            
-            print("Starting TLS...")
-            server.starttls()
-            
-            print("Logging in...")
-            server.login(self.username, self.password)
-            
             print(f"Sending email from {self.username} to {self.recipient}...")
-            server.sendmail(self.username, self.recipient, msg.as_string())
-            
-            print("Quitting SMTP server...")
-            server.quit()
+            self.smtp.send(msg)
             
-            print(f"Session summary email sent to {self.recipient}")
+            print(f"Email '{subject}' sent to {self.recipient}")
             return True
             
         except Exception as e:
+            self.last_error = f"{type(e).__name__}: {e}"
             print(f"Failed to send email: {e}")
             print(f"Error type: {type(e).__name__}")
             # For certain errors, provide more specific debug info
@@ -101,263 +270,16 @@ class EmailService:
             elif isinstance(e, ConnectionRefusedError):
                 print(f"Connection refused. Check if the SMTP server is reachable.")
             return False
-            
-    def _get_session_data(self, session_id, db_path):
-        """Retrieve session data from the database"""
-        try:
-            print(f"Retrieving session data for session {session_id} from {db_path}")
-            conn = sqlite3.connect(db_path)
-            conn.row_factory = sqlite3.Row
-            cursor = conn.cursor()
-            
-            # Get session info
-            cursor.execute(
-                'SELECT * FROM sessions WHERE session_id = ?',
-                (session_id,)
-            )
-            session = cursor.fetchone()
-            if not session:
-                print(f"Session {session_id} not found in database")
-                return None
-                
-            # Get metrics for this session
-            cursor.execute(
-                '''SELECT * FROM bee_metrics 
-                WHERE session_id = ? 
-                ORDER BY timestamp DESC''',
-                (session_id,)
-            )
-            metrics = cursor.fetchall()
-            print(f"Found {len(metrics)} metrics for session {session_id}")
-            
-            # Calculate summary statistics
-            bee_counts = [m['unique_bee_count'] for m in metrics]
-            varroa_counts = [m['unique_varroa_count'] for m in metrics]
-            ratios = [m['infestation_ratio'] for m in metrics]
-            
-            # Calculate total unique bees and varroa for the entire session
-            total_unique_bees = max(bee_counts) if bee_counts else 0
-            total_unique_varroa = max(varroa_counts) if varroa_counts else 0
-            
-            # Calculate overall infestation ratio
-            overall_ratio = total_unique_varroa / total_unique_bees if total_unique_bees > 0 else 0
-            
-            summary = {
-                'session': dict(session),
-                'metrics_count': len(metrics),
-                # Keep traditional stats for backward compatibility
-                'bee_stats': {
-                    'max': max(bee_counts) if bee_counts else 0,
-                    'min': min(bee_counts) if bee_counts else 0,
-                    'avg': sum(bee_counts) / len(bee_counts) if bee_counts else 0
-                },
-                'varroa_stats': {
-                    'max': max(varroa_counts) if varroa_counts else 0,
-                    'min': min(varroa_counts) if varroa_counts else 0,
-                    'avg': sum(varroa_counts) / len(varroa_counts) if varroa_counts else 0
-                },
-                'ratio_stats': {
-                    'max': max(ratios) if ratios else 0,
-                    'min': min(ratios) if ratios else 0,
-                    'avg': sum(ratios) / len(ratios) if ratios else 0
-                },
-                # New simplified totals
-                'total_unique_bees': total_unique_bees,
-                'total_unique_varroa': total_unique_varroa,
-                'overall_ratio': overall_ratio,
-                'latest_metrics': [dict(m) for m in metrics[:10]]  # Include last 10 metrics
-            }
-            
-            conn.close()
-            return summary
-            
-        except Exception as e:
-            print(f"Error retrieving session data: {e}")
-            return None
     
-    def _format_email_content(self, data):
-        """Format the email content as HTML"""
-        session = data['session']
-        
-        # Determine risk level based on overall infestation ratio
-        overall_ratio = data['overall_ratio']
-        if overall_ratio < 0.05:
-            risk_level = "Low"
-            risk_color = "#28a745"  # green
-        elif overall_ratio < 0.10:
-            risk_level = "Moderate"
-            risk_color = "#ffc107"  # yellow
-        elif overall_ratio < 0.15:
-            risk_level = "High"
-            risk_color = "#fd7e14"  # orange
-        else:
-            risk_level = "Critical"
-            risk_color = "#dc3545"  # red
-        
-        # Format duration
-        if session['end_time'] and session['start_time']:
-            try:
-                start = datetime.datetime.fromisoformat(session['start_time'])
-                end = datetime.datetime.fromisoformat(session['end_time'])
-                duration = end - start
-                duration_str = str(duration).split('.')[0]  # Remove microseconds
-            except ValueError:
-                duration_str = "Unknown"
-        else:
-            duration_str = "Session not completed"
-        
-        # Create HTML content
-        html = f"""
-        <html>
-        <head>
-            <style>
-                body {{ font-family: Arial, sans-serif; line-height: 1.6; color: #333; max-width: 800px; margin: 0 auto; }}
-                .header {{ background-color: #f8f9fa; padding: 20px; border-bottom: 4px solid #ffc107; margin-bottom: 20px; }}
-                h1, h2, h3 {{ margin-top: 0; }}
-                h1 {{ color: #212529; }}
-                h2 {{ color: #495057; border-bottom: 1px solid #e9ecef; padding-bottom: 10px; margin-top: 30px; }}
-                .summary-box {{ background-color: #f8f9fb; border-left: 4px solid {risk_color}; padding: 15px; margin-bottom: 20px; }}
-                .summary-box h3 {{ margin-top: 0; color: {risk_color}; }}
-                table {{ border-collapse: collapse; width: 100%; margin-bottom: 20px; }}
-                th, td {{ text-align: left; padding: 12px; }}
-                th {{ background-color: #f8f9fa; }}
-                tr:nth-child(even) {{ background-color: #f8f9fb; }}
-                .risk-badge {{ display: inline-block; padding: 5px 10px; background-color: {risk_color}; color: white; border-radius: 4px; font-weight: bold; }}
-                .footer {{ margin-top: 30px; padding-top: 15px; border-top: 1px solid #e9ecef; font-size: 0.9em; color: #6c757d; }}
-            </style>
-        </head>
-        <body>
-            <div class="header">
-                <h1>🐝 Bee Colony Health Monitor</h1>
-                <p>Session Summary Report</p>
-            </div>
-            
-            <div class="summary-box">
-                <h3>Session Overview</h3>
-                <p>
-                    <strong>Session ID:</strong> {session['session_id']}<br>
-                    <strong>Source:</strong> {session['source']}<br>
-                    <strong>Started:</strong> {session['start_time']}<br>
-                    <strong>Ended:</strong> {session['end_time'] or 'Not completed'}<br>
-                    <strong>Duration:</strong> {duration_str}<br>
-                    <strong>Colony Health Status:</strong> <span class="risk-badge">{risk_level} Risk</span>
-                </p>
-            </div>
-            
-            <h2>Detection Summary</h2>
-            <table>
-                <tr>
-                    <th>Metric</th>
-                    <th>Value</th>
-                </tr>
-                <tr>
-                    <td><strong>Total Bees Detected</strong></td>
-                    <td>{data['total_unique_bees']}</td>
-                </tr>
-                <tr>
-                    <td><strong>Total Varroa Mites Detected</strong></td>
-                    <td>{data['total_unique_varroa']}</td>
-                </tr>
-                <tr>
-                    <td><strong>Overall Infestation Ratio</strong></td>
-                    <td>{data['overall_ratio']:.3f}</td>
-                </tr>
-            </table>
-            
-            <h2>Recent Metrics</h2>
-            <table>
-                <tr>
-                    <th>Timestamp</th>
-                    <th>Bees</th>
-                    <th>Varroa</th>
-                    <th>Ratio</th>
-                </tr>
-                """
-        
-        # Add the latest metrics to the table
-        for metric in data['latest_metrics']:
-            html += f"""
-                <tr>
-                    <td>{metric['timestamp']}</td>
-                    <td>{metric['unique_bee_count']}</td>
-                    <td>{metric['unique_varroa_count']}</td>
-                    <td>{metric['infestation_ratio']:.3f}</td>
-                </tr>
-            """
-            
-        html += f"""
-            </table>
-            
-            <div class="footer">
-                <p>This is an automated report from the Bee Colony Health Monitor system. Total metrics collected: {data['metrics_count']}</p>
-                <p>Notes: {session['notes'] or 'None'}</p>
-            </div>
-        </body>
-        </html>
-        """
-        
-        return html
-        
+    def _format_email_content(self, *summaries):
+        """Format the email content as HTML, one section per session summary"""
+        title = 'Session Summary Report' if len(summaries) == 1 else f'Digest of {len(summaries)} Sessions'
+        return _templates()["html"].render(
+            head=_static_head(),
+            title=title,
+            reports=[session_report(data) for data in summaries],
+        )
+    
     def _format_plain_text_content(self, data):
         """Format the email content as plain text"""
-        session = data['session']
-        
-        # Determine risk level based on overall infestation ratio
-        overall_ratio = data['overall_ratio']
-        if overall_ratio < 0.05:
-            risk_level = "Low"
-        elif overall_ratio < 0.10:
-            risk_level = "Moderate"
-        elif overall_ratio < 0.15:
-            risk_level = "High"
-        else:
-            risk_level = "Critical"
-        
-        # Format duration
-        if session['end_time'] and session['start_time']:
-            try:
-                start = datetime.datetime.fromisoformat(session['start_time'])
-                end = datetime.datetime.fromisoformat(session['end_time'])
-                duration = end - start
-                duration_str = str(duration).split('.')[0]  # Remove microseconds
-            except ValueError:
-                duration_str = "Unknown"
-        else:
-            duration_str = "Session not completed"
-        
-        # Create plain text content
-        text = f"""
-BEE COLONY HEALTH MONITOR
-Session Summary Report
-
-SESSION OVERVIEW
------------------------
-Session ID: {session['session_id']}
-Source: {session['source']}
-Started: {session['start_time']}
-Ended: {session['end_time'] or 'Not completed'}
-Duration: {duration_str}
-Colony Health Status: {risk_level} Risk
-
-DETECTION SUMMARY
------------------------
-Total Bees Detected: {data['total_unique_bees']}
-Total Varroa Mites Detected: {data['total_unique_varroa']}
-Overall Infestation Ratio: {data['overall_ratio']:.3f}
-
-RECENT METRICS
------------------------
-"""
-        
-        # Add latest metrics
-        for metric in data['latest_metrics']:
-            text += f"  {metric['timestamp']} - Bees: {metric['unique_bee_count']}, Varroa: {metric['unique_varroa_count']}, Ratio: {metric['infestation_ratio']:.3f}\n"
-        
-        text += f"""
------------------------
-This is an automated report from the Bee Colony Health Monitor system.
-Total metrics collected: {data['metrics_count']}
-Notes: {session['notes'] or 'None'}
-"""
-        
-        return text
\ No newline at end of file
+        return _templates()["text"].render(report=session_report(data))
@@ -0,0 +1,122 @@
+"""
+Array-backed detection data for a single frame.
+
+app_callback extracts every Hailo detection once into a DetectionBatch; the
+confidence filtering, per-class counting and pixel scaling used by both the
+counters and the overlay are then done as NumPy operations.
+"""
+import numpy as np
+
+# Class ids used in the arrays (labels.json: background, bee, varroa)
+OTHER_CLASS = 0
+BEE_CLASS = 1
+VARROA_CLASS = 2
+NUM_CLASSES = 3
+CLASS_NAMES = ("other", "bee", "varroa")
+LABEL_TO_CLASS = {"bee": BEE_CLASS, "varroa": VARROA_CLASS}
+
+# Matches max_boxes in labels.json; the batch grows if a frame has more
+DEFAULT_CAPACITY = 200
+
+# Fraction of a varroa box that must lie inside a bee box to attach it to that bee
+DEFAULT_MIN_CONTAINMENT = 0.5
+
+class FrameDetections:
+    """Detections of one frame that passed the confidence threshold"""
+
+    def __init__(self, class_ids, confidences, boxes, track_ids):
+        self.class_ids = class_ids      # int8, one of the *_CLASS ids
+        self.confidences = confidences  # float32
+        self.boxes = boxes              # float32 (n, 4): normalised xmin, ymin, xmax, ymax
+        self.track_ids = track_ids      # int64, 0 when the tracker has not assigned an id
+
+    def __len__(self):
+        return len(self.class_ids)
+
+    def class_counts(self):
+        """Number of detections per class id"""
+        return np.bincount(self.class_ids, minlength=NUM_CLASSES)
+
+    def track_ids_of(self, class_id):
+        """Valid (non-zero) track ids of the given class"""
+        return self.track_ids[(self.class_ids == class_id) & (self.track_ids > 0)]
+
+    def infested_bee_track_ids(self, min_containment=DEFAULT_MIN_CONTAINMENT):
+        """
+        Track ids of bees carrying at least one varroa mite in this frame.
+        Each varroa box is matched to the tracked bee box that contains the
+        largest fraction of it, computed for all pairs at once.
+        """
+        is_varroa = self.class_ids == VARROA_CLASS
+        is_bee = (self.class_ids == BEE_CLASS) & (self.track_ids > 0)
+        if not is_varroa.any() or not is_bee.any():
+            return np.empty(0, dtype=np.int64)
+
+        mites = self.boxes[is_varroa]    # (m, 4)
+        bees = self.boxes[is_bee]        # (n, 4)
+        bee_tracks = self.track_ids[is_bee]
+
+        # Intersection of every mite with every bee, shape (m, n)
+        x1 = np.maximum(mites[:, None, 0], bees[None, :, 0])
+        y1 = np.maximum(mites[:, None, 1], bees[None, :, 1])
+        x2 = np.minimum(mites[:, None, 2], bees[None, :, 2])
+        y2 = np.minimum(mites[:, None, 3], bees[None, :, 3])
+        intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+
+        # Share of each mite box covered by each bee box
+        mite_area = (mites[:, 2] - mites[:, 0]) * (mites[:, 3] - mites[:, 1])
+        containment = intersection / np.maximum(mite_area, 1e-12)[:, None]
+
+        best = containment.argmax(axis=1)
+        matched = containment[np.arange(len(mites)), best] >= min_containment
+        return np.unique(bee_tracks[best[matched]])
+
+    def pixel_boxes(self, width, height):
+        """Boxes scaled to pixel coordinates as int32 (x1, y1, x2, y2)"""
+        scale = np.array([width, height, width, height], dtype=np.float32)
+        return (self.boxes * scale).astype(np.int32)
+
+class DetectionBatch:
+    """Preallocated arrays that are refilled with the raw detections of every frame"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.count = 0
+        self._allocate(capacity)
+
+    def _allocate(self, capacity):
+        self.capacity = capacity
+        self.class_ids = np.zeros(capacity, dtype=np.int8)
+        self.confidences = np.zeros(capacity, dtype=np.float32)
+        self.boxes = np.zeros((capacity, 4), dtype=np.float32)
+        self.track_ids = np.zeros(capacity, dtype=np.int64)
+
+    def _grow(self):
+        old = (self.class_ids, self.confidences, self.boxes, self.track_ids)
+        self._allocate(self.capacity * 2)
+        for new, previous in zip((self.class_ids, self.confidences, self.boxes, self.track_ids), old):
+            new[:len(previous)] = previous
+
+    def reset(self):
+        self.count = 0
+
+    def append(self, class_id, confidence, xmin, ymin, xmax, ymax, track_id=0):
+        """Store one detection in the next free row"""
+        if self.count == self.capacity:
+            self._grow()
+        i = self.count
+        self.class_ids[i] = class_id
+        self.confidences[i] = confidence
+        self.boxes[i] = (xmin, ymin, xmax, ymax)
+        self.track_ids[i] = track_id
+        self.count = i + 1
+
+    def filter(self, min_confidence):
+        """Return the detections at or above `min_confidence` as a FrameDetections"""
+        n = self.count
+        keep = self.confidences[:n] >= min_confidence
+        return FrameDetections(
+            self.class_ids[:n][keep],
+            self.confidences[:n][keep],
+            self.boxes[:n][keep],
+            self.track_ids[:n][keep],
+        )
@@ -0,0 +1,169 @@
+"""
+Live push channels for the dashboard.
+
+PreviewStream copies new frames out of the detector's shared-memory
+FrameSlot at a fixed rate, encodes each one exactly once, and hands the same
+encoded buffer to every connected client. Clients only wait on a condition
+variable, so their number adds neither encoding work nor back-pressure on
+the detector.
+
+EventBroadcaster does the same for Server-Sent Events: every event is
+serialized once and the formatted message is shared by all subscribers.
+"""
+import json
+import threading
+import time
+from collections import deque
+
+try:
+    import cv2
+    import numpy as np
+except ImportError:  # Preview is optional on machines without OpenCV
+    cv2 = None
+
+# Supported encodings and their MIME types
+PREVIEW_MIME_TYPES = {
+    "jpeg": "image/jpeg",
+    "webp": "image/webp",
+}
+
+def preview_available():
+    """Whether frames can be encoded on this machine"""
+    return cv2 is not None
+
+def make_encoder(image_format="jpeg", quality=70):
+    """Return a function encoding raw BGR frame bytes of a given size"""
+    if image_format == "webp":
+        extension, params = ".webp", [cv2.IMWRITE_WEBP_QUALITY, quality]
+    else:
+        extension, params = ".jpg", [cv2.IMWRITE_JPEG_QUALITY, quality]
+
+    def encode(data, width, height, channels):
+        frame = np.frombuffer(data, dtype=np.uint8).reshape(height, width, channels)
+        ok, encoded = cv2.imencode(extension, frame, params)
+        return encoded.tobytes() if ok else None
+
+    return encode
+
+class PreviewStream:
+    """Encodes the latest detector frame once and fans it out to all clients"""
+
+    def __init__(self, fps=5, encoder=None):
+        self.interval = 1.0 / fps
+        self.encoder = encoder
+        self.condition = threading.Condition()
+        self.frame = None       # Latest encoded frame
+        self.frame_id = 0       # Incremented for every newly encoded frame
+        self.stop_count = 0     # Incremented whenever streaming stops
+        self.slot = None
+        self.running = False
+        self.thread = None
+
+    def start(self, slot):
+        """Begin encoding frames published into `slot`"""
+        if self.running:
+            self.stop()
+        self.slot = slot
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        """Stop encoding and wake up waiting clients"""
+        self.running = False
+        if self.thread is not None:
+            self.thread.join(timeout=2.0)
+            self.thread = None
+        self.slot = None
+        with self.condition:
+            self.stop_count += 1
+            self.condition.notify_all()
+
+    def _run(self):
+        last_seq = 0
+        while self.running:
+            started = time.time()
+            seq, data = self.slot.read(last_seq)
+            if data is not None:
+                last_seq = seq
+                encoded = self.encoder(data, self.slot.width, self.slot.height, self.slot.channels)
+                if encoded is not None:
+                    with self.condition:
+                        self.frame = encoded
+                        self.frame_id += 1
+                        self.condition.notify_all()
+            # Cap the encoding rate regardless of the detector frame rate
+            time.sleep(max(0.0, self.interval - (time.time() - started)))
+
+    def frames(self, idle_timeout=30.0):
+        """
+        Yield each newly encoded frame. Ends when streaming stops or after
+        `idle_timeout` seconds without a new frame.
+        """
+        with self.condition:
+            last_id = self.frame_id
+            stop_count = self.stop_count
+        while True:
+            with self.condition:
+                deadline = time.time() + idle_timeout
+                while self.frame_id == last_id and self.stop_count == stop_count:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return
+                    self.condition.wait(timeout=remaining)
+                if self.stop_count != stop_count:
+                    return
+                last_id = self.frame_id
+                frame = self.frame
+            yield frame
+
+def format_sse(event, data, event_id=None):
+    """Format one Server-Sent Events message"""
+    message = ""
+    if event_id is not None:
+        message += f"id: {event_id}\n"
+    return message + f"event: {event}\ndata: {data}\n\n"
+
+class EventBroadcaster:
+    """Fans Server-Sent Events out to any number of subscribers"""
+
+    def __init__(self, history=256, heartbeat=15.0):
+        self.condition = threading.Condition()
+        # Recent events, so reconnecting clients can catch up via Last-Event-ID
+        self.events = deque(maxlen=history)
+        self.last_id = 0
+        self.heartbeat = heartbeat
+
+    def publish(self, event, payload):
+        """Serialize the payload once and wake up all subscribers"""
+        data = json.dumps(payload, separators=(",", ":"))
+        with self.condition:
+            self.last_id += 1
+            event_id = self.last_id
+            self.events.append((event_id, format_sse(event, data, event_id)))
+            self.condition.notify_all()
+        return event_id
+
+    def subscribe(self, last_event_id=None):
+        """
+        Return a generator of formatted messages published after `last_event_id`
+        (or after this call), with a comment line as heartbeat whenever nothing
+        happened for a while.
+        """
+        # Resolve the starting point now rather than on the first iteration
+        with self.condition:
+            cursor = self.last_id if last_event_id is None else last_event_id
+        return self._messages(cursor)
+
+    def _messages(self, cursor):
+        while True:
+            with self.condition:
+                if self.last_id == cursor:
+                    self.condition.wait(timeout=self.heartbeat)
+                pending = [message for event_id, message in self.events if event_id > cursor]
+                cursor = self.last_id
+            if pending:
+                yield "".join(pending)
+            else:
+                # Keeps proxies from closing the connection and detects gone clients
+                yield ": heartbeat\n\n"
@@ -0,0 +1,44 @@
+"""
+Pipeline layout for several cameras sharing one Hailo inference stage.
+
+Every input is queued into a hailoroundrobin, so the frames of all cameras
+pass through a single hailonet (one model load, batched across streams) and
+a single hailotracker, which keeps separate tracks per stream id. A
+hailostreamrouter then splits the frames by stream id into one branch per
+camera. Each branch has its own user callback element, so app_callback is
+handed that camera's counters and never has to look at other streams.
+"""
+
+# Frames each camera may queue in front of the round robin before its source waits
+INPUT_QUEUE_SIZE = 3
+
+def callback_name(stream_index):
+    """
+    Name of the user callback element of a stream. Stream 0 keeps the name
+    GStreamerApp attaches app_callback to; the others are attached separately.
+    """
+    return "identity_callback" if stream_index == 0 else f"identity_callback_{stream_index}"
+
+def multiplexed_pipeline_string(source_pipelines, inference_pipeline, tracker_pipeline, branch_pipelines):
+    """
+    Join per-camera source pipelines, the shared inference and tracker
+    pipelines and per-camera branches (callback and sink) into one
+    gst-launch description. Stream i enters the round robin on sink_i and
+    leaves the router on src_i.
+    """
+    if not source_pipelines or len(source_pipelines) != len(branch_pipelines):
+        raise ValueError("Every source needs exactly one branch")
+
+    routes = " ".join(f'src_{i}::input-streams="<sink_{i}>"' for i in range(len(source_pipelines)))
+    inputs = " ".join(
+        f"{source} ! queue name=mux_queue_{i} leaky=no max-size-buffers={INPUT_QUEUE_SIZE} "
+        f"max-size-bytes=0 max-size-time=0 ! robin.sink_{i}"
+        for i, source in enumerate(source_pipelines)
+    )
+    branches = " ".join(f"router.src_{i} ! {branch}" for i, branch in enumerate(branch_pipelines))
+    return (
+        f"hailoroundrobin mode=1 name=robin ! {inference_pipeline} ! {tracker_pipeline} ! "
+        f"hailostreamrouter name=router {routes} "
+        f"{inputs} "
+        f"{branches}"
+    )
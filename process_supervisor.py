@@ -0,0 +1,183 @@
+"""
+Launching and stopping detector processes.
+
+Every detector is started in a session of its own, so the shell, the Python
+detector and anything GStreamer spawns share one process group that can be
+signalled at once. Stopping escalates SIGINT -> SIGTERM -> SIGKILL but waits
+on the process itself (a pidfd where available) with a deadline per step,
+so it returns as soon as the detector is gone instead of after fixed sleeps.
+
+The PID of every running detector is kept in a pidfile. A pidfile still
+present when app.py starts means a previous run did not shut down
+cleanly; only then are orphans killed and /proc scanned for strays.
+"""
+import os
+import select
+import signal
+import subprocess
+
+# Seconds to wait for the detector after each signal
+SIGINT_TIMEOUT = 2.0  # GStreamer pipelines shut down cleanly on SIGINT
+SIGTERM_TIMEOUT = 1.0
+SIGKILL_TIMEOUT = 1.0
+
+# Command line fragments of processes left behind by a detector that was not stopped cleanly
+STRAY_PROCESS_PATTERNS = (
+    "detection.py",
+    "GStreamerDetectionApp",
+    "Hailo Detection App",
+    "gst-launch",
+    "hailonet",
+    "hailotracker",
+    "hailofilter",
+    "hailooverlay",
+    "autovideosink",
+)
+
+def process_start_time(pid):
+    """Start time of a process in clock ticks since boot, or None if it does not exist"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            stat = f.read()
+    except OSError:
+        return None
+    # The command name may contain spaces; fields after it are space separated
+    return int(stat.rsplit(")", 1)[1].split()[19])
+
+def wait_for_exit(process, timeout):
+    """Wait until a Popen process exits, at most `timeout` seconds; returns whether it did"""
+    if process.poll() is not None:
+        return True
+    try:
+        pidfd = os.pidfd_open(process.pid)
+    except (AttributeError, OSError):
+        # No pidfds (Python < 3.9 or Linux < 5.3): Popen.wait polls instead
+        try:
+            process.wait(timeout)
+            return True
+        except subprocess.TimeoutExpired:
+            return False
+    try:
+        # The pidfd becomes readable the moment the process exits
+        poller = select.poll()
+        poller.register(pidfd, select.POLLIN)
+        poller.poll(timeout * 1000)
+    finally:
+        os.close(pidfd)
+    return process.poll() is not None
+
+def signal_group(pgid, sig):
+    """Signal a process group; returns False if no process is left in it"""
+    try:
+        os.killpg(pgid, sig)
+        return True
+    except ProcessLookupError:
+        return False
+
+def stop_process_group(process, timeouts=(SIGINT_TIMEOUT, SIGTERM_TIMEOUT, SIGKILL_TIMEOUT)):
+    """
+    Stop a process started by launch() together with its process group.
+    Returns the signal that ended it, or None if it had already exited.
+    """
+    pgid = process.pid  # Session leader, so its PID is the group ID
+    stopped_by = None
+    for sig, timeout in zip((signal.SIGINT, signal.SIGTERM, signal.SIGKILL), timeouts):
+        if process.poll() is not None:
+            break
+        if not signal_group(pgid, sig):
+            break
+        stopped_by = sig
+        if wait_for_exit(process, timeout):
+            break
+    # Children that outlived the detector belong to the same group
+    signal_group(pgid, signal.SIGKILL)
+    return stopped_by
+
+class DetectorSupervisor:
+    """Starts detector processes in their own process group and tracks them by pidfile"""
+
+    def __init__(self, pid_dir):
+        self.pid_dir = pid_dir
+
+    def pidfile(self, pid):
+        return os.path.join(self.pid_dir, f"{pid}.pid")
+
+    def launch(self, command, **popen_args):
+        """Start `command` (through the shell) in a new process group and record its PID"""
+        process = subprocess.Popen(command, shell=True, start_new_session=True, **popen_args)
+        try:
+            os.makedirs(self.pid_dir, exist_ok=True)
+            # The start time tells a recycled PID apart from the detector
+            with open(self.pidfile(process.pid), "w") as f:
+                f.write(f"{process.pid} {process_start_time(process.pid)}\n")
+        except OSError as e:
+            print(f"Could not write pidfile for PID {process.pid}: {e}")
+        return process
+
+    def stop(self, process):
+        """Stop a launched detector and remove its pidfile; returns the signal that ended it"""
+        try:
+            return stop_process_group(process)
+        finally:
+            try:
+                os.remove(self.pidfile(process.pid))
+            except FileNotFoundError:
+                pass
+
+    def stale_pidfiles(self):
+        """Pidfiles of detectors that were never stopped"""
+        try:
+            names = os.listdir(self.pid_dir)
+        except FileNotFoundError:
+            return []
+        return [os.path.join(self.pid_dir, name) for name in names if name.endswith(".pid")]
+
+    def recover(self):
+        """
+        Kill what a previous, uncleanly stopped run left behind. Does nothing
+        (and scans nothing) unless a stale pidfile exists. Returns the number
+        of processes killed, or None if there was nothing to recover.
+        """
+        pidfiles = self.stale_pidfiles()
+        if not pidfiles:
+            return None
+        killed = 0
+        for path in pidfiles:
+            killed += kill_recorded_group(path)
+            os.remove(path)
+        return killed + kill_stray_processes()
+
+def kill_recorded_group(path):
+    """Kill the process group recorded in a pidfile if its leader is still the same process"""
+    try:
+        with open(path) as f:
+            pid, start_time = f.read().split()
+        pid = int(pid)
+    except (OSError, ValueError):
+        return 0
+    if pid <= 1 or str(process_start_time(pid)) != start_time:
+        # Gone, or the PID now belongs to another process
+        return 0
+    print(f"Killing orphaned detector process group {pid}")
+    return 1 if signal_group(pid, signal.SIGKILL) else 0
+
+def kill_stray_processes(patterns=STRAY_PROCESS_PATTERNS):
+    """Kill processes whose command line contains any of `patterns`, found in one pass over /proc"""
+    own_pid = os.getpid()
+    killed = 0
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit() or int(entry) == own_pid:
+            continue
+        try:
+            with open(f"/proc/{entry}/cmdline", "rb") as f:
+                cmdline = f.read().replace(b"\0", b" ").decode(errors="replace")
+        except OSError:
+            continue
+        if any(pattern in cmdline for pattern in patterns):
+            try:
+                print(f"Killing stray process with PID {entry}: {cmdline.strip()}")
+                os.kill(int(entry), signal.SIGKILL)
+                killed += 1
+            except OSError:
+                pass
+    return killed
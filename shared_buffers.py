@@ -0,0 +1,317 @@
+"""
+Shared-memory buffers exchanged between the detection process and the Flask app.
+
+StatsRing holds the most recent per-frame telemetry records in a fixed-size
+ring. The detector publishes into it without ever waiting on the reader, and
+app.py reads it without taking any lock: every slot carries the sequence
+number of the record it holds, so a reader can tell when a slot was
+overwritten while it was being copied.
+
+ControlBlock carries settings written by app.py that the detection callback
+checks on every frame, such as the visualization mode.
+
+FrameSlot holds the latest annotated preview frame, overwritten in place by
+the detector and copied out by app.py's preview encoder.
+"""
+import os
+import struct
+from multiprocessing import shared_memory, resource_tracker
+from telemetry import FrameRecord, FRAME_RECORD, encode_frame_record, stream_env
+
+# Environment variables used to pass segment names to the detection process
+STATS_SHM_ENV = "BEE_STATS_SHM"
+CONTROL_SHM_ENV = "BEE_CONTROL_SHM"
+PREVIEW_SHM_ENV = "BEE_PREVIEW_SHM"
+
+# Visualization modes for the annotated frame
+VISUALIZATION_HEADLESS = 0  # Never map the frame out of the GstBuffer
+VISUALIZATION_PREVIEW = 1   # Render every Nth frame only
+VISUALIZATION_FULL = 2      # Render every frame
+VISUALIZATION_MODES = {
+    "headless": VISUALIZATION_HEADLESS,
+    "preview": VISUALIZATION_PREVIEW,
+    "full": VISUALIZATION_FULL,
+}
+
+# Number of frame records kept in the ring (~30 seconds at 30 FPS)
+STATS_RING_CAPACITY = 1024
+
+# Header: last published sequence number, capacity, slot size
+_RING_HEADER = struct.Struct("<QII")
+# Every slot starts with the sequence number of the record it contains
+_SLOT_SEQ = struct.Struct("<Q")
+# Keep slots 8-byte aligned so sequence numbers never straddle cache lines
+_SLOT_SIZE = (_SLOT_SEQ.size + FRAME_RECORD.size + 7) & ~7
+
+# How many times a reader retries a slot that is being rewritten
+_READ_RETRIES = 3
+
+# Control block: visualization mode, preview interval in frames
+_CONTROL_BLOCK = struct.Struct("<II")
+
+# Frame slot header: sequence (0 while being written), width, height, channels
+_FRAME_HEADER = struct.Struct("<QIII")
+
+# Segments created by this process; their resource tracker entry belongs to the creator
+_created_segments = set()
+
+def _create_shared_memory(size, name=None):
+    shm = shared_memory.SharedMemory(name=name, create=True, size=size)
+    _created_segments.add(shm.name)
+    return shm
+
+def _attach_shared_memory(name):
+    """Attach to an existing segment without letting this process unlink it on exit"""
+    if name.lstrip("/") in _created_segments:
+        return shared_memory.SharedMemory(name=name)
+    try:
+        # Python 3.13+
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        shm = shared_memory.SharedMemory(name=name)
+        # Older versions register attached segments with the resource tracker,
+        # which would destroy the segment when the detector exits
+        resource_tracker.unregister(shm._name, "shared_memory")
+        return shm
+
+class StatsRing:
+    """Lock-free single-writer ring of FrameRecords in shared memory"""
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self.buf = shm.buf
+        _, self.capacity, slot_size = _RING_HEADER.unpack_from(self.buf, 0)
+        if slot_size != _SLOT_SIZE:
+            raise ValueError(f"Incompatible stats ring slot size {slot_size}, expected {_SLOT_SIZE}")
+        # Only used by the writer
+        self._next_seq = self.head() + 1
+
+    @classmethod
+    def create(cls, capacity=STATS_RING_CAPACITY, name=None):
+        """Create a new ring; the creator is responsible for unlinking it"""
+        size = _RING_HEADER.size + capacity * _SLOT_SIZE
+        shm = _create_shared_memory(size, name)
+        shm.buf[:size] = bytes(size)
+        _RING_HEADER.pack_into(shm.buf, 0, 0, capacity, _SLOT_SIZE)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        """Attach to a ring created by another process"""
+        return cls(_attach_shared_memory(name))
+
+    @classmethod
+    def from_env(cls, stream_index=None):
+        """Attach to the ring named by app.py, if any"""
+        name = os.environ.get(stream_env(STATS_SHM_ENV, stream_index))
+        if not name:
+            return None
+        try:
+            return cls.attach(name)
+        except (FileNotFoundError, ValueError, OSError) as e:
+            print(f"Stats ring unavailable: {e}")
+            return None
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def head(self):
+        """Sequence number of the most recently published record (0 if none)"""
+        return _RING_HEADER.unpack_from(self.buf, 0)[0]
+
+    def _slot_offset(self, seq):
+        return _RING_HEADER.size + (seq % self.capacity) * _SLOT_SIZE
+
+    def publish(self, record):
+        """Write a record into the next slot; never blocks"""
+        seq = self._next_seq
+        offset = self._slot_offset(seq)
+        # Invalidate the slot while it is rewritten, then stamp it with its sequence
+        _SLOT_SEQ.pack_into(self.buf, offset, 0)
+        self.buf[offset + _SLOT_SEQ.size:offset + _SLOT_SEQ.size + FRAME_RECORD.size] = encode_frame_record(record)
+        _SLOT_SEQ.pack_into(self.buf, offset, seq)
+        _RING_HEADER.pack_into(self.buf, 0, seq, self.capacity, _SLOT_SIZE)
+        self._next_seq = seq + 1
+        return seq
+
+    def _read_slot(self, seq):
+        """Return the record with sequence `seq`, or None if it was overwritten"""
+        offset = self._slot_offset(seq)
+        for _ in range(_READ_RETRIES):
+            if _SLOT_SEQ.unpack_from(self.buf, offset)[0] != seq:
+                return None
+            fields = FRAME_RECORD.unpack_from(self.buf, offset + _SLOT_SEQ.size)
+            # The slot is only consistent if it was not rewritten while copying
+            if _SLOT_SEQ.unpack_from(self.buf, offset)[0] == seq:
+                return FrameRecord(*fields[2:])
+        return None
+
+    def latest(self):
+        """Return the most recent record, or None if nothing was published yet"""
+        for _ in range(_READ_RETRIES):
+            head = self.head()
+            if head == 0:
+                return None
+            record = self._read_slot(head)
+            if record is not None:
+                return record
+        return None
+
+    def read_since(self, cursor):
+        """
+        Return (records, new_cursor, missed) for everything published after `cursor`.
+        `missed` counts records that were overwritten before they could be read.
+        """
+        head = self.head()
+        if head <= cursor:
+            return [], cursor, 0
+        missed = 0
+        first = cursor + 1
+        if head - cursor > self.capacity:
+            missed = head - cursor - self.capacity
+            first = head - self.capacity + 1
+        records = []
+        for seq in range(first, head + 1):
+            record = self._read_slot(seq)
+            if record is None:
+                missed += 1
+            else:
+                records.append(record)
+        return records, head, missed
+
+    def close(self):
+        """Detach from the segment, removing it if this process created it"""
+        self.buf = None
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+                _created_segments.discard(self.shm.name)
+        except (FileNotFoundError, BufferError):
+            pass
+
+class ControlBlock:
+    """Settings written by app.py and polled by the detection callback"""
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self.buf = shm.buf
+
+    @classmethod
+    def create(cls, mode=VISUALIZATION_HEADLESS, preview_interval=1, name=None):
+        shm = _create_shared_memory(_CONTROL_BLOCK.size, name)
+        block = cls(shm, owner=True)
+        block.set_visualization(mode, preview_interval)
+        return block
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach_shared_memory(name))
+
+    @classmethod
+    def from_env(cls, stream_index=None):
+        """Attach to the control block named by app.py, if any"""
+        name = os.environ.get(stream_env(CONTROL_SHM_ENV, stream_index))
+        if not name:
+            return None
+        try:
+            return cls.attach(name)
+        except (FileNotFoundError, OSError) as e:
+            print(f"Control block unavailable: {e}")
+            return None
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def set_visualization(self, mode, preview_interval):
+        _CONTROL_BLOCK.pack_into(self.buf, 0, mode, max(1, preview_interval))
+
+    def visualization(self):
+        """Return (mode, preview_interval)"""
+        return _CONTROL_BLOCK.unpack_from(self.buf, 0)
+
+    def close(self):
+        self.buf = None
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+                _created_segments.discard(self.shm.name)
+        except (FileNotFoundError, BufferError):
+            pass
+
+class FrameSlot:
+    """Single shared-memory slot holding the latest preview frame"""
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self.buf = shm.buf
+        seq, self.width, self.height, self.channels = _FRAME_HEADER.unpack_from(self.buf, 0)
+        self.frame_size = self.width * self.height * self.channels
+        # Only used by the writer
+        self._next_seq = seq + 1
+
+    @classmethod
+    def create(cls, width, height, channels=3, name=None):
+        shm = _create_shared_memory(_FRAME_HEADER.size + width * height * channels, name)
+        _FRAME_HEADER.pack_into(shm.buf, 0, 0, width, height, channels)
+        return cls(shm, owner=True)
+
+    @classmethod
+    def attach(cls, name):
+        return cls(_attach_shared_memory(name))
+
+    @classmethod
+    def from_env(cls, stream_index=None):
+        """Attach to the preview slot named by app.py, if any"""
+        name = os.environ.get(stream_env(PREVIEW_SHM_ENV, stream_index))
+        if not name:
+            return None
+        try:
+            return cls.attach(name)
+        except (FileNotFoundError, OSError) as e:
+            print(f"Preview frame slot unavailable: {e}")
+            return None
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def write(self, frame):
+        """Copy a C-contiguous uint8 frame of shape (height, width, channels) into the slot"""
+        seq = self._next_seq
+        # Readers ignore the slot while the sequence is 0
+        _FRAME_HEADER.pack_into(self.buf, 0, 0, self.width, self.height, self.channels)
+        self.buf[_FRAME_HEADER.size:_FRAME_HEADER.size + self.frame_size] = memoryview(frame).cast("B")
+        _FRAME_HEADER.pack_into(self.buf, 0, seq, self.width, self.height, self.channels)
+        self._next_seq = seq + 1
+        return seq
+
+    def read(self, last_seq=0):
+        """
+        Return (seq, frame_bytes) if a frame newer than `last_seq` is available,
+        otherwise (last_seq, None).
+        """
+        seq = _FRAME_HEADER.unpack_from(self.buf, 0)[0]
+        if seq == 0 or seq == last_seq:
+            return last_seq, None
+        data = bytes(self.buf[_FRAME_HEADER.size:_FRAME_HEADER.size + self.frame_size])
+        # Discard the copy if the detector rewrote the slot meanwhile
+        if _FRAME_HEADER.unpack_from(self.buf, 0)[0] != seq:
+            return last_seq, None
+        return seq, data
+
+    def close(self):
+        self.buf = None
+        try:
+            self.shm.close()
+            if self.owner:
+                self.shm.unlink()
+                _created_segments.discard(self.shm.name)
+        except (FileNotFoundError, BufferError):
+            pass
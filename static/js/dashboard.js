@@ -8,9 +8,19 @@ let detectionChart;
 let uniqueObjectsChart;
 let infestationRatioChart;
 let updateInterval;
+let eventSource;
 let detectionActive = false;
 let chartUpdateCounter = 0;
 
+// Latest statistics, merged with the deltas pushed over /stream
+let currentStats = {};
+
+// Sequence number of the newest time series point shown in the charts
+let timeSeriesCursor = null;
+
+// Number of points kept in the time series charts (matches MAX_DATA_POINTS in app.py)
+const MAX_CHART_POINTS = 100;
+
 // Animation options for counters
 const counterAnimationOptions = {
     duration: 1000,
@@ -380,7 +390,7 @@ function initCharts() {
 
 /**
  * Updates the dashboard with the latest statistics
- * Animates value changes and updates charts
+ * Used as a polling fallback when the browser has no EventSource support
  */
 function updateStats() {
     console.log("Updating dashboard statistics");
@@ -394,50 +404,184 @@ function updateStats() {
     $.getJSON('/get_stats', function(data) {
         // Hide loading overlay if visible
         $('#loading-overlay').fadeOut(200);
-        
-        // Update numeric metrics with animations
-        animateValueChange('#currentBeeCount', data.current_bees);
-        animateValueChange('#currentVarroaCount', data.current_varroa);
-        animateValueChange('#totalBeeCount', data.total_bees);
-        animateValueChange('#totalVarroaCount', data.total_varroa);
-        animateValueChange('#totalFrames', data.total_frames);
-        animateValueChange('#fpsValue', data.fps.toFixed(1));
-        
-        // Update FPS display
-        $('#fpsDisplay').html(`<i class="fas fa-microchip me-2"></i>${data.fps.toFixed(1)} FPS`);
-        
-        // Update scientific notation displays
-        $('#beeSciNotation').text(`n = ${data.current_bees}`);
-        $('#varroaSciNotation').text(`n = ${data.current_varroa}`);
-        
-        // Update infestation ratio with animation
-        const ratio = data.infestation_ratio;
-        animateValueChange('#infestationRatio', ratio.toFixed(2));
-        
-        // Update risk status with appropriate styling
-        updateRiskStatus(data.infestation_risk_level);
-        
-        // Update unique objects chart
-        updateUniqueObjectsChart(data.unique_bees, data.unique_varroa);
-        
+        renderStats(data);
     }).fail(function(jqXHR, textStatus, errorThrown) {
         console.error("Error fetching statistics:", textStatus, errorThrown);
         $('#loading-overlay').fadeOut(200);
     });
     
-    // Get time series data for trend charts
-    $.getJSON('/get_time_series', function(data) {
-        // Update detection chart with new time series data
-        updateDetectionChart(data);
-        
-        // Update infestation ratio chart
-        updateInfestationRatioChart(data);
-        
+    // Get only the time series points added since the last poll
+    const params = (timeSeriesCursor === null) ? {} : {since: timeSeriesCursor};
+    $.getJSON('/get_time_series', params, function(data) {
+        if (data.reset) {
+            renderTimeSeries(data);
+        } else {
+            appendTimeSeriesData(data);
+        }
     }).fail(function(jqXHR, textStatus, errorThrown) {
         console.error("Error fetching time series data:", textStatus, errorThrown);
     });
 }
 
+/**
+ * Renders a complete statistics object
+ * Animates value changes and updates the unique objects chart
+ * @param {Object} data - Statistics as returned by /get_stats
+ */
+function renderStats(data) {
+    // Update numeric metrics with animations
+    animateValueChange('#currentBeeCount', data.current_bees);
+    animateValueChange('#currentVarroaCount', data.current_varroa);
+    animateValueChange('#totalBeeCount', data.total_bees);
+    animateValueChange('#totalVarroaCount', data.total_varroa);
+    animateValueChange('#totalFrames', data.total_frames);
+    animateValueChange('#fpsValue', data.fps.toFixed(1));
+    
+    // Update FPS display
+    $('#fpsDisplay').html(`<i class="fas fa-microchip me-2"></i>${data.fps.toFixed(1)} FPS`);
+    
+    // Update scientific notation displays
+    $('#beeSciNotation').text(`n = ${data.current_bees}`);
+    $('#varroaSciNotation').text(`n = ${data.current_varroa}`);
+    
+    // Update infestation ratio with animation
+    const ratio = data.infestation_ratio;
+    animateValueChange('#infestationRatio', ratio.toFixed(2));
+    
+    // Update risk status with appropriate styling, only re-animating on change
+    if (data.infestation_risk_level !== currentStats.infestation_risk_level) {
+        updateRiskStatus(data.infestation_risk_level);
+    }
+    
+    // Update unique objects chart
+    updateUniqueObjectsChart(data.unique_bees, data.unique_varroa);
+    
+    currentStats = data;
+}
+
+/**
+ * Renders complete time series data in the trend charts
+ * @param {Object} data - Time series data as returned by /get_time_series
+ */
+function renderTimeSeries(data) {
+    // Update detection chart with new time series data
+    updateDetectionChart(data);
+    
+    // Update infestation ratio chart
+    updateInfestationRatioChart(data);
+    
+    timeSeriesCursor = data.seq;
+}
+
+/**
+ * Appends incremental time series data to the trend charts
+ * @param {Object} data - Points returned by /get_time_series?since=<seq>
+ */
+function appendTimeSeriesData(data) {
+    const firstSeq = data.seq - data.timestamps.length + 1;
+    data.timestamps.forEach(function(timestamp, i) {
+        appendTimeSeriesPoint({
+            seq: firstSeq + i,
+            timestamp: timestamp,
+            bee_count: data.bee_counts[i],
+            varroa_count: data.varroa_counts[i],
+            infestation_ratio: data.infestation_ratio[i]
+        });
+    });
+    timeSeriesCursor = data.seq;
+}
+
+/**
+ * Applies a stats delta pushed by the server
+ * @param {Object} delta - Changed statistics fields
+ */
+function applyStatsDelta(delta) {
+    renderStats(Object.assign({}, currentStats, delta));
+}
+
+/**
+ * Appends one pushed time series point to the trend charts
+ * @param {Object} point - {seq, timestamp, bee_count, varroa_count, infestation_ratio}
+ */
+function appendTimeSeriesPoint(point) {
+    // Already shown, e.g. replayed after a reconnect
+    if (timeSeriesCursor !== null && point.seq <= timeSeriesCursor) {
+        return;
+    }
+    timeSeriesCursor = point.seq;
+    
+    const charts = [
+        [detectionChart, [point.bee_count, point.varroa_count]],
+        [infestationRatioChart, [point.infestation_ratio]]
+    ];
+    
+    chartUpdateCounter++;
+    charts.forEach(function([chart, values]) {
+        chart.data.labels.push(point.timestamp);
+        values.forEach(function(value, i) {
+            chart.data.datasets[i].data.push(value);
+        });
+        
+        // Keep the same window as the server-side buffer
+        if (chart.data.labels.length > MAX_CHART_POINTS) {
+            chart.data.labels.shift();
+            chart.data.datasets.forEach(function(dataset) {
+                dataset.data.shift();
+            });
+        }
+        
+        chart.options.animation.duration = (chartUpdateCounter % 5 === 0) ? 1000 : 300;
+        chart.update();
+    });
+}
+
+/**
+ * Opens the Server-Sent Events stream
+ * The server sends a full snapshot first, then only deltas as the detector produces them
+ * @returns {boolean} Whether push updates are available in this browser
+ */
+function connectEventStream() {
+    if (!window.EventSource) {
+        return false;
+    }
+    
+    eventSource = new EventSource('/stream');
+    
+    eventSource.addEventListener('snapshot', function(event) {
+        const snapshot = JSON.parse(event.data);
+        $('#loading-overlay').fadeOut(200);
+        renderStats(snapshot.stats);
+        renderTimeSeries(snapshot.time_series);
+    });
+    
+    eventSource.addEventListener('stats', function(event) {
+        applyStatsDelta(JSON.parse(event.data));
+    });
+    
+    eventSource.addEventListener('time_series', function(event) {
+        appendTimeSeriesPoint(JSON.parse(event.data));
+    });
+    
+    eventSource.addEventListener('time_series_reset', function(event) {
+        // A new detection session started
+        const reset = JSON.parse(event.data);
+        renderTimeSeries({
+            seq: reset.seq,
+            timestamps: [],
+            bee_counts: [],
+            varroa_counts: [],
+            infestation_ratio: []
+        });
+    });
+    
+    eventSource.onerror = function() {
+        // EventSource reconnects on its own and resumes from the last event id
+        console.warn("Event stream interrupted, reconnecting...");
+    };
+    
+    return true;
+}
+
 /**
  * Updates the risk status badge with appropriate styling and animation
  * @param {string} riskLevel - The current risk level (Unknown, Low, Moderate, High, Critical)
@@ -541,7 +685,8 @@ function updateUniqueObjectsChart(beeCount, varroaCount) {
  * @param {Object} data - Time series data from API
  */
 function updateInfestationRatioChart(data) {
-    infestationRatioChart.data.labels = data.timestamps;
+    // Own copy of the labels, as pushed points are appended to each chart separately
+    infestationRatioChart.data.labels = data.timestamps.slice();
     infestationRatioChart.data.datasets[0].data = data.infestation_ratio;
     
     // Apply different animation duration based on update frequency
@@ -579,11 +724,16 @@ function startDetection() {
                        .fadeIn(200);
             });
             
-            // Start periodic updates (every second)
-            updateInterval = setInterval(updateStats, 1000);
+            // Without push support, fall back to periodic updates (every second)
+            if (!eventSource) {
+                updateInterval = setInterval(updateStats, 1000);
+            }
             
             // Set detection active flag
             detectionActive = true;
+            
+            // Show annotated frames if rendering is enabled
+            setLivePreview(true);
         }
     }).fail(function(jqXHR, textStatus, errorThrown) {
         console.error("Error starting detection:", textStatus, errorThrown);
@@ -623,11 +773,14 @@ function stopDetection() {
                        .fadeIn(200);
             });
             
-            // Stop periodic updates
+            // Stop periodic updates (polling fallback only)
             clearInterval(updateInterval);
             
             // Set detection active flag
             detectionActive = false;
+            
+            // Close the preview stream
+            setLivePreview(false);
         }
     }).fail(function(jqXHR, textStatus, errorThrown) {
         console.error("Error stopping detection:", textStatus, errorThrown);
@@ -668,6 +821,59 @@ function setButtonState(isActive) {
     }
 }
 
+/**
+ * Connects or disconnects the live preview stream
+ * The stream only carries frames while detection runs in a non-headless mode
+ * @param {boolean} enabled - Whether the preview should be shown
+ */
+function setLivePreview(enabled) {
+    const preview = $('#livePreview');
+    
+    if (enabled && $('#visualizationMode').val() !== 'headless') {
+        // Cache-busting query so the browser opens a fresh stream
+        preview.attr('src', `/video_feed?t=${Date.now()}`).show();
+        $('#livePreviewPlaceholder').hide();
+    } else {
+        // Dropping the src closes the stream connection
+        preview.removeAttr('src').hide();
+        $('#livePreviewPlaceholder').show();
+    }
+}
+
+/**
+ * Loads the current visualization mode into the selector
+ */
+function loadVisualizationMode() {
+    $.getJSON('/api/visualization', function(data) {
+        $('#visualizationMode').val(data.mode);
+    }).fail(function(jqXHR, textStatus, errorThrown) {
+        console.error("Error fetching visualization mode:", textStatus, errorThrown);
+    });
+}
+
+/**
+ * Sends the selected visualization mode to the detector
+ * Headless skips frame rendering entirely, preview renders every Nth frame
+ */
+function changeVisualizationMode() {
+    const mode = $('#visualizationMode').val();
+    
+    $.ajax({
+        url: '/api/visualization',
+        type: 'POST',
+        contentType: 'application/json',
+        data: JSON.stringify({mode: mode}),
+        success: function(data) {
+            console.log("Visualization mode set to:", data.mode);
+            setLivePreview(detectionActive);
+        },
+        error: function(jqXHR, textStatus, errorThrown) {
+            console.error("Error setting visualization mode:", textStatus, errorThrown);
+            loadVisualizationMode();
+        }
+    });
+}
+
 /**
  * Toggles the detection process state
  */
@@ -691,13 +897,19 @@ $(document).ready(function() {
     // Set up toggle button handler
     $('#toggleDetectionButton').on('click', toggleDetection);
     
+    // Set up visualization mode selector
+    loadVisualizationMode();
+    $('#visualizationMode').on('change', changeVisualizationMode);
+    
     // Add tooltip functionality to all status badges
     $('.status-badge').tooltip({
         placement: 'top'
     });
     
-    // Initial stats update
-    updateStats();
+    // Receive live updates pushed by the server, polling only as a fallback
+    if (!connectEventStream()) {
+        updateStats();
+    }
     
     // Add slight entrance animation for dashboard elements
     $('.dashboard-container').css('opacity', 0).animate({opacity: 1}, 500);
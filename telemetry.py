@@ -0,0 +1,136 @@
+"""
+Binary telemetry channel between detection.py and app.py.
+
+The detection process sends one fixed-layout record per processed frame over a
+pipe inherited from app.py, instead of printing text that has to be parsed
+line by line.
+"""
+import os
+import struct
+import select
+from collections import namedtuple
+
+# Environment variables used to hand the channel over to the detection process
+TELEMETRY_FD_ENV = "BEE_TELEMETRY_FD"
+TEXT_OUTPUT_ENV = "BEE_DETECTION_TEXT_OUTPUT"
+
+def stream_env(name, stream_index=None):
+    """
+    Environment variable of one input of a multiplexed detector: the channel
+    variables are suffixed with the stream index, e.g. BEE_STATS_SHM_1
+    """
+    return name if stream_index is None else f"{name}_{stream_index}"
+
+# Marker at the start of every record, used to detect a corrupted stream
+TELEMETRY_MAGIC = 0xBEE1
+TELEMETRY_VERSION = 3
+
+# Record layout: magic, version, frame number, timestamp, current frame bees,
+# current frame varroa, total bees, total varroa, unique bees, unique varroa,
+# unique bees/varroa first seen in the last minute and the last hour, then
+# the number of unique bees seen carrying a varroa mite
+FRAME_RECORD = struct.Struct("<HHQd11I")
+
+FrameRecord = namedtuple("FrameRecord", [
+    "frame",
+    "timestamp",
+    "current_bees",
+    "current_varroa",
+    "total_bees",
+    "total_varroa",
+    "unique_bees",
+    "unique_varroa",
+    "bees_last_minute",
+    "varroa_last_minute",
+    "bees_last_hour",
+    "varroa_last_hour",
+    "infested_bees",
+], defaults=(0, 0, 0, 0, 0))
+
+def encode_frame_record(record):
+    """Pack a FrameRecord into its binary representation"""
+    return FRAME_RECORD.pack(TELEMETRY_MAGIC, TELEMETRY_VERSION, *record)
+
+class TelemetryWriter:
+    """Writes frame records to the telemetry pipe without ever blocking the caller"""
+
+    def __init__(self, fd):
+        self.fd = fd
+        self.dropped = 0
+        self.closed = False
+        # A full pipe must never stall the GStreamer callback thread
+        os.set_blocking(fd, False)
+
+    @classmethod
+    def from_env(cls, stream_index=None):
+        """Create a writer from the file descriptor passed by app.py, if any"""
+        fd = os.environ.get(stream_env(TELEMETRY_FD_ENV, stream_index))
+        if not fd:
+            return None
+        try:
+            return cls(int(fd))
+        except (ValueError, OSError) as e:
+            print(f"Telemetry channel unavailable: {e}")
+            return None
+
+    def write(self, record):
+        """Send a record, dropping it if the reader is not keeping up"""
+        if self.closed:
+            return False
+        try:
+            # Records are far smaller than PIPE_BUF, so each write is atomic
+            os.write(self.fd, encode_frame_record(record))
+            return True
+        except BlockingIOError:
+            self.dropped += 1
+            return False
+        except (BrokenPipeError, OSError):
+            # The reader went away; stop trying
+            self.closed = True
+            return False
+
+    def close(self):
+        if not self.closed:
+            self.closed = True
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+
+class TelemetryDecoder:
+    """Reassembles frame records from arbitrarily chunked pipe reads"""
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self.resyncs = 0
+
+    def feed(self, data):
+        """Add received bytes and return the list of complete records"""
+        self._buffer.extend(data)
+        records = []
+        size = FRAME_RECORD.size
+        offset = 0
+        while len(self._buffer) - offset >= size:
+            magic, version, *fields = FRAME_RECORD.unpack_from(self._buffer, offset)
+            if magic != TELEMETRY_MAGIC or version != TELEMETRY_VERSION:
+                # Lost framing, skip ahead one byte until the next valid record
+                offset += 1
+                self.resyncs += 1
+                continue
+            records.append(FrameRecord(*fields))
+            offset += size
+        del self._buffer[:offset]
+        return records
+
+def read_records(fd, decoder, timeout=0.1):
+    """
+    Wait up to `timeout` seconds for telemetry and return the decoded records.
+    Returns None once the writer has closed the channel.
+    """
+    ready, _, _ = select.select([fd], [], [], timeout)
+    if not ready:
+        return []
+    data = os.read(fd, 64 * FRAME_RECORD.size)
+    if not data:
+        return None
+    return decoder.feed(data)
@@ -0,0 +1,185 @@
+import datetime
+import threading
+from bee_health_db import BeeHealthDatabase
+
+def test_metrics_round_trip(tmp_path):
+    db = BeeHealthDatabase(str(tmp_path / "bees.db"))
+    try:
+        session_id = db.start_new_session(source="test")
+        db.save_metrics(10, 2, 100, fps=12.5)
+        db.save_metrics(20, 3, 200, fps=13.0)
+
+        metrics = db.get_latest_metrics(limit=5, session_id=session_id)
+        assert [m["frame_count"] for m in metrics] == [200, 100]
+        assert metrics[0]["infestation_ratio"] == 0.15
+        assert db.get_sessions(limit=1)[0]["source"] == "test"
+    finally:
+        db.close()
+
+def test_connection_is_reused_per_thread_in_wal_mode(tmp_path):
+    db = BeeHealthDatabase(str(tmp_path / "bees.db"))
+    try:
+        conn = db._connect()
+        assert db._connect() is conn
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+        # Another thread gets its own connection and sees committed writes
+        db.save_metrics(5, 1, 10)
+        seen = {}
+        def read():
+            seen["conn"] = db._connect()
+            seen["metrics"] = db.get_latest_metrics()
+        thread = threading.Thread(target=read)
+        thread.start()
+        thread.join()
+
+        assert seen["conn"] is not conn
+        assert len(seen["metrics"]) == 1
+        assert len(db._connections) == 2
+    finally:
+        db.close()
+    assert db._connections == []
+
+def test_queued_metrics_are_written_in_batches(tmp_path):
+    db = BeeHealthDatabase(str(tmp_path / "bees.db"))
+    try:
+        db.start_new_session(source="test")
+        for frame in range(1, 251):
+            db.queue_metrics(frame, frame // 10, frame)
+
+        assert db.metric_writer.flush()
+        assert len(db.get_latest_metrics(limit=1000)) == 250
+        assert db.metric_writer.dropped == 0
+    finally:
+        db.close()
+
+def test_overloaded_queue_coalesces_snapshots(tmp_path):
+    db = BeeHealthDatabase(str(tmp_path / "bees.db"))
+    db.metric_writer.max_queue = 3
+    try:
+        session_id = db.start_new_session(source="test")
+        # Writer thread not started, so the queue fills up
+        for frame in range(1, 6):
+            db.metric_writer.submit((session_id, datetime.datetime.now(), frame, 0, 0.0, frame, None))
+
+        assert db.metric_writer.coalesced == 2
+        assert db.metric_writer.flush()
+        frames = sorted(m["frame_count"] for m in db.get_latest_metrics(limit=10))
+        # The newest snapshot always survives
+        assert frames == [1, 2, 5]
+    finally:
+        db.close()
+
+def insert_metric(db, session_id, timestamp, bees, varroa, frame):
+    """Store a metric row with a chosen timestamp through the normal write path"""
+    row = (session_id, timestamp, bees, varroa, varroa / bees, frame, 10.0)
+    db.metric_writer.submit(row)
+
+def test_rollups_are_maintained_on_write(tmp_path):
+    db = BeeHealthDatabase(str(tmp_path / "bees.db"))
+    try:
+        session_id = db.start_new_session(source="test")
+        start = datetime.datetime(2024, 6, 1, 12, 0, 10)
+        for i in range(6):
+            # Two minutes with three samples each, all in one hour
+            insert_metric(db, session_id, start + datetime.timedelta(seconds=20 * i), 10 + i, 1, i)
+        db.metric_writer.flush()
+
+        end = start + datetime.timedelta(minutes=5)
+        resolution, points = db.get_rollups(start, end, max_points=100)
+        assert resolution == "minute"
+        assert [p["timestamp"].minute for p in points] == [0, 1]
+        assert [p["samples"] for p in points] == [3, 3]
+        assert points[0]["bee_avg"] == 11
+        assert (points[1]["bee_min"], points[1]["bee_max"]) == (13, 15)
+        assert points[1]["frame_count"] == 5
+
+        # A small point budget falls back to a coarser resolution
+        resolution, points = db.get_rollups(start, end, max_points=2)
+        assert resolution == "hour"
+        assert len(points) == 1 and points[0]["samples"] == 6
+
+        # Rebuilding from bee_metrics gives the same aggregates
+        before = db.get_rollups(start, end, resolution="minute")
+        db.rebuild_rollups()
+        assert db.get_rollups(start, end, resolution="minute") == before
+    finally:
+        db.close()
+
+def test_metric_history_is_downsampled(tmp_path):
+    db = BeeHealthDatabase(str(tmp_path / "bees.db"))
+    try:
+        session_id = db.start_new_session(source="test")
+        start = datetime.datetime(2024, 6, 1, 0, 0, 0)
+        db.metric_writer.max_queue = 10000
+        # One row every 30 seconds for two days
+        for i in range(2 * 24 * 120):
+            insert_metric(db, session_id, start + datetime.timedelta(seconds=30 * i), 10 + i % 7, 1, i)
+        db.metric_writer.flush()
+
+        # Few rows: returned as they are
+        history = db.get_metric_history(start, start + datetime.timedelta(minutes=5), max_points=50)
+        assert history["resolution"] == "raw"
+        assert len(history["points"]) == 10
+        assert history["points"][0]["samples"] == 1
+
+        # Too many rows, buckets shorter than a minute: aggregated from bee_metrics
+        history = db.get_metric_history(start, start + datetime.timedelta(minutes=10), max_points=15)
+        assert (history["resolution"], history["bucket_seconds"]) == ("raw", 40)
+        assert sum(p["samples"] for p in history["points"]) == 20
+
+        # Buckets of whole minutes come from the minute rollups
+        history = db.get_metric_history(start, start + datetime.timedelta(minutes=10), max_points=5)
+        assert (history["resolution"], history["bucket_seconds"]) == ("minute", 120)
+        assert [p["samples"] for p in history["points"]] == [4] * 5
+
+        # Long range: read from rollups, within the point budget
+        history = db.get_metric_history(start, start + datetime.timedelta(days=2), max_points=100,
+                                        session_id=session_id)
+        assert history["resolution"] == "minute"
+        assert history["bucket_seconds"] == 1740
+        assert len(history["points"]) <= 100
+        assert sum(p["samples"] for p in history["points"]) == 2 * 24 * 120
+
+        history = db.get_metric_history(start, start + datetime.timedelta(days=2), max_points=2)
+        assert history["resolution"] == "day"
+        assert [p["samples"] for p in history["points"]] == [2880, 2880]
+    finally:
+        db.close()
+
+def test_session_summary_is_computed_in_sql_and_cached_once_closed(tmp_path):
+    db = BeeHealthDatabase(str(tmp_path / "bees.db"))
+    try:
+        session_id = db.start_new_session(source="test")
+        for frame, bees in enumerate([10, 20, 40], start=1):
+            db.save_metrics(bees, bees // 10, frame)
+
+        summary = db.get_session_summary(session_id)
+        assert summary["metrics_count"] == 3
+        assert summary["bee_stats"] == {"max": 40, "min": 10, "avg": 70 / 3}
+        assert summary["total_unique_varroa"] == 4
+        assert summary["overall_ratio"] == 0.1
+        assert [m["frame_count"] for m in summary["latest_metrics"]] == [3, 2, 1]
+        # Open sessions are recomputed on every call
+        assert db.get_session_summary(session_id) is not summary
+
+        sent = []
+        attempted = threading.Event()
+        def send(sid, data):
+            sent.append(data)
+            attempted.set()
+            return False
+        db.email_service.send_session_summary = send
+        db.end_session(session_id)
+        assert attempted.wait(timeout=5)
+        assert sent[0]["session"]["end_time"] is not None
+        assert db.get_session_summary(session_id) is db.get_session_summary(session_id)
+
+        # The email text is built from the same summary
+        text = db.email_service._format_plain_text_content(sent[0])
+        assert "Total Bees Detected: 40" in text
+        assert "Duration: 0:00:0" in text
+
+        assert db.get_session_summary(session_id + 1) is None
+    finally:
+        db.close()
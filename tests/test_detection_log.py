@@ -0,0 +1,40 @@
+import numpy as np
+from bee_health_db import BeeHealthDatabase
+from detection_log import DetectionLogWriter, decode_blocks
+from frame_detections import DetectionBatch, BEE_CLASS, VARROA_CLASS
+
+def make_detections(frame):
+    batch = DetectionBatch(capacity=4)
+    batch.append(BEE_CLASS, 0.9, 0.1, 0.2, 0.3, 0.4, frame)
+    batch.append(VARROA_CLASS, 0.5, 0.15, 0.25, 0.17, 0.27, 1000 + frame)
+    return batch.filter(0.3)
+
+def test_detections_round_trip_through_blocks(tmp_path):
+    db = BeeHealthDatabase(str(tmp_path / "bees.db"))
+    try:
+        session_id = db.start_new_session(source="test")
+        writer = DetectionLogWriter(db.db_path, session_id, frames_per_block=4)
+        for frame in range(1, 11):
+            writer.add_frame(frame, 1700000000.0 + frame, make_detections(frame))
+        writer.close()
+
+        rows = db.get_detection_blocks(session_id)
+        # Two full blocks and the partial one stored on close
+        assert [(row["first_frame"], row["last_frame"]) for row in rows] == [(1, 4), (5, 8), (9, 10)]
+
+        log = decode_blocks(rows)
+        assert log["frames"].tolist() == [f for f in range(1, 11) for _ in range(2)]
+        assert log["track_ids"][::2].tolist() == list(range(1, 11))
+        assert log["class_ids"][:2].tolist() == [BEE_CLASS, VARROA_CLASS]
+        assert np.allclose(log["confidences"][:2], [0.9, 0.5], atol=1 / 255)
+        assert np.allclose(log["boxes"][0], [0.1, 0.2, 0.3, 0.4], atol=1 / 65535)
+
+        # Only blocks overlapping the requested frames are read
+        assert len(db.get_detection_blocks(session_id, first_frame=6, last_frame=7)) == 1
+    finally:
+        db.close()
+
+def test_empty_log_decodes_to_empty_arrays():
+    log = decode_blocks([])
+    assert log["frames"].size == 0
+    assert log["boxes"].shape == (0, 4)
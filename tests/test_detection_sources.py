@@ -0,0 +1,43 @@
+from detection_sources import DetectionSource, aggregate_stats, input_argument, new_detection_stats
+
+def test_input_argument_is_the_session_source():
+    assert input_argument("python detection.py -i /dev/video2 --hef model.hef") == "/dev/video2"
+    assert input_argument("python detection.py --input 'hive 3.mp4'") == "hive 3.mp4"
+    assert input_argument("python detection.py") == "python detection.py"
+
+def test_aggregate_sums_counters_and_recomputes_ratios():
+    hive_a = new_detection_stats()
+    hive_a.update(unique_bees=90, unique_varroa=1, fps=12.5, infestation_ratio=1 / 90,
+                  infestation_risk_level="Low")
+    hive_b = new_detection_stats()
+    hive_b.update(unique_bees=10, unique_varroa=3, fps=10.0, infestation_ratio=0.3,
+                  infestation_risk_level="Critical")
+
+    combined = aggregate_stats([hive_a, hive_b])
+    assert combined["unique_bees"] == 100
+    assert combined["unique_varroa"] == 4
+    assert combined["fps"] == 22.5
+    assert combined["infestation_ratio"] == 0.04
+    # One infested hive is not averaged away by a healthy one
+    assert combined["infestation_risk_level"] == "Critical"
+
+def test_aggregate_of_no_sources():
+    combined = aggregate_stats([])
+    assert combined["unique_bees"] == 0
+    assert combined["infestation_ratio"] == 0
+    assert combined["infestation_risk_level"] == "Unknown"
+
+def test_sources_keep_separate_state():
+    first = DetectionSource("video0", "python detection.py -i /dev/video0", 10)
+    second = DetectionSource("video1", "python detection.py -i /dev/video1", 10)
+    first.stats["unique_bees"] = 7
+    first.time_series.append(0.0, 7, 0, 0.0)
+
+    assert second.stats["unique_bees"] == 0
+    assert len(second.time_series) == 0
+
+    stats = first.stats
+    first.reset_stats()
+    assert first.stats is stats
+    assert stats["unique_bees"] == 0
+    assert first.status()["input"] == "/dev/video0"
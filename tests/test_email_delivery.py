@@ -0,0 +1,167 @@
+import socket
+import socketserver
+import threading
+import time
+from bee_health_db import BeeHealthDatabase
+
+class StandInSMTPHandler(socketserver.StreamRequestHandler):
+    """Just enough SMTP (EHLO, AUTH, MAIL, RCPT, DATA, QUIT) to accept a message"""
+
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.server.connections += 1
+        self.reply("220 localhost stand-in SMTP")
+        while True:
+            line = self.rfile.readline().decode().strip()
+            if not line:
+                return
+            command = line.split(" ", 1)[0].upper()
+            if command == "EHLO":
+                self.reply("250-localhost")
+                self.reply("250 AUTH PLAIN LOGIN")
+            elif command == "AUTH":
+                self.reply("235 Authentication successful")
+            elif command in ("MAIL", "RCPT", "RSET", "NOOP"):
+                self.reply("250 OK")
+            elif command == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                lines = []
+                while True:
+                    data = self.rfile.readline()
+                    if data in (b".\r\n", b""):
+                        break
+                    lines.append(data.decode())
+                self.server.messages.append("".join(lines))
+                self.reply("250 OK")
+            elif command == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Not implemented")
+
+def start_server(port=0):
+    server = socketserver.ThreadingTCPServer(("127.0.0.1", port), StandInSMTPHandler)
+    server.daemon_threads = True
+    server.messages = []
+    server.connections = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def local_database(tmp_path, server_port):
+    db = BeeHealthDatabase(str(tmp_path / "bees.db"))
+    db.email_service.smtp_server = "127.0.0.1"
+    db.email_service.smtp_port = server_port
+    db.email_service.use_tls = False
+    return db
+
+def close_sessions(db, count):
+    session_ids = []
+    for i in range(count):
+        session_id = db.start_new_session(source=f"hive-{i}")
+        db.save_metrics(10 * (i + 1), i, 100)
+        db.end_session(session_id)
+        session_ids.append(session_id)
+    return session_ids
+
+def wait_for(condition, timeout=10.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition():
+            return True
+        time.sleep(0.05)
+    return False
+
+def test_queued_summary_is_retried_until_the_server_is_reachable(tmp_path):
+    # Reserve a port with nothing listening on it yet, so the first attempt is refused
+    reserved = socket.socket()
+    reserved.bind(("127.0.0.1", 0))
+    port = reserved.getsockname()[1]
+    reserved.close()
+
+    db = local_database(tmp_path, port)
+    db.email_worker.retry_base = 0.2
+    server = None
+    try:
+        session_id = db.start_new_session(source="test")
+        db.save_metrics(40, 4, 100)
+
+        started = time.time()
+        db.end_session(session_id)
+        # Closing the session does not wait for SMTP
+        assert time.time() - started < 1.0
+
+        assert wait_for(lambda: db.get_email_outbox()[0]["attempts"] >= 1)
+        failed = db.get_email_outbox()[0]
+        assert failed["status"] == "pending"
+        assert failed["last_error"]
+
+        # Connectivity comes back
+        server = start_server(port)
+
+        assert wait_for(lambda: db.get_email_outbox()[0]["status"] == "sent")
+        assert db.get_sessions(limit=1)[0]["email_sent"] == 1
+        assert len(server.messages) == 1
+        assert f"Session Summary #{session_id}" in server.messages[0]
+        assert "Total Bees Detected: 40" in server.messages[0]
+    finally:
+        db.close()
+        if server is not None:
+            server.shutdown()
+            server.server_close()
+
+def test_retry_delay_backs_off_exponentially_up_to_the_maximum(tmp_path):
+    db = BeeHealthDatabase(str(tmp_path / "bees.db"))
+    try:
+        worker = db.email_worker
+        assert [worker.retry_delay(n) for n in (1, 2, 3)] == [30.0, 60.0, 120.0]
+        assert worker.retry_delay(20) == 3600.0
+    finally:
+        db.close()
+
+def test_consecutive_emails_share_one_smtp_login(tmp_path):
+    server = start_server()
+    db = local_database(tmp_path, server.server_address[1])
+    try:
+        # Queue all emails before the worker picks them up
+        db.email_worker.start = lambda: None
+        close_sessions(db, 3)
+        assert db.email_worker.deliver_due() == 3
+
+        assert len(server.messages) == 3
+        assert server.connections == 1
+        assert db.email_service.smtp.connections == 1
+
+        # An idle connection is closed; the next email logs in again
+        db.email_service.smtp.close_if_idle(now=time.time() + 3600)
+        close_sessions(db, 1)
+        assert db.email_worker.deliver_due() == 1
+        assert server.connections == 2
+    finally:
+        db.close()
+        server.shutdown()
+        server.server_close()
+
+def test_digest_groups_sessions_closed_within_the_interval(tmp_path):
+    server = start_server()
+    db = local_database(tmp_path, server.server_address[1])
+    db.email_worker.digest_interval = 60
+    try:
+        db.email_worker.start = lambda: None
+        session_ids = close_sessions(db, 3)
+
+        # Nothing is due until the first session's interval has passed
+        assert db.email_worker.deliver_due() == 0
+        assert db.email_worker.deliver_due(now=time.time() + 61) == 3
+
+        assert len(server.messages) == 1
+        digest = server.messages[0]
+        assert "Digest of 3 sessions" in digest
+        for session_id in session_ids:
+            assert f"Session ID: {session_id}" in digest
+        assert all(row["status"] == "sent" for row in db.get_email_outbox())
+    finally:
+        db.close()
+        server.shutdown()
+        server.server_close()
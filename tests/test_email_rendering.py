@@ -0,0 +1,67 @@
+import datetime
+import time
+from email_service import EmailService, risk_level, format_duration
+
+def make_summary(session_id=1, rows=10, source="hive"):
+    start = datetime.datetime(2024, 6, 1, 12, 0, 0)
+    return {
+        'session': {
+            'session_id': session_id,
+            'source': source,
+            'start_time': start,
+            'end_time': start + datetime.timedelta(hours=1, seconds=5, microseconds=300),
+            'notes': None,
+        },
+        'metrics_count': rows,
+        'total_unique_bees': 200,
+        'total_unique_varroa': 24,
+        'overall_ratio': 0.12,
+        'latest_metrics': [
+            {
+                'timestamp': start + datetime.timedelta(seconds=i),
+                'unique_bee_count': i,
+                'unique_varroa_count': i // 10,
+                'infestation_ratio': 0.1,
+            }
+            for i in range(rows)
+        ],
+    }
+
+def test_html_and_text_share_risk_and_duration():
+    service = EmailService()
+    summary = make_summary(source="<cam0>")
+    html = service._format_email_content(summary)
+    text = service._format_plain_text_content(summary)
+
+    assert risk_level(0.12) == ("High", "#fd7e14")
+    assert format_duration(summary['session']) == "1:00:05"
+    for content in (html, text):
+        assert "High Risk" in content
+        assert "1:00:05" in content
+    # Values are escaped in HTML only
+    assert "&lt;cam0&gt;" in html
+    assert "Source: <cam0>" in text
+    assert html.count("<tr><td>") == 10
+
+def test_digest_renders_the_static_head_once():
+    html = EmailService()._format_email_content(make_summary(1), make_summary(2))
+    assert html.count("<style>") == 1
+    assert "Digest of 2 Sessions" in html
+    assert html.count("Session Overview") == 2
+
+def test_rendering_benchmark_with_thousands_of_rows():
+    """Micro-benchmark: render a digest-sized summary with 5000 recent rows"""
+    service = EmailService()
+    summary = make_summary(rows=5000)
+    service._format_email_content(summary)  # Template compilation is not part of the measurement
+
+    runs = 20
+    started = time.perf_counter()
+    for _ in range(runs):
+        html = service._format_email_content(summary)
+        text = service._format_plain_text_content(summary)
+    elapsed = (time.perf_counter() - started) / runs
+
+    print(f"\nRendered 5000-row summary (HTML {len(html) // 1024} KB + text) in {elapsed * 1000:.1f} ms")
+    assert html.count("<tr><td>") == 5000
+    assert elapsed < 1.0
@@ -0,0 +1,60 @@
+import numpy as np
+from frame_detections import DetectionBatch, BEE_CLASS, VARROA_CLASS, OTHER_CLASS
+
+def fill_batch(batch):
+    batch.reset()
+    batch.append(BEE_CLASS, 0.9, 0.1, 0.1, 0.2, 0.2, 5)
+    batch.append(BEE_CLASS, 0.2, 0.3, 0.3, 0.4, 0.4, 6)      # below threshold
+    batch.append(VARROA_CLASS, 0.6, 0.15, 0.15, 0.17, 0.17, 9)
+    batch.append(BEE_CLASS, 0.5, 0.5, 0.5, 0.75, 1.0, 0)     # not tracked yet
+    batch.append(OTHER_CLASS, 0.8, 0.0, 0.0, 0.1, 0.1, 3)
+
+def test_filter_counts_and_track_ids():
+    batch = DetectionBatch(capacity=8)
+    fill_batch(batch)
+    detections = batch.filter(0.3)
+
+    assert len(detections) == 4
+    assert detections.class_counts().tolist() == [1, 2, 1]
+    assert detections.track_ids_of(BEE_CLASS).tolist() == [5]
+    assert detections.track_ids_of(VARROA_CLASS).tolist() == [9]
+
+def test_pixel_boxes_are_scaled_to_frame_size():
+    batch = DetectionBatch(capacity=8)
+    fill_batch(batch)
+    boxes = batch.filter(0.3).pixel_boxes(640, 480)
+
+    assert boxes.dtype == np.int32
+    assert boxes[2].tolist() == [320, 240, 480, 480]
+
+def test_batch_is_reused_and_grows_past_capacity():
+    batch = DetectionBatch(capacity=2)
+    for i in range(5):
+        batch.append(BEE_CLASS, 0.9, 0.0, 0.0, 0.1, 0.1, i + 1)
+    assert batch.capacity >= 5
+    assert batch.filter(0.3).track_ids_of(BEE_CLASS).tolist() == [1, 2, 3, 4, 5]
+
+    # A new frame starts from an empty batch without reallocating
+    fill_batch(batch)
+    assert len(batch.filter(0.0)) == 5
+
+def test_varroa_is_associated_with_the_containing_bee():
+    batch = DetectionBatch(capacity=8)
+    batch.append(BEE_CLASS, 0.9, 0.10, 0.10, 0.30, 0.30, 1)
+    batch.append(BEE_CLASS, 0.9, 0.50, 0.50, 0.70, 0.70, 2)
+    batch.append(BEE_CLASS, 0.9, 0.80, 0.80, 0.90, 0.90, 3)
+    batch.append(BEE_CLASS, 0.9, 0.00, 0.00, 0.05, 0.05, 0)       # untracked bee
+    batch.append(VARROA_CLASS, 0.8, 0.12, 0.12, 0.14, 0.14, 10)    # on bee 1
+    batch.append(VARROA_CLASS, 0.8, 0.15, 0.15, 0.17, 0.17, 11)    # also on bee 1
+    batch.append(VARROA_CLASS, 0.8, 0.68, 0.68, 0.72, 0.72, 12)    # a quarter inside bee 2
+    batch.append(VARROA_CLASS, 0.8, 0.01, 0.01, 0.02, 0.02, 13)    # only on the untracked bee
+
+    infested = batch.filter(0.3).infested_bee_track_ids(min_containment=0.5)
+    assert infested.tolist() == [1]
+
+    assert batch.filter(0.3).infested_bee_track_ids(min_containment=0.2).tolist() == [1, 2]
+
+def test_no_association_without_varroa():
+    batch = DetectionBatch(capacity=4)
+    batch.append(BEE_CLASS, 0.9, 0.1, 0.1, 0.3, 0.3, 1)
+    assert batch.filter(0.3).infested_bee_track_ids().size == 0
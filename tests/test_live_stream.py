@@ -0,0 +1,72 @@
+import threading
+import numpy as np
+from shared_buffers import FrameSlot
+from live_stream import PreviewStream
+
+def test_frame_slot_returns_only_new_frames():
+    slot = FrameSlot.create(4, 2)
+    try:
+        assert slot.read() == (0, None)
+        frame = np.arange(4 * 2 * 3, dtype=np.uint8).reshape(2, 4, 3)
+        seq = slot.write(frame)
+
+        reader = FrameSlot.attach(slot.name)
+        try:
+            new_seq, data = reader.read()
+            assert new_seq == seq
+            assert data == frame.tobytes()
+            # Same frame is not returned twice
+            assert reader.read(new_seq) == (new_seq, None)
+        finally:
+            reader.close()
+    finally:
+        slot.close()
+
+def test_preview_is_encoded_once_for_all_clients():
+    """Every client receives the same buffer and encoding runs once per frame"""
+    calls = []
+
+    def encoder(data, width, height, channels):
+        calls.append(data)
+        return b"encoded-" + bytes([data[0]])
+
+    slot = FrameSlot.create(2, 2)
+    stream = PreviewStream(fps=50, encoder=encoder)
+    received = {0: [], 1: []}
+
+    def client(index):
+        for frame in stream.frames(idle_timeout=1.0):
+            received[index].append(frame)
+            break
+
+    try:
+        clients = [threading.Thread(target=client, args=(i,)) for i in received]
+        for thread in clients:
+            thread.start()
+        stream.start(slot)
+        slot.write(np.full((2, 2, 3), 7, dtype=np.uint8))
+        for thread in clients:
+            thread.join(timeout=5.0)
+    finally:
+        stream.stop()
+        slot.close()
+
+    assert received == {0: [b"encoded-\x07"], 1: [b"encoded-\x07"]}
+    assert len(calls) == 1
+
+def test_event_broadcaster_serializes_once_and_replays_missed_events():
+    from live_stream import EventBroadcaster
+    broadcaster = EventBroadcaster(history=2, heartbeat=0.05)
+
+    live = broadcaster.subscribe()
+    first_id = broadcaster.publish("stats", {"current_bees": 3})
+    message = next(live)
+    assert message == f'id: {first_id}\nevent: stats\ndata: {{"current_bees":3}}\n\n'
+
+    # Nothing new: subscribers receive a heartbeat comment
+    assert next(live) == ": heartbeat\n\n"
+
+    # A reconnecting client resumes after its last event id
+    broadcaster.publish("time_series", {"bee_count": 4})
+    resumed = broadcaster.subscribe(last_event_id=first_id)
+    assert next(resumed).startswith(f"id: {first_id + 1}\nevent: time_series\n")
@@ -0,0 +1,25 @@
+import pytest
+from multiplexed_pipeline import callback_name, multiplexed_pipeline_string
+
+def test_every_stream_gets_a_route_and_its_own_branch():
+    pipeline = multiplexed_pipeline_string(
+        ["v4l2src device=/dev/video0", "filesrc location=hive.mp4 ! decodebin"],
+        "hailonet batch-size=2",
+        "hailotracker name=hailo_tracker",
+        [f"identity name={callback_name(0)} ! fakesink", f"identity name={callback_name(1)} ! fakesink"],
+    )
+    # One inference and tracker stage shared by both inputs
+    assert pipeline.count("hailonet") == 1
+    assert pipeline.count("hailotracker") == 1
+    assert pipeline.startswith("hailoroundrobin mode=1 name=robin ! hailonet batch-size=2 ! hailotracker")
+    assert 'src_0::input-streams="<sink_0>" src_1::input-streams="<sink_1>"' in pipeline
+    assert "v4l2src device=/dev/video0 ! queue name=mux_queue_0" in pipeline
+    assert "! robin.sink_1" in pipeline
+    assert "router.src_0 ! identity name=identity_callback ! fakesink" in pipeline
+    assert "router.src_1 ! identity name=identity_callback_1 ! fakesink" in pipeline
+
+def test_sources_and_branches_must_match():
+    with pytest.raises(ValueError):
+        multiplexed_pipeline_string(["a", "b"], "hailonet", "hailotracker", ["fakesink"])
+    with pytest.raises(ValueError):
+        multiplexed_pipeline_string([], "hailonet", "hailotracker", [])
@@ -0,0 +1,58 @@
+import os
+import signal
+import subprocess
+import time
+from process_supervisor import DetectorSupervisor, process_start_time, stop_process_group
+
+def group_alive(pgid):
+    try:
+        os.killpg(pgid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+
+def test_stop_returns_as_soon_as_the_group_exits(tmp_path):
+    supervisor = DetectorSupervisor(str(tmp_path))
+    # A shell with a background child, like a detector with GStreamer helpers
+    process = supervisor.launch("sleep 30 & sleep 30")
+    assert os.path.exists(supervisor.pidfile(process.pid))
+
+    started = time.monotonic()
+    assert supervisor.stop(process) == signal.SIGINT
+    assert time.monotonic() - started < 1.0
+    assert not group_alive(process.pid)
+    assert not os.path.exists(supervisor.pidfile(process.pid))
+
+def test_stop_escalates_when_sigint_is_ignored(tmp_path):
+    supervisor = DetectorSupervisor(str(tmp_path))
+    process = supervisor.launch("trap '' INT; sleep 30")
+    time.sleep(0.2)  # Let the shell install the trap
+    assert stop_process_group(process, timeouts=(0.2, 0.2, 1.0)) == signal.SIGTERM
+    assert process.poll() is not None
+
+def test_stop_of_an_exited_process_reports_nothing(tmp_path):
+    supervisor = DetectorSupervisor(str(tmp_path))
+    process = supervisor.launch("true")
+    process.wait()
+    assert supervisor.stop(process) is None
+
+def test_recover_only_acts_on_stale_pidfiles(tmp_path):
+    supervisor = DetectorSupervisor(str(tmp_path))
+    assert supervisor.recover() is None
+
+    # An orphan of a previous run, recorded in the pidfile it left behind
+    orphan = subprocess.Popen(["sleep", "30"], start_new_session=True)
+    with open(supervisor.pidfile(orphan.pid), "w") as f:
+        f.write(f"{orphan.pid} {process_start_time(orphan.pid)}\n")
+    # A pidfile whose PID was reused by an unrelated process is left alone
+    unrelated = subprocess.Popen(["sleep", "30"], start_new_session=True)
+    with open(supervisor.pidfile(unrelated.pid), "w") as f:
+        f.write(f"{unrelated.pid} 1\n")
+    try:
+        assert supervisor.recover() >= 1
+        assert orphan.wait(timeout=1.0) == -signal.SIGKILL
+        assert unrelated.poll() is None
+        assert supervisor.stale_pidfiles() == []
+    finally:
+        unrelated.kill()
+        unrelated.wait()
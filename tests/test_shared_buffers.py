@@ -0,0 +1,77 @@
+import pytest
+from telemetry import FrameRecord
+from shared_buffers import StatsRing, ControlBlock, STATS_SHM_ENV, VISUALIZATION_PREVIEW, VISUALIZATION_FULL
+
+def make_record(frame):
+    return FrameRecord(frame, 1700000000.0 + frame, 2, 1, frame * 2, frame, frame, frame // 2)
+
+@pytest.fixture
+def ring():
+    ring = StatsRing.create(capacity=8)
+    yield ring
+    ring.close()
+
+def test_latest_is_empty_before_publishing(ring):
+    assert ring.latest() is None
+    assert ring.read_since(0) == ([], 0, 0)
+
+def test_reader_attached_by_name_sees_published_records(ring):
+    """A second handle (as used by the other process) reads what the writer published"""
+    reader = StatsRing.attach(ring.name)
+    try:
+        ring.publish(make_record(1))
+        ring.publish(make_record(2))
+
+        assert reader.latest() == make_record(2)
+        records, cursor, missed = reader.read_since(0)
+        assert records == [make_record(1), make_record(2)]
+        assert cursor == 2
+        assert missed == 0
+
+        # Nothing new since the cursor
+        assert reader.read_since(cursor) == ([], 2, 0)
+    finally:
+        reader.close()
+
+def test_overrun_reports_missed_records(ring):
+    """Records overwritten before being read are counted as missed"""
+    for frame in range(1, 21):
+        ring.publish(make_record(frame))
+
+    records, cursor, missed = ring.read_since(0)
+    assert [r.frame for r in records] == list(range(13, 21))
+    assert cursor == 20
+    assert missed == 12
+    assert ring.latest() == make_record(20)
+
+def test_overwritten_slot_is_not_returned(ring):
+    """A slot holding a newer sequence number is never mistaken for an older record"""
+    for frame in range(1, 10):
+        ring.publish(make_record(frame))
+    # Sequence 1 shares its slot with sequence 9
+    assert ring._read_slot(1) is None
+    assert ring._read_slot(9) == make_record(9)
+
+def test_control_block_shares_visualization_settings():
+    control = ControlBlock.create(VISUALIZATION_PREVIEW, 5)
+    reader = ControlBlock.attach(control.name)
+    try:
+        assert reader.visualization() == (VISUALIZATION_PREVIEW, 5)
+        control.set_visualization(VISUALIZATION_FULL, 0)
+        # Interval is clamped to at least every frame
+        assert reader.visualization() == (VISUALIZATION_FULL, 1)
+    finally:
+        reader.close()
+        control.close()
+
+def test_inputs_of_a_multiplexed_detector_attach_their_own_ring(ring, monkeypatch):
+    """Stream 1 of a multiplexed detector reads the suffixed variable, not the plain one"""
+    monkeypatch.delenv(STATS_SHM_ENV, raising=False)
+    monkeypatch.setenv(STATS_SHM_ENV + "_1", ring.name)
+    assert StatsRing.from_env() is None
+    reader = StatsRing.from_env(stream_index=1)
+    try:
+        ring.publish(make_record(3))
+        assert reader.latest() == make_record(3)
+    finally:
+        reader.close()
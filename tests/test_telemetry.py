@@ -0,0 +1,57 @@
+import os
+from telemetry import (
+    FrameRecord,
+    TelemetryDecoder,
+    TelemetryWriter,
+    encode_frame_record,
+    read_records,
+    FRAME_RECORD,
+)
+
+def make_record(frame):
+    return FrameRecord(frame, 1700000000.5, 3, 1, 30, 4, 12, 2)
+
+def test_decoder_reassembles_chunked_records():
+    """Records split across reads are decoded once complete"""
+    data = encode_frame_record(make_record(1)) + encode_frame_record(make_record(2))
+    decoder = TelemetryDecoder()
+
+    assert decoder.feed(data[:10]) == []
+    records = decoder.feed(data[10:])
+    assert records == [make_record(1), make_record(2)]
+
+def test_decoder_resynchronises_after_garbage():
+    """Stray bytes in the stream are skipped without losing later records"""
+    decoder = TelemetryDecoder()
+    records = decoder.feed(b"\x00\x01\x02" + encode_frame_record(make_record(7)))
+    assert records == [make_record(7)]
+    assert decoder.resyncs == 3
+
+def test_writer_round_trip_over_pipe():
+    """Records written to a pipe are read back by read_records"""
+    read_fd, write_fd = os.pipe()
+    writer = TelemetryWriter(write_fd)
+    try:
+        assert writer.write(make_record(10))
+        records = read_records(read_fd, TelemetryDecoder(), timeout=1.0)
+        assert records == [make_record(10)]
+
+        writer.close()
+        assert read_records(read_fd, TelemetryDecoder(), timeout=1.0) is None
+    finally:
+        writer.close()
+        os.close(read_fd)
+
+def test_writer_drops_records_instead_of_blocking():
+    """A reader that is not keeping up never blocks the writer"""
+    read_fd, write_fd = os.pipe()
+    writer = TelemetryWriter(write_fd)
+    try:
+        # Default pipe capacity is far below this many records
+        for frame in range(1, 100000 // FRAME_RECORD.size * 20):
+            if not writer.write(make_record(frame)):
+                break
+        assert writer.dropped == 1
+    finally:
+        writer.close()
+        os.close(read_fd)
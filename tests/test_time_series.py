@@ -0,0 +1,43 @@
+from time_series import TimeSeriesBuffer
+
+def fill(series, count, start=1):
+    for i in range(start, start + count):
+        series.append(1700000000.0 + i, i, i // 2, i / 100)
+
+def test_since_returns_only_new_points():
+    series = TimeSeriesBuffer(capacity=8)
+    fill(series, 3)
+
+    data = series.since()
+    assert data["seq"] == 3
+    assert data["bee_counts"] == [1, 2, 3]
+    assert data["reset"] is True
+
+    fill(series, 2, start=4)
+    data = series.since(3)
+    assert data["seq"] == 5
+    assert data["bee_counts"] == [4, 5]
+    assert data["varroa_counts"] == [2, 2]
+    assert data["reset"] is False
+
+def test_overwritten_points_request_a_reset():
+    series = TimeSeriesBuffer(capacity=4)
+    fill(series, 10)
+
+    assert len(series) == 4
+    data = series.since(2)
+    assert data["bee_counts"] == [7, 8, 9, 10]
+    assert data["reset"] is True
+
+    # Limit applies to the newest points
+    assert series.since(limit=2)["bee_counts"] == [9, 10]
+
+def test_clear_keeps_sequence_numbers_increasing():
+    series = TimeSeriesBuffer(capacity=4)
+    fill(series, 3)
+    series.clear()
+
+    assert len(series) == 0
+    assert series.since(3)["bee_counts"] == []
+    assert series.append(0.0, 1, 0, 0.0) == 4
+    assert series.since(3)["bee_counts"] == [1]
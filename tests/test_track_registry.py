@@ -0,0 +1,42 @@
+from track_registry import TrackRegistry
+
+def test_counts_each_track_once():
+    registry = TrackRegistry()
+    assert registry.add([1, 2, 3], now=100.0) == 3
+    assert registry.add([2, 3, 4], now=100.5) == 1
+    assert registry.add([], now=101.0) == 0
+    assert registry.total == 4
+    assert len(registry) == 4
+
+def test_memory_stays_bounded_for_long_runs():
+    """Ids far beyond the window are counted without growing the bitmap"""
+    registry = TrackRegistry(id_window=16)
+    for track_id in range(1, 1001):
+        registry.add([track_id], now=float(track_id))
+    assert registry.total == 1000
+    assert registry.seen.size == 16
+
+    # Ids that fell out of the window were already counted
+    assert registry.add([5, 990], now=1001.0) == 0
+    assert registry.total == 1000
+
+def test_window_advance_clears_expired_slots():
+    registry = TrackRegistry(id_window=8)
+    registry.add([6, 7, 8], now=0.0)
+    # Advancing the base clears slots so they can be reused by newer ids
+    assert registry.add([13, 14], now=0.0) == 2
+    assert registry.add([7, 8, 13, 14], now=0.0) == 0
+    assert registry.add([15], now=0.0) == 1
+    assert registry.total == 6
+
+def test_recent_counts_expire():
+    registry = TrackRegistry(history_seconds=3600)
+    registry.add([1, 2], now=1000.0)
+    registry.add([3], now=1030.0)
+    registry.add([4, 5, 6], now=1100.0)
+
+    assert registry.count_since(60, now=1100.0) == 3
+    assert registry.count_since(3600, now=1100.0) == 6
+    assert registry.count_since(60, now=1200.0) == 0
+    # Buckets older than the history are recycled
+    assert registry.count_since(3600, now=5000.0) == 0
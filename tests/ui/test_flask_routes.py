@@ -1,5 +1,6 @@
 import pytest
 import json
+import datetime
 
 def test_index_route(client):
     """Test the main dashboard page loads correctly"""
@@ -36,10 +37,8 @@ def test_get_time_series_route(client, reset_stats):
     """Test the /get_time_series endpoint returns correct data"""
     # Set some test data
     from app import time_series_data
-    time_series_data["timestamps"].extend(["12:01", "12:02"])
-    time_series_data["bee_counts"].extend([5, 8])
-    time_series_data["varroa_counts"].extend([1, 2])
-    time_series_data["infestation_ratio"].extend([0.2, 0.25])
+    first = time_series_data.append(datetime.datetime(2024, 6, 1, 12, 1).timestamp(), 5, 1, 0.2)
+    time_series_data.append(datetime.datetime(2024, 6, 1, 12, 2).timestamp(), 8, 2, 0.25)
     
     # Test the endpoint
     response = client.get('/get_time_series')
@@ -48,10 +47,22 @@ def test_get_time_series_route(client, reset_stats):
     # Verify response data
     data = json.loads(response.data)
     assert len(data["timestamps"]) == 2
-    assert data["timestamps"] == ["12:01", "12:02"]
+    assert data["timestamps"] == ["12:01:00", "12:02:00"]
     assert data["bee_counts"] == [5, 8]
     assert data["varroa_counts"] == [1, 2]
     assert data["infestation_ratio"] == [0.2, 0.25]
+    assert data["seq"] == first + 1
+    
+    # Only points after the cursor are returned
+    response = client.get(f'/get_time_series?since={first}')
+    data = json.loads(response.data)
+    assert data["bee_counts"] == [8]
+    assert data["reset"] is False
+    
+    response = client.get(f'/get_time_series?since={first + 1}')
+    assert json.loads(response.data)["timestamps"] == []
+    
+    assert client.get('/get_time_series?since=-1').status_code == 400
 
 def test_start_stop_detection(client):
     """Test the start and stop detection endpoints"""
@@ -70,3 +81,138 @@ def test_start_stop_detection(client):
         assert response.status_code == 200
         data = json.loads(response.data)
         assert data["status"] == "stopped" 
+
+def test_visualization_mode_route(client):
+    """Test the visualization mode can be read and changed"""
+    from app import visualization_settings
+    original = dict(visualization_settings)
+    try:
+        response = client.post('/api/visualization', json={"mode": "preview", "preview_interval": 5})
+        assert response.status_code == 200
+        data = json.loads(response.data)
+        assert data == {"mode": "preview", "preview_interval": 5}
+        
+        response = client.get('/api/visualization')
+        assert json.loads(response.data)["mode"] == "preview"
+        
+        # Invalid settings are rejected and leave the current ones untouched
+        response = client.post('/api/visualization', json={"mode": "hologram"})
+        assert response.status_code == 400
+        response = client.post('/api/visualization', json={"preview_interval": 0})
+        assert response.status_code == 400
+        assert json.loads(client.get('/api/visualization').data)["preview_interval"] == 5
+    finally:
+        visualization_settings.update(original)
+
+def test_video_feed_requires_opencv(client):
+    """Test /video_feed reports when previews cannot be encoded"""
+    from unittest.mock import patch
+    
+    with patch('app.preview_available', return_value=False):
+        response = client.get('/video_feed')
+        assert response.status_code == 503
+
+def test_stream_route_sends_snapshot_then_deltas(client, reset_stats):
+    """Test /stream pushes a full snapshot followed by only the changed fields"""
+    import app as app_module
+    
+    app_module.detection_stats["current_bees"] = 4
+    response = client.get('/stream', buffered=False)
+    assert response.status_code == 200
+    assert response.mimetype == "text/event-stream"
+    
+    chunks = iter(response.response)
+    snapshot = next(chunks).decode()
+    assert snapshot.startswith("event: snapshot\n")
+    payload = json.loads(snapshot.split("data: ", 1)[1])
+    assert payload["stats"]["current_bees"] == 4
+    assert "last_update" not in payload["stats"]
+    
+    app_module.publish_stats_delta(force=True)
+    app_module.detection_stats["current_varroa"] = 1
+    app_module.publish_stats_delta(force=True)
+    
+    messages = next(chunks).decode()
+    deltas = [json.loads(line[len("data: "):]) for line in messages.splitlines() if line.startswith("data: ")]
+    assert deltas[-1] == {"current_varroa": 1}
+    response.close()
+
+def test_metrics_history_route(client):
+    """A time range returns downsampled history; bad parameters are rejected"""
+    response = client.get('/api/metrics?start=2001-01-01T00:00:00&end=2001-01-02T00:00:00&max_points=24')
+    assert response.status_code == 200
+    data = json.loads(response.data)
+    assert data["resolution"] == "hour"
+    assert data["points"] == []
+    
+    assert client.get('/api/metrics?start=yesterday').status_code == 400
+    assert client.get('/api/metrics?start=2001-01-02T00:00:00&end=2001-01-01T00:00:00').status_code == 400
+    assert client.get('/api/metrics?start=2001-01-01T00:00:00&max_points=0').status_code == 400
+
+def test_session_summary_route_unknown_session(client):
+    """Unknown sessions return 404"""
+    response = client.get('/api/sessions/999999999/summary')
+    assert response.status_code == 404
+    assert json.loads(response.data)["status"] == "error"
+
+def test_source_routes(client, reset_stats):
+    """Per-source statistics, the source listing and the aggregate across sources"""
+    from app import detection_stats, default_source
+    detection_stats.update({"unique_bees": 20, "unique_varroa": 2, "fps": 9.5})
+    
+    data = json.loads(client.get('/api/sources').data)
+    assert [source["id"] for source in data] == [default_source.source_id]
+    assert data[0]["active"] is False
+    
+    response = client.get(f'/api/sources/{default_source.source_id}/stats')
+    assert json.loads(response.data)["unique_bees"] == 20
+    
+    data = json.loads(client.get('/api/sources/aggregate').data)
+    assert data["aggregate"]["unique_bees"] == 20
+    assert data["aggregate"]["infestation_ratio"] == 0.1
+    assert data["sources"][default_source.source_id]["fps"] == 9.5
+    
+    assert client.get('/api/sources/no-such-camera/stats').status_code == 404
+    assert client.get('/api/sources/no-such-camera/time_series').status_code == 404
+    assert client.post('/api/sources/no-such-camera/start').status_code == 404
+    assert client.get('/stream?source=no-such-camera').status_code == 404
+
+def test_multiplexed_command_adds_the_other_inputs():
+    """A multiplexed detector is the first source's command with the others as extra inputs"""
+    from app import multiplexed_command
+    from detection_sources import DetectionSource
+    sources = [
+        DetectionSource("video0", "python detection.py -i /dev/video0 --hef model.hef", 10),
+        DetectionSource("video2", "python detection.py -i /dev/video2 --hef model.hef", 10),
+        DetectionSource("replay", "python detection.py -i 'recordings/hive 3.mp4'", 10),
+    ]
+    assert multiplexed_command(sources) == (
+        "python detection.py -i /dev/video0 --hef model.hef "
+        "--extra-input /dev/video2 --extra-input 'recordings/hive 3.mp4'"
+    )
+
+def test_source_start_stop_round_trip(client, monkeypatch, tmp_path):
+    """A detector process is started and stopped again well within a second"""
+    import time
+    import app as app_module
+    from detection_sources import DetectionSource
+    
+    source = DetectionSource("roundtrip", "sleep 30", 10, app_module.new_preview_stream())
+    monkeypatch.setitem(app_module.detection_sources, "roundtrip", source)
+    monkeypatch.setattr(app_module, "DETECTOR_WORKDIR", str(tmp_path))
+    monkeypatch.setattr(app_module.supervisor, "pid_dir", str(tmp_path / "run"))
+    
+    started = time.monotonic()
+    response = client.post('/api/sources/roundtrip/start')
+    assert json.loads(response.data)["status"] == "started"
+    while source.process is None and time.monotonic() - started < 1.0:
+        time.sleep(0.01)
+    process = source.process
+    assert process is not None and process.poll() is None
+    
+    response = client.post('/api/sources/roundtrip/stop')
+    assert json.loads(response.data)["status"] == "stopped"
+    assert time.monotonic() - started < 1.0
+    assert process.poll() is not None
+    assert not source.active
+    assert app_module.supervisor.stale_pidfiles() == []
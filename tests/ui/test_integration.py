@@ -29,10 +29,7 @@ def test_detection_workflow_integration(client, reset_stats):
             "infestation_risk_level": "High"
         })
         
-        time_series_data["timestamps"].append("12:00:00")
-        time_series_data["bee_counts"].append(15)
-        time_series_data["varroa_counts"].append(3)
-        time_series_data["infestation_ratio"].append(0.2)
+        time_series_data.append(time.time(), 15, 3, 0.2)
         
         # 3. Verify stats are updated
         stats_response = client.get('/get_stats')
@@ -0,0 +1,75 @@
+"""
+In-memory time series for the dashboard charts.
+
+Points live in preallocated arrays used as a ring and are addressed by a
+monotonically increasing sequence number, so clients can ask for only the
+points they have not seen yet.
+"""
+import threading
+import time
+from array import array
+
+class TimeSeriesBuffer:
+    """Fixed-capacity ring of (timestamp, bee count, varroa count, ratio) points"""
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.times = array("d", bytes(8 * capacity))            # Epoch seconds
+        self.bee_counts = array("q", bytes(8 * capacity))
+        self.varroa_counts = array("q", bytes(8 * capacity))
+        self.ratios = array("d", bytes(8 * capacity))
+        # Sequence number of the newest point and of the oldest point still held
+        self.last_seq = 0
+        self.first_seq = 1
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return self.last_seq - self.first_seq + 1
+
+    def append(self, timestamp, bee_count, varroa_count, ratio):
+        """Store a point, overwriting the oldest one when full; returns its sequence number"""
+        with self.lock:
+            seq = self.last_seq + 1
+            i = seq % self.capacity
+            self.times[i] = timestamp
+            self.bee_counts[i] = bee_count
+            self.varroa_counts[i] = varroa_count
+            self.ratios[i] = ratio
+            self.last_seq = seq
+            if seq - self.first_seq >= self.capacity:
+                self.first_seq = seq - self.capacity + 1
+            return seq
+
+    def clear(self):
+        """Drop all points; sequence numbers keep increasing so old cursors stay valid"""
+        with self.lock:
+            self.first_seq = self.last_seq + 1
+
+    def since(self, seq=None, limit=None):
+        """
+        Return the points after sequence number `seq` (the newest `limit` points
+        if `seq` is None) in the column layout used by the charts. `reset` is
+        true when points the client has not seen were already dropped, in which
+        case the client should replace its data instead of appending.
+        """
+        with self.lock:
+            first = self.first_seq
+            if seq is not None:
+                first = max(first, seq + 1)
+            if limit is not None:
+                first = max(first, self.last_seq - limit + 1)
+            indices = [s % self.capacity for s in range(first, self.last_seq + 1)]
+            times = [self.times[i] for i in indices]
+            result = {
+                "seq": self.last_seq,
+                "reset": seq is None or first > seq + 1,
+                "bee_counts": [self.bee_counts[i] for i in indices],
+                "varroa_counts": [self.varroa_counts[i] for i in indices],
+                "infestation_ratio": [self.ratios[i] for i in indices],
+            }
+        result["timestamps"] = [format_timestamp(t) for t in times]
+        return result
+
+def format_timestamp(timestamp):
+    """Chart label for an epoch timestamp"""
+    return time.strftime("%H:%M:%S", time.localtime(timestamp))
@@ -0,0 +1,89 @@
+"""
+Constant-memory accounting of unique tracker ids.
+
+hailotracker hands out monotonically increasing integer ids, so instead of
+keeping every id ever seen in a set, TrackRegistry only remembers which ids
+inside a sliding window above the lowest live id have been seen. Ids that
+fall below the window were counted when they first appeared. First sightings
+are also accumulated into per-second buckets, which gives unique counts for
+the last minute/hour without storing individual ids.
+"""
+import time
+import numpy as np
+
+# Width of the id window; far larger than the number of tracks alive at once
+DEFAULT_ID_WINDOW = 1 << 16
+# Resolution and length of the first-sighting history
+DEFAULT_BUCKET_SECONDS = 1
+DEFAULT_HISTORY_SECONDS = 3600
+
+class TrackRegistry:
+    """Counts unique track ids in total and per recent time window"""
+
+    def __init__(self, id_window=DEFAULT_ID_WINDOW, bucket_seconds=DEFAULT_BUCKET_SECONDS,
+                 history_seconds=DEFAULT_HISTORY_SECONDS):
+        self.id_window = id_window
+        # Circular bitmap: slot id % id_window tells whether id was seen
+        self.seen = np.zeros(id_window, dtype=bool)
+        # Lowest id still tracked by the bitmap; smaller ids are ignored
+        self.base = 1
+        self.total = 0
+
+        self.bucket_seconds = bucket_seconds
+        num_buckets = max(1, history_seconds // bucket_seconds)
+        # Absolute bucket index held by each slot, and first sightings in it
+        self.bucket_index = np.full(num_buckets, -1, dtype=np.int64)
+        self.bucket_counts = np.zeros(num_buckets, dtype=np.int64)
+
+    def __len__(self):
+        return self.total
+
+    def _advance(self, new_base):
+        """Move the window so it starts at new_base, forgetting older ids"""
+        shift = new_base - self.base
+        if shift >= self.id_window:
+            self.seen[:] = False
+        else:
+            start = self.base % self.id_window
+            end = start + shift
+            self.seen[start:min(end, self.id_window)] = False
+            if end > self.id_window:
+                self.seen[:end - self.id_window] = False
+        self.base = new_base
+
+    def add(self, track_ids, now=None):
+        """Record the track ids seen in a frame; returns how many were new"""
+        ids = np.asarray(track_ids, dtype=np.int64)
+        ids = ids[ids >= self.base]
+        if ids.size == 0:
+            return 0
+
+        top = int(ids.max())
+        if top >= self.base + self.id_window:
+            self._advance(top - self.id_window + 1)
+            ids = ids[ids >= self.base]
+
+        slots = np.unique(ids) % self.id_window
+        new_slots = slots[~self.seen[slots]]
+        new_count = len(new_slots)
+        if new_count:
+            self.seen[new_slots] = True
+            self.total += new_count
+            self._record_first_sightings(new_count, time.time() if now is None else now)
+        return new_count
+
+    def _record_first_sightings(self, count, now):
+        bucket = int(now // self.bucket_seconds)
+        slot = bucket % len(self.bucket_index)
+        if self.bucket_index[slot] != bucket:
+            # Slot still holds an expired bucket, recycle it
+            self.bucket_index[slot] = bucket
+            self.bucket_counts[slot] = 0
+        self.bucket_counts[slot] += count
+
+    def count_since(self, seconds, now=None):
+        """Number of unique ids first seen within the last `seconds`"""
+        current = int((time.time() if now is None else now) // self.bucket_seconds)
+        oldest = current - max(1, int(seconds // self.bucket_seconds)) + 1
+        in_window = (self.bucket_index >= oldest) & (self.bucket_index <= current)
+        return int(self.bucket_counts[in_window].sum())